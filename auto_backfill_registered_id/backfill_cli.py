@@ -0,0 +1,356 @@
+# 命令列版本: 路徑由參數指定 (沒有指定的由 path.toml 讀取)
+#
+# python backfill_cli.py -p 交貨清單.xlsx -c (OK)編目箱單.xlsx -o 回填OK
+# python backfill_cli.py --config path.toml --engine loop --log-mode jsonl
+# python backfill_cli.py -c "D:/編目箱單/*.xlsx"      # 資料夾或 glob : 批次處理
+# python backfill_cli.py -c D:/編目箱單 --watch        # 常駐, 新的 '編目箱單' 放進資料夾就回填
+# python backfill_cli.py -p D:/交貨清單 -c (OK)編目箱單.xlsx  # 資料夾 : 分配到多個 '交貨清單'
+#
+# pandas, openpyxl, rich 等在參數檢查完成後才 import, `--help` 與路徑錯誤會立刻回應
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from modules.check import check_dir, check_xlsx
+# -----------------------------------------------------------------------------/
+
+default_config: Path = Path(__file__).parent.joinpath("path.toml")
+
+
+def build_parser():
+    """
+    """
+    parser = argparse.ArgumentParser(
+        description="自動回填編目 '登錄號' 到 '交貨清單'",
+        epilog="沒有指定的路徑由 --config (預設為 path.toml) 讀取")
+    parser.add_argument("--config", type=Path, default=None,
+                        help=f"設定檔 (預設 : '{default_config.name}', 不存在時略過)")
+    parser.add_argument("-p", "--purchasing", type=Path,
+                        help="'交貨清單' (xlsx), 資料夾時依 '採購序號' + ISBN 分配到多個 '交貨清單'")
+    parser.add_argument("-c", "--catalog",
+                        help="'編目箱單' (xlsx), 資料夾或 glob 時為批次處理")
+    parser.add_argument("-o", "--out", type=Path, help="'回填OK' 資料夾")
+    
+    group = parser.add_argument_group("處理")
+    group.add_argument("--engine", default="bulk", help="回填引擎 : bulk | loop")
+    group.add_argument("--no-validate", dest="validate", action="store_false",
+                       help="回填前不檢查 '採購序號'")
+    group.add_argument("--log-mode", default="rich", help="處理紀錄 : rich | jsonl")
+    group.add_argument("--writer", default="stream",
+                       help="輸出 Excel 的方式 : stream | pandas | patch (只修改原本的 '交貨清單') "
+                            "| diff (只輸出修改清單)")
+    group.add_argument("--columnar", nargs="+", default=[], metavar="FORMAT",
+                       help="回填結果與沒有處理到的資料另外存成 csv | parquet | jsonl "
+                            "(可以多種, 合計存在 '(SR)回填摘要' JSON)")
+    group.add_argument("--no-suggest", dest="suggest", action="store_false",
+                       help="不產生 '(SR)比對候選'")
+    group.add_argument("--backend", default="auto",
+                       help="讀取 Excel 的方式 : openpyxl | openpyxl-stream | calamine | auto")
+    group.add_argument("--no-cache", dest="use_cache", action="store_false",
+                       help="不使用解析結果快取")
+    group.add_argument("--cache-dir", type=Path, default=None,
+                       help="快取資料夾 (預設為 '回填OK' 資料夾下的 .cache)")
+    group.add_argument("--cache-max-bytes", type=int, default=1024**3)
+    group.add_argument("--compact", action="store_true",
+                       help="讀取後轉成精簡的 dtype (category, Arrow 字串, 較小的整數) 以節省記憶體")
+    group.add_argument("--max-workers", type=int, default=os.cpu_count(),
+                       help="批次處理時同時處理的檔案數")
+    group.add_argument("--ingest-workers", type=int, default=0,
+                       help="單一檔案時, '交貨清單' 與 '編目箱單' 的工作表同時在幾個 process 解析 "
+                            "(0 : 依序讀取)")
+    
+    group.add_argument("--registry", type=Path, default=None,
+                       help="'登錄號' 資料庫 (SQLite, 預設為 '回填OK' 資料夾下的 登錄號.sqlite)")
+    group.add_argument("--no-registry", dest="use_registry", action="store_false",
+                       help="不檢查 / 不記錄 '登錄號' (重複, 已登錄, 缺號)")
+    group.add_argument("--index-dir", type=Path, default=None,
+                       help="多個 '交貨清單' 的索引資料夾 (預設為快取資料夾下的 route_index)")
+    
+    group = parser.add_argument_group("常駐模式")
+    group.add_argument("--watch", action="store_true",
+                       help="監看 -c 資料夾, 新增或修改的 '編目箱單' 自動回填 ('交貨清單' 保留在記憶體)")
+    group.add_argument("--poll-interval", type=float, default=5.0, help="檢查間隔 (秒)")
+    group.add_argument("--queue-size", type=int, default=8, help="工作佇列上限")
+    
+    group = parser.add_argument_group("效能分析")
+    group.add_argument("--profile", action="store_true",
+                       help="記錄每個步驟的時間 / 記憶體, 加到 '(SR)處理紀錄'")
+    group.add_argument("--no-profile-memory", dest="profile_memory", action="store_false",
+                       help="不使用 tracemalloc (時間較準確)")
+    group.add_argument("--profile-backfill", action="store_true",
+                       help="回填另外以 cProfile 記錄, 存成 '(SR)效能分析….prof'")
+    
+    return parser
+    # -------------------------------------------------------------------------/
+
+
+def resolve_paths(args: argparse.Namespace):
+    """
+    沒有指定的路徑由設定檔補上, 並檢查路徑 (只使用 pathlib, 不需要 import pandas)
+    
+    回傳 (purchasing_wb, catalog, new_wb_dir, cache_dir, registry_path, is_batch),
+    `--no-registry` 時 registry_path 為 None
+    """
+    config = {}
+    config_path = args.config
+    if (config_path is None) and default_config.exists():
+        config_path = default_config
+    if config_path is not None:
+        if not config_path.is_file():
+            raise ValueError(f"設定檔不存在, Current path: '{config_path}'")
+        try:
+            import tomllib # Python 3.11+, import 比 tomlkit 快很多
+        except ImportError:
+            import tomlkit as tomllib
+        with open(config_path, mode="r", encoding="utf-8") as f:
+            config = tomllib.loads(f.read())
+    
+    purchasing_wb = args.purchasing or Path(config.get("purchasing") or "")
+    catalog = args.catalog or str(config.get("catalog") or "")
+    new_wb_dir = args.out or Path(config.get("new_wb_dir") or "")
+    if (str(purchasing_wb) == ".") or (catalog == "") or (str(new_wb_dir) == "."):
+        raise ValueError("請指定 '交貨清單', '編目箱單' 與 '回填OK' 資料夾 (參數或設定檔)")
+    
+    # 資料夾 : 多個 '交貨清單'
+    if purchasing_wb.is_dir():
+        if args.watch:
+            raise ValueError("--watch 只支援一個 '交貨清單'")
+    else:
+        check_xlsx(purchasing_wb.resolve(), "交貨清單")
+    check_dir(new_wb_dir.resolve())
+    
+    # 資料夾或 glob : 批次處理
+    is_batch = Path(catalog).is_dir() or any(ch in catalog for ch in "*?[")
+    if args.watch and (not Path(catalog).is_dir()):
+        raise ValueError(f"--watch 的 '編目箱單' 需要是資料夾, Current path: '{catalog}'")
+    if not is_batch:
+        check_xlsx(Path(catalog).resolve(), "編目箱單")
+    
+    cache_dir = args.cache_dir or Path(config.get("cache_dir") or new_wb_dir.joinpath(".cache"))
+    registry_path = None
+    if args.use_registry:
+        registry_path = args.registry or Path(config.get("registry")
+                                              or new_wb_dir.joinpath("登錄號.sqlite"))
+    
+    return purchasing_wb, catalog, new_wb_dir, cache_dir, registry_path, is_batch
+    # -------------------------------------------------------------------------/
+
+
+def run_single(args: argparse.Namespace, purchasing_wb: Path, catalog_wb: Path,
+               new_wb_dir: Path, cache_dir: Path, registry_path: Path):
+    """
+    """
+    from modules.backfiller import Backfiller
+    from modules.cache import SheetCache
+    from modules.pipeline import get_report_path
+    from modules.profiling import profiler
+    from modules.registry import RegistrationRegistry
+    from rich.console import Console
+    
+    # JSON Lines 模式不保留 terminal 輸出
+    console = Console(record=(args.log_mode != "jsonl"))
+    sheet_cache = SheetCache(cache_dir, console,
+                             max_bytes=args.cache_max_bytes, enabled=args.use_cache)
+    registry = None if registry_path is None else RegistrationRegistry(registry_path, console)
+    backfiller = Backfiller(purchasing_wb, catalog_wb, new_wb_dir, console,
+                            engine=args.engine, backend=args.backend,
+                            cache=sheet_cache, log_mode=args.log_mode,
+                            writer=args.writer, compact=args.compact,
+                            ingest_workers=args.ingest_workers, registry=registry,
+                            columnar=args.columnar)
+    
+    if args.profile:
+        profiler.enable(trace_memory=args.profile_memory,
+                        cprofile_path=(get_report_path(catalog_wb, new_wb_dir, "效能分析", ".prof")
+                                       if args.profile_backfill else None))
+    try:
+        backfiller.run(validate=args.validate, suggest=args.suggest)
+    except Exception as e:
+        # traceback 已經顯示並記錄在 '(SR)處理紀錄'
+        console.print(f"[red]:x: {type(e).__name__}: {e}")
+        return 1
+    finally:
+        profiler.show(console)
+        profiler.append_to_log(backfiller.new_log)
+    
+    return 0
+    # -------------------------------------------------------------------------/
+
+
+def run_many(args: argparse.Namespace, purchasing_wb: Path, catalog: str,
+             new_wb_dir: Path, cache_dir: Path, registry_path: Path):
+    """
+    """
+    from modules.batch import find_catalog_wbs, run_batch, show_batch_summary
+    from modules.cache import SheetCache
+    from modules.pipeline import load_purchasing
+    from rich.console import Console
+    
+    console = Console()
+    catalog_wbs = find_catalog_wbs(catalog)
+    if len(catalog_wbs) == 0:
+        console.print(f"[red]:x: 找不到 '編目箱單', Current path: '{catalog}'")
+        return 1
+    console.print(f"'編目箱單' : {len(catalog_wbs)} 個檔案")
+    
+    sheet_cache = SheetCache(cache_dir, console,
+                             max_bytes=args.cache_max_bytes, enabled=args.use_cache)
+    # '交貨清單' 只讀取一次
+    purchasing_df = load_purchasing(purchasing_wb, console,
+                                    backend=args.backend, cache=sheet_cache,
+                                    compact=args.compact)
+    console.print(len(purchasing_df.index), "\n")
+    
+    results = run_batch(catalog_wbs, purchasing_df, new_wb_dir, console,
+                        max_workers=args.max_workers, engine=args.engine,
+                        validate=args.validate, log_mode=args.log_mode,
+                        writer=args.writer, suggest=args.suggest,
+                        backend=args.backend, cache_dir=cache_dir,
+                        cache_max_bytes=args.cache_max_bytes,
+                        use_cache=sheet_cache.enabled, profile=args.profile,
+                        compact=args.compact, registry_path=registry_path,
+                        columnar=args.columnar)
+    show_batch_summary(results, console)
+    
+    return 0 if all(result["status"] == "OK" for result in results) else 1
+    # -------------------------------------------------------------------------/
+
+
+def run_watch(args: argparse.Namespace, purchasing_wb: Path, catalog_dir: Path,
+              new_wb_dir: Path, cache_dir: Path, registry_path: Path):
+    """
+    """
+    from modules.cache import SheetCache
+    from modules.registry import RegistrationRegistry
+    from modules.watch import CatalogWatcher
+    from rich.console import Console
+    
+    console = Console()
+    sheet_cache = SheetCache(cache_dir, console,
+                             max_bytes=args.cache_max_bytes, enabled=args.use_cache)
+    options = {
+        "engine": args.engine,
+        "validate": args.validate,
+        "log_mode": args.log_mode,
+        "writer": args.writer,
+        "suggest": args.suggest,
+        "backend": args.backend,
+        "compact": args.compact,
+        "columnar": args.columnar,
+    }
+    registry = None if registry_path is None else RegistrationRegistry(registry_path, console)
+    watcher = CatalogWatcher(purchasing_wb, catalog_dir, new_wb_dir, console,
+                             options, cache=sheet_cache, registry=registry,
+                             poll_interval=args.poll_interval,
+                             queue_size=args.queue_size)
+    watcher.run()
+    
+    return 0
+    # -------------------------------------------------------------------------/
+
+
+def run_route(args: argparse.Namespace, purchasing_dir: Path, catalog: str,
+              new_wb_dir: Path, cache_dir: Path, registry_path: Path):
+    """
+    """
+    from modules.batch import find_catalog_wbs
+    from modules.cache import SheetCache
+    from modules.profiling import profiler
+    from modules.registry import RegistrationRegistry
+    from modules.routing import RouteIndex, run_routed, show_routed_summary
+    from rich.console import Console
+    
+    # JSON Lines 模式不保留 terminal 輸出
+    console = Console(record=(args.log_mode != "jsonl"))
+    catalog_wbs = find_catalog_wbs(catalog)
+    if len(catalog_wbs) == 0:
+        console.print(f"[red]:x: 找不到 '編目箱單', Current path: '{catalog}'")
+        return 1
+    
+    sheet_cache = SheetCache(cache_dir, console,
+                             max_bytes=args.cache_max_bytes, enabled=args.use_cache)
+    route_index = RouteIndex(args.index_dir or cache_dir.joinpath("route_index"), console)
+    route_index.update(find_catalog_wbs(str(purchasing_dir)), backend=args.backend,
+                       cache=sheet_cache, compact=args.compact)
+    registry = None if registry_path is None else RegistrationRegistry(registry_path, console)
+    options = {
+        "engine": args.engine,
+        "validate": args.validate,
+        "log_mode": args.log_mode,
+        "writer": args.writer,
+        "suggest": args.suggest,
+        "backend": args.backend,
+        "compact": args.compact,
+        "columnar": args.columnar,
+    }
+    
+    if args.profile:
+        profiler.enable(trace_memory=args.profile_memory)
+    is_ok = True
+    for catalog_wb in catalog_wbs:
+        results = run_routed(catalog_wb, route_index, new_wb_dir, console,
+                             options, cache=sheet_cache, registry=registry)
+        show_routed_summary(results, console)
+        is_ok &= all(result["status"] == "OK" for result in results)
+    profiler.show(console)
+    
+    return 0 if is_ok else 1
+    # -------------------------------------------------------------------------/
+
+
+def check_choices(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    選項的可用值定義在各模組 (需要 import pandas), 所以在路徑檢查之後才檢查
+    """
+    from modules.columnar import columnar_formats
+    from modules.eventlog import log_modes
+    from modules.pipeline import backfill_engines
+    from modules.reader import reader_backends
+    from modules.writer import excel_writers
+    
+    for name, value, choices in [("--engine", args.engine, backfill_engines),
+                                 ("--log-mode", args.log_mode, log_modes),
+                                 ("--writer", args.writer, excel_writers),
+                                 ("--backend", args.backend, reader_backends)]:
+        if value not in choices:
+            parser.error(f"{name} : 不支援 '{value}', 請使用 {choices}")
+    for value in args.columnar:
+        if value not in columnar_formats:
+            parser.error(f"--columnar : 不支援 '{value}', 請使用 {list(columnar_formats)}")
+    # -------------------------------------------------------------------------/
+
+
+def main(argv: list[str] = None):
+    """
+    回傳 exit code (0 : 全部成功)
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    
+    try:
+        purchasing_wb, catalog, new_wb_dir, cache_dir, registry_path, is_batch = resolve_paths(args)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    check_choices(parser, args)
+    if (args.writer in ("patch", "diff")) and (args.watch or (is_batch and not purchasing_wb.is_dir())):
+        parser.error(f"--writer {args.writer} 不支援批次處理與常駐模式")
+    
+    from rich.traceback import install
+    install() # debug
+    
+    if purchasing_wb.is_dir():
+        return run_route(args, purchasing_wb, catalog, new_wb_dir, cache_dir, registry_path)
+    if args.watch:
+        return run_watch(args, purchasing_wb, Path(catalog), new_wb_dir, cache_dir, registry_path)
+    if is_batch:
+        return run_many(args, purchasing_wb, catalog, new_wb_dir, cache_dir, registry_path)
+    
+    return run_single(args, purchasing_wb, Path(catalog), new_wb_dir, cache_dir, registry_path)
+    # -------------------------------------------------------------------------/
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# 批次處理: 一次回填多個 '編目箱單'
+#
+# path.toml 的 `catalog` 改為資料夾或 glob (例如 "D:/編目箱單/*.xlsx"),
+# '交貨清單' 只讀取一次, 每個 '編目箱單' 在不同的 process 同時處理
+
+import os
+from pathlib import Path
+
+from modules.batch import find_catalog_wbs, run_batch, show_batch_summary
+from modules.cache import SheetCache
+from modules.check import check_dir, check_xlsx
+from modules.pipeline import load_purchasing
+from modules.utils import load_config
+from rich.console import Console
+from rich.traceback import install
+# -----------------------------------------------------------------------------/
+
+# 回填引擎 : "bulk" | "loop"
+backfill_engine: str = "bulk"
+
+# 回填前先檢查全部的 '採購序號' (每個檔案各自輸出 '(SR)驗證報告')
+validate_first: bool = True
+
+# 處理紀錄 : "rich" (文字) | "jsonl" (每本書一行 JSON, 大量檔案時較快)
+log_mode: str = "rich"
+
+# 輸出 Excel 的方式 : "stream" | "pandas"
+excel_writer: str = "stream"
+
+# 回填結果另外存成 "csv" | "parquet" | "jsonl" (見 `modules.columnar`)
+columnar_export: list[str] = []
+
+# 沒有對應到的 '編目箱單', 以 ISBN / 書名找出候選 ('(SR)比對候選')
+suggest_candidates: bool = True
+
+# 讀取 Excel 的方式 : "openpyxl" | "openpyxl-stream" | "calamine" | "auto"
+reader_backend: str = "auto"
+
+# 解析結果快取
+use_cache: bool = True
+cache_max_bytes: int = 1024**3
+
+# '登錄號' 資料庫 (見 `modules.registry`)
+use_registry: bool = True
+
+# 精簡記憶體模式 (category, Arrow 字串, 較小的整數; 見 `modules.compact`)
+compact_dtype: bool = False
+
+# 效能分析 (每個檔案的步驟時間 / 記憶體加到各自的 '(SR)處理紀錄')
+profile: bool = False
+
+# 同時處理的檔案數 (process)
+max_workers: int = os.cpu_count()
+
+
+def main():
+    """
+    """
+    install() # debug
+    console = Console()
+    
+    # Load config
+    config_path: Path = Path(__file__).parent.joinpath("path.toml")
+    config = load_config(config_path, console)
+    
+    # 交貨清單
+    purchasing_wb: Path = Path(config["purchasing"])
+    check_xlsx(purchasing_wb.resolve(), "交貨清單")
+    
+    # 編目箱單 (資料夾 或 glob)
+    catalog_wbs = find_catalog_wbs(config["catalog"])
+    if len(catalog_wbs) == 0:
+        raise ValueError(f"找不到 '編目箱單', Current path: '{config['catalog']}'")
+    console.print(f"'編目箱單' : {len(catalog_wbs)} 個檔案")
+    
+    # New WorkBook
+    new_wb_dir: Path = Path(config["new_wb_dir"])
+    check_dir(new_wb_dir.resolve())
+    
+    cache_dir: Path = Path(config.get("cache_dir") or new_wb_dir.joinpath(".cache"))
+    sheet_cache = SheetCache(cache_dir, console,
+                             max_bytes=cache_max_bytes, enabled=use_cache)
+    registry_path: Path = None
+    if use_registry:
+        registry_path = Path(config.get("registry") or new_wb_dir.joinpath("登錄號.sqlite"))
+    
+    # '交貨清單' 只讀取一次
+    purchasing_df = load_purchasing(purchasing_wb, console,
+                                    backend=reader_backend, cache=sheet_cache,
+                                    compact=compact_dtype)
+    console.print(len(purchasing_df.index), "\n")
+    
+    results = run_batch(catalog_wbs, purchasing_df, new_wb_dir, console,
+                        max_workers=max_workers, engine=backfill_engine,
+                        validate=validate_first, log_mode=log_mode,
+                        writer=excel_writer, suggest=suggest_candidates,
+                        backend=reader_backend, cache_dir=cache_dir,
+                        cache_max_bytes=cache_max_bytes,
+                        use_cache=sheet_cache.enabled, profile=profile,
+                        compact=compact_dtype, registry_path=registry_path,
+                        columnar=columnar_export)
+    show_batch_summary(results, console)
+    # -------------------------------------------------------------------------/
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# 產生測試用的 '交貨清單' / '編目箱單'
+#
+# python -m bench.generate 10000 bench/data/10k --boxes 5
+
+import argparse
+import random
+from pathlib import Path
+
+from modules.schema import (catalog_st_rowidx, purchasing_st_rowidx,
+                            purchasing_wsname, schema)
+from openpyxl import Workbook
+# -----------------------------------------------------------------------------/
+
+# 欄位順序 (與實際檔案相同), 依 schema.toml 的 colnames
+purchasing_columns: list[str] = schema["purchasing"]["colnames"]
+catalog_columns: list[str] = schema["catalog"]["colnames"]
+
+purchasing_filename: str = "交貨清單.xlsx"
+catalog_filename: str = "(OK)編目箱單測試.xlsx"
+
+# 書名用字 (讓書名的 n-gram 分布接近實際資料)
+title_chars: str = "台灣的歷史文化科學生活故事世界人類自然旅行設計藝術音樂心理學習教育經濟社會兒童繪本小說詩集"
+
+
+def make_isbn(rnd: random.Random):
+    """
+    有正確檢查碼的 ISBN-13
+    """
+    digits = "978" + "".join(str(rnd.randint(0, 9)) for _ in range(9))
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits))
+    
+    return digits + str((10 - total % 10) % 10)
+    # -------------------------------------------------------------------------/
+
+
+def generate_workbooks(n_rows: int, out_dir: Path, n_boxes: int = 3,
+                       bookset_ratio: float = 0.1, bookcopy_ratio: float = 0.2,
+                       nodelivery_ratio: float = 0.1, mismatch_ratio: float = 0.05,
+                       seed: int = 0):
+    """
+    產生 `n_rows` 本書的 '交貨清單' 與對應的 '編目箱單' (分成 `n_boxes` 個工作表)
+    
+    - bookset_ratio : 套書 (冊數 2~4) 的比例
+    - bookcopy_ratio : 副本 (數量 2~3) 的比例
+    - nodelivery_ratio : 沒有交貨的比例
+    - mismatch_ratio : '書目' / ISBN 與 '交貨清單' 不同的比例
+    
+    回傳 ('交貨清單' path, '編目箱單' path)
+    """
+    rnd = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    
+    purc_wb = Workbook(write_only=True)
+    purc_ws = purc_wb.create_sheet(purchasing_wsname)
+    # header 之前的列 (採購案名稱, 空白)
+    purc_ws.append(["測試採購案"])
+    for _ in range(purchasing_st_rowidx - 1):
+        purc_ws.append([])
+    purc_ws.append(purchasing_columns)
+    
+    cata_rows = []
+    for purc_sn in range(1, n_rows + 1):
+        r = rnd.random()
+        if r < bookset_ratio:
+            kind, book_vol, book_num = "套書", rnd.randint(2, 4), 1
+        elif r < bookset_ratio + bookcopy_ratio:
+            kind, book_vol, book_num = "複本", 1, rnd.randint(2, 3)
+        else:
+            kind, book_vol, book_num = None, 1, 1
+        total_book = book_vol * book_num
+        
+        title = "".join(rnd.choice(title_chars) for _ in range(rnd.randint(4, 12))) + f"{purc_sn}"
+        isbn = make_isbn(rnd)
+        price = rnd.randint(100, 900)
+        discount = round(price * 0.79, 1)
+        purc_row = {
+            "序號": purc_sn, "採購序號": purc_sn, "原始序號": purc_sn + 10000, "書名": title,
+            "作者": f"作者{purc_sn}", "出版社": "出版社", "出版年": str(rnd.randint(2000, 2024)),
+            "ISBN": isbn, "館藏地代碼": "LIB", "資料類型/特藏號": "TXT", "定價": price,
+            "折扣價": discount, "總冊數": total_book, "數量": book_num,
+            "小計": round(discount * book_num, 1), "主題分類": "主題", "套書/複本": kind,
+            "書單來源": "來源", "冊數": book_vol, "單位": "冊",
+        }
+        purc_ws.append([purc_row.get(col) for col in purchasing_columns])
+        
+        if rnd.random() < nodelivery_ratio:
+            continue
+        for i in range(total_book):
+            cata_title = title if rnd.random() >= mismatch_ratio else title + "X"
+            cata_isbn = isbn if rnd.random() >= mismatch_ratio else make_isbn(rnd)
+            cata_rows.append({
+                "編目員": "編目員", "原序號": purc_sn, "登錄號": f"C{purc_sn:07d}{i}", "類型": "B",
+                "分類號": f"{rnd.randint(0, 999)}.{i}", "作者號": "A1", "年代": "2024",
+                "部冊號": f"v.{i + 1}" if kind == "套書" else None,
+                "書目": f"{cata_title} / 作者{purc_sn}", "F10": "LIB2", "F11": "TXT", "F14": "2024",
+                "F24 805ISBN": cata_isbn,
+            })
+    
+    purc_path = out_dir.joinpath(purchasing_filename)
+    purc_wb.save(purc_path)
+    
+    # '編目箱單' : 依箱號分成多個工作表
+    rnd.shuffle(cata_rows)
+    cata_wb = Workbook(write_only=True)
+    per_box = max(1, -(-len(cata_rows) // n_boxes))
+    for box_no in range(1, n_boxes + 1):
+        cata_ws = cata_wb.create_sheet(f"{box_no}")
+        cata_ws.append(["箱單"])
+        for _ in range(catalog_st_rowidx - 1):
+            cata_ws.append([])
+        cata_ws.append(catalog_columns)
+        for serial_no, row in enumerate(cata_rows[(box_no - 1) * per_box:box_no * per_box], start=1):
+            row["箱號"] = box_no
+            row["序號"] = serial_no
+            cata_ws.append([row.get(col) for col in catalog_columns])
+    
+    cata_path = out_dir.joinpath(catalog_filename)
+    cata_wb.save(cata_path)
+    
+    return purc_path, cata_path
+    # -------------------------------------------------------------------------/
+
+
+def main():
+    """
+    """
+    parser = argparse.ArgumentParser(description="產生測試用的 '交貨清單' / '編目箱單'")
+    parser.add_argument("n_rows", type=int, help="'交貨清單' 的書本數")
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--boxes", type=int, default=3, help="'編目箱單' 工作表數")
+    parser.add_argument("--bookset", type=float, default=0.1, help="套書比例")
+    parser.add_argument("--bookcopy", type=float, default=0.2, help="副本比例")
+    parser.add_argument("--nodelivery", type=float, default=0.1, help="沒有交貨比例")
+    parser.add_argument("--mismatch", type=float, default=0.05, help="書目 / ISBN 不相等比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    paths = generate_workbooks(args.n_rows, args.out_dir, n_boxes=args.boxes,
+                               bookset_ratio=args.bookset, bookcopy_ratio=args.bookcopy,
+                               nodelivery_ratio=args.nodelivery,
+                               mismatch_ratio=args.mismatch, seed=args.seed)
+    for path in paths:
+        print(path)
+    # -------------------------------------------------------------------------/
+
+
+if __name__ == "__main__":
+    main()
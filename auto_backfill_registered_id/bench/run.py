@@ -0,0 +1,226 @@
+# 效能測試: 以產生的 '交貨清單' / '編目箱單' 量測每個步驟的時間與記憶體
+#
+# python -m bench.run                          # 1k, 10k, 100k 本書
+# python -m bench.run --rows 1000 --engines bulk loop
+# python -m bench.run --compare bench/results/舊.json bench/results/新.json
+
+import argparse
+import io
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+from bench.generate import (catalog_filename, generate_workbooks,
+                            purchasing_filename)
+from modules.pipeline import (export_backfill, load_catalog, load_purchasing,
+                              reconcile_backfill, report_backfill,
+                              run_backfill, suggest_matches,
+                              validate_backfill)
+from rich.console import Console
+from rich.table import Table
+# -----------------------------------------------------------------------------/
+
+bench_dir: Path = Path(__file__).parent
+default_rows: list[int] = [1_000, 10_000, 100_000]
+
+
+def measure(records: list[dict], stage: str, trace_memory: bool, fn, *args, **kwargs):
+    """
+    執行 `fn` 並記錄 wall time, CPU time (`trace_memory=True` 時另外記錄 tracemalloc 的 peak)
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+        mem_base = tracemalloc.get_traced_memory()[0]
+    
+    wall_st = time.perf_counter()
+    cpu_st = time.process_time()
+    result = fn(*args, **kwargs)
+    record = {
+        "stage": stage,
+        "wall_s": round(time.perf_counter() - wall_st, 4),
+        "cpu_s": round(time.process_time() - cpu_st, 4),
+    }
+    if trace_memory:
+        record["peak_bytes"] = tracemalloc.get_traced_memory()[1] - mem_base
+    
+    records.append(record)
+    
+    return result
+    # -------------------------------------------------------------------------/
+
+
+def run_pipeline(data_dir: Path, out_dir: Path, engine: str, backend: str,
+                 writer: str, trace_memory: bool, compact: bool = False):
+    """
+    與 `main_cli.py` 相同的步驟 (不使用快取), 回傳每個步驟的紀錄
+    """
+    # terminal 輸出也算在時間內, 但不顯示
+    console = Console(file=io.StringIO(), width=120)
+    records: list[dict] = []
+    out_dir.mkdir(parents=True, exist_ok=True)
+    
+    purchasing_df = measure(records, "load_purchasing", trace_memory,
+                            load_purchasing, data_dir.joinpath(purchasing_filename),
+                            console, backend=backend, compact=compact)
+    catalog_df = measure(records, "load_catalog", trace_memory,
+                         load_catalog, data_dir.joinpath(catalog_filename),
+                         console, backend=backend, compact=compact)
+    measure(records, "validate", trace_memory,
+            validate_backfill, purchasing_df, catalog_df, console)
+    measure(records, "reconcile", trace_memory,
+            reconcile_backfill, purchasing_df, catalog_df, console)
+    new_df, handled_type_cnt, purchasing_left, catalog_left = \
+        measure(records, "backfill", trace_memory,
+                run_backfill, purchasing_df, catalog_df, console, engine=engine)
+    new_df = measure(records, "add_total_sum", trace_memory,
+                     report_backfill, new_df, handled_type_cnt, console)
+    measure(records, "export", trace_memory,
+            export_backfill, new_df, purchasing_left,
+            out_dir.joinpath("(SR)回填測試.xlsx"), writer=writer)
+    measure(records, "suggest", trace_memory,
+            suggest_matches, purchasing_left, catalog_left, console)
+    
+    return records
+    # -------------------------------------------------------------------------/
+
+
+def get_git_rev():
+    """
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=bench_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # -------------------------------------------------------------------------/
+
+
+def run_bench(rows: list[int], engines: list[str], backend: str, writer: str,
+              trace_memory: bool, console: Console, compact: bool = False):
+    """
+    """
+    results = []
+    for n_rows in rows:
+        data_dir = bench_dir.joinpath("data", f"{n_rows}")
+        if not data_dir.joinpath(catalog_filename).exists():
+            console.print(f"產生測試資料 : {n_rows} 本書 -> '{data_dir}'")
+            generate_workbooks(n_rows, data_dir, n_boxes=max(1, n_rows // 2_000))
+        
+        for engine in engines:
+            console.print(f"[bold]{n_rows} 本書, engine={engine}")
+            records = run_pipeline(data_dir, data_dir.joinpath("out"),
+                                   engine, backend, writer, trace_memory=False,
+                                   compact=compact)
+            if trace_memory:
+                # 記憶體另外量測, tracemalloc 會讓時間變慢很多
+                tracemalloc.start()
+                mem_records = run_pipeline(data_dir, data_dir.joinpath("out"),
+                                           engine, backend, writer, trace_memory=True,
+                                           compact=compact)
+                tracemalloc.stop()
+                for record, mem_record in zip(records, mem_records):
+                    record["peak_bytes"] = mem_record["peak_bytes"]
+            
+            for record in records:
+                record.update({"rows": n_rows, "engine": engine})
+                console.print(f"  {record['stage']:<16} {record['wall_s']:>9.3f} s"
+                              + (f" {record['peak_bytes'] / 1024**2:>9.1f} MB"
+                                 if "peak_bytes" in record else ""))
+            results.extend(records)
+    
+    return results
+    # -------------------------------------------------------------------------/
+
+
+def compare_results(old_path: Path, new_path: Path, console: Console):
+    """
+    比較兩次的結果 (新 / 舊), 時間增加超過 10% 以紅色顯示
+    """
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    
+    old_records = {(r["rows"], r["engine"], r["stage"]): r for r in old["results"]}
+    
+    table = Table(title=f"{old.get('git_rev')} -> {new.get('git_rev')}")
+    for col_name in ["rows", "engine", "stage", "wall (old)", "wall (new)", "ratio",
+                     "peak MB (old)", "peak MB (new)"]:
+        table.add_column(col_name, justify="right")
+    
+    def fmt_ratio(ratio):
+        color = "red" if ratio > 1.1 else ("green" if ratio < 0.9 else "white")
+        return f"[{color}]{ratio:.2f}x"
+    
+    for record in new["results"]:
+        key = (record["rows"], record["engine"], record["stage"])
+        old_record = old_records.get(key)
+        if old_record is None:
+            continue
+        ratio = record["wall_s"] / max(old_record["wall_s"], 1e-9)
+        old_peak = old_record.get("peak_bytes")
+        new_peak = record.get("peak_bytes")
+        table.add_row(str(key[0]), key[1], key[2],
+                      f"{old_record['wall_s']:.3f}", f"{record['wall_s']:.3f}",
+                      fmt_ratio(ratio),
+                      "-" if old_peak is None else f"{old_peak / 1024**2:.1f}",
+                      "-" if new_peak is None else f"{new_peak / 1024**2:.1f}")
+    
+    console.print(table)
+    # -------------------------------------------------------------------------/
+
+
+def main():
+    """
+    """
+    parser = argparse.ArgumentParser(description="'交貨清單' / '編目箱單' 回填效能測試")
+    parser.add_argument("--rows", type=int, nargs="+", default=default_rows)
+    parser.add_argument("--engines", nargs="+", default=["bulk"], choices=["bulk", "loop"])
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--writer", default="stream")
+    parser.add_argument("--no-memory", action="store_true", help="不量測記憶體")
+    parser.add_argument("--compact", action="store_true", help="精簡記憶體模式")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="結果 JSON (預設 bench/results/<時間>.json)")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    
+    console = Console()
+    
+    if args.compare is not None:
+        compare_results(*args.compare, console)
+        return
+    
+    results = run_bench(args.rows, args.engines, args.backend, args.writer,
+                        not args.no_memory, console, compact=args.compact)
+    
+    output = args.output
+    if output is None:
+        output = bench_dir.joinpath("results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, mode="w", encoding="utf-8") as f:
+        json.dump({
+            "git_rev": get_git_rev(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "openpyxl": openpyxl.__version__,
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "writer": args.writer,
+            "compact": args.compact,
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    console.print(f"結果 : '{output}'")
+    # -------------------------------------------------------------------------/
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+
+from .cache import SheetCache
+from .eventlog import EventLog
+from .pipeline import (check_registry, compile_plan, export_backfill,
+                       export_columnar, get_output_paths, get_report_path,
+                       load_catalog, load_inputs, load_purchasing,
+                       patch_backfill, reconcile_backfill, register_backfill,
+                       report_backfill, run_backfill, suggest_matches,
+                       validate_backfill)
+from .registry import RegistrationRegistry
+from .schema import ColumnPlan
+from .writer import patch_writers
+# -----------------------------------------------------------------------------/
+
+
+class Backfiller:
+    """
+    一個 '編目箱單' 的回填流程, 每個步驟可以分開呼叫 (notebook, 測試, 服務),
+    或用 `run()` 一次執行全部
+    
+    backfiller = Backfiller(purchasing_wb, catalog_wb, new_wb_dir, console)
+    backfiller.load()
+    backfiller.compile_plan()     # 欄位對應 (缺少欄位時 raise)
+    backfiller.check_registry()   # 有給 `registry` 時
+    backfiller.validate()
+    backfiller.sync()
+    backfiller.export()
+    backfiller.export_columnar()  # 有給 `columnar` 時
+    backfiller.register()         # 有給 `registry` 時
+    backfiller.suggest()
+    backfiller.save_log()
+    
+    - `purchasing_wb` 可以是 None, 由 `load(purchasing_df=...)` 傳入已讀取的 '交貨清單'
+    - 每個步驟的結果保留在 attribute (`new_df`, `handled_type_cnt`, `mismatch_df`...)
+    """
+    def __init__(self, purchasing_wb: Path, catalog_wb: Path,
+                 new_wb_dir: Path, console: Console,
+                 engine: str = "bulk", backend: str = "openpyxl",
+                 cache: SheetCache = None, log_mode: str = "rich",
+                 writer: str = "stream", log: EventLog = None,
+                 compact: bool = False, tag: str = "",
+                 ingest_workers: int = 0, registry: RegistrationRegistry = None,
+                 columnar: list[str] = ()):
+        """
+        `log_mode="jsonl"` 且沒有給 `log` 時, `run()` 會自己建立 `EventLog`
+        
+        `compact=True` : 讀取後轉成精簡的 dtype (見 `modules.compact`)
+        `tag` : 加在輸出檔名後面 (同一個 '編目箱單' 回填到多個 '交貨清單' 時區分)
+        `ingest_workers` : 大於 0 時, 兩個檔案的工作表同時在這麼多個 process 解析
+        (見 `modules.ingest`), 0 為在同一個 process 依序讀取
+        `registry` : 回填前檢查 '登錄號', 輸出後記錄 (見 `modules.registry`)
+        `columnar` : 另外輸出的格式 ("csv", "parquet", "jsonl", 見 `modules.columnar`)
+        """
+        self.purchasing_wb: Path = None if purchasing_wb is None else Path(purchasing_wb)
+        self.catalog_wb: Path = Path(catalog_wb)
+        self.new_wb_dir: Path = Path(new_wb_dir)
+        self.console: Console = console
+        self.engine: str = engine
+        self.backend: str = backend
+        self.cache: SheetCache = cache
+        self.log_mode: str = log_mode
+        self.writer: str = writer
+        self.log: EventLog = log
+        self.compact: bool = compact
+        self.tag: str = tag
+        self.ingest_workers: int = ingest_workers
+        self.registry: RegistrationRegistry = registry
+        self.columnar: list[str] = list(columnar)
+        self.new_wb, self.new_log = get_output_paths(self.catalog_wb, self.new_wb_dir,
+                                                     log_mode, tag)
+        
+        self.purchasing_df: pd.DataFrame = None
+        self.catalog_df: pd.DataFrame = None
+        self.mismatch_df: pd.DataFrame = None
+        self.new_df: pd.DataFrame = None
+        self.backfill_df: pd.DataFrame = None # `new_df` 加上合計列之前
+        self.handled_type_cnt: Counter = None
+        self.purchasing_left: pd.DataFrame = None
+        self.catalog_left: pd.DataFrame = None
+        self.candidate_df: pd.DataFrame = None
+        self.patch_df: pd.DataFrame = None
+        self.registry_df: pd.DataFrame = None
+        self.column_plan: ColumnPlan = None
+        # ---------------------------------------------------------------------/
+    
+    
+    def report_path(self, kind: str = "驗證報告", suffix: str = ".log"):
+        """
+        """
+        return get_report_path(self.catalog_wb, self.new_wb_dir, kind, suffix, self.tag)
+        # ---------------------------------------------------------------------/
+    
+    
+    def load(self, purchasing_df: pd.DataFrame = None,
+             catalog_df: pd.DataFrame = None):
+        """
+        讀取 '交貨清單' 與 '編目箱單'
+        
+        `purchasing_df` 不是 None 時不讀取 '交貨清單', 使用 `purchasing_df` 的複本
+        (批次處理時 '交貨清單' 只讀取一次), `catalog_df` 相同 (見 `modules.routing`)
+        
+        複本為 shallow copy (不複製資料): 之後只會加入 column, 改變 index 或移除列,
+        不會修改原本 DataFrame 的值
+        """
+        if (purchasing_df is None) and (catalog_df is None) and (self.ingest_workers > 0) \
+                and (self.purchasing_wb is not None):
+            purchasing_df, self.catalog_df = load_inputs(self.purchasing_wb, self.catalog_wb,
+                                                         self.console, backend=self.backend,
+                                                         cache=self.cache, compact=self.compact,
+                                                         max_workers=self.ingest_workers)
+            self.purchasing_df = purchasing_df
+            self.console.print(len(self.purchasing_df.index), "\n")
+            self.console.print(len(self.catalog_df.index), "\n")
+            return
+        
+        if purchasing_df is None:
+            if self.purchasing_wb is None:
+                raise ValueError("沒有指定 '交貨清單', 請給 `purchasing_wb` 或 `purchasing_df`")
+            purchasing_df = load_purchasing(self.purchasing_wb, self.console,
+                                            backend=self.backend, cache=self.cache,
+                                            compact=self.compact)
+            self.console.print(len(purchasing_df.index), "\n")
+        self.purchasing_df = purchasing_df.copy(deep=False)
+        
+        if catalog_df is not None:
+            self.catalog_df = catalog_df.copy(deep=False)
+            return
+        
+        self.catalog_df = load_catalog(self.catalog_wb, self.console,
+                                       backend=self.backend, cache=self.cache,
+                                       compact=self.compact)
+        self.console.print(len(self.catalog_df.index), "\n")
+        # ---------------------------------------------------------------------/
+    
+    
+    def compile_plan(self):
+        """
+        依讀取的 column 編譯欄位對應 (`schema.toml`), 缺少或拼錯的欄位在回填前 raise
+        """
+        self.column_plan = compile_plan(self.purchasing_df, self.catalog_df)
+        # ---------------------------------------------------------------------/
+    
+    
+    def check_registry(self):
+        """
+        檢查 '編目箱單' 的 '登錄號' 是否重複, 已經登錄過或缺號 (問題清單存成 '(SR)登錄號檢查' CSV),
+        只會警告不會停止
+        """
+        if self.registry is None:
+            return
+        
+        self.registry_df = check_registry(self.catalog_df, self.registry, self.catalog_wb,
+                                          self.console, tag=self.tag,
+                                          report_path=self.report_path("登錄號檢查", ".csv"),
+                                          log=self.log)
+        # ---------------------------------------------------------------------/
+    
+    
+    def validate(self):
+        """
+        回填前檢查 (報告存成 '(SR)驗證報告'), 有錯誤時 raise
+        """
+        validate_backfill(self.purchasing_df, self.catalog_df, self.console,
+                          report_path=self.report_path())
+        # ---------------------------------------------------------------------/
+    
+    
+    def sync(self):
+        """
+        比對 '書名', 'ISBN' (存成 '(SR)書名ISBN不相等' CSV) 後回填, 並加上合計列
+        """
+        self.mismatch_df = reconcile_backfill(self.purchasing_df, self.catalog_df, self.console,
+                                              report_path=self.report_path("書名ISBN不相等", ".csv"),
+                                              log=self.log)
+        
+        self.backfill_df, self.handled_type_cnt, self.purchasing_left, self.catalog_left = \
+            run_backfill(self.purchasing_df, self.catalog_df, self.console,
+                         engine=self.engine, log=self.log, column_plan=self.column_plan)
+        self.new_df = report_backfill(self.backfill_df, self.handled_type_cnt, self.console,
+                                      log=self.log)
+        # ---------------------------------------------------------------------/
+    
+    
+    def export(self):
+        """
+        存成 '(SR)回填' xlsx
+        
+        writer="patch" / "diff" : 修改原本的 '交貨清單' (修改清單存成 '(SR)修改清單' CSV)
+        """
+        if self.writer in patch_writers:
+            if self.purchasing_wb is None:
+                raise ValueError(f"輸出方式 '{self.writer}' 需要 `purchasing_wb` (原本的 '交貨清單')")
+            self.patch_df = patch_backfill(self.new_df, self.purchasing_wb, self.new_wb,
+                                           self.console,
+                                           diff_path=self.report_path("修改清單", ".csv"),
+                                           dry_run=(self.writer == "diff"))
+            return
+        
+        export_backfill(self.new_df, self.purchasing_left, self.new_wb, writer=self.writer)
+        # ---------------------------------------------------------------------/
+    
+    
+    def export_columnar(self):
+        """
+        回填結果與沒有處理到的資料另外存成 `columnar` 的格式 (合計存在 '(SR)回填摘要' JSON),
+        writer="diff" 沒有輸出, 不存
+        """
+        if (len(self.columnar) == 0) or (self.writer == "diff"):
+            return
+        
+        export_columnar(self.backfill_df, self.purchasing_left, self.catalog_left,
+                        self.handled_type_cnt, self.catalog_wb, self.new_wb_dir,
+                        self.columnar, tag=self.tag)
+        # ---------------------------------------------------------------------/
+    
+    
+    def register(self):
+        """
+        記錄這次回填的 '登錄號' (writer="diff" 沒有輸出, 不記錄)
+        """
+        if (self.registry is None) or (self.writer == "diff"):
+            return
+        
+        register_backfill(self.new_df, self.registry, self.catalog_wb, self.console,
+                          tag=self.tag,
+                          purchasing_name="" if self.purchasing_wb is None else self.purchasing_wb.name)
+        # ---------------------------------------------------------------------/
+    
+    
+    def suggest(self):
+        """
+        沒有對應到 '採購序號' 的 '編目箱單' 找出候選 (存成 '(SR)比對候選')
+        """
+        self.candidate_df = suggest_matches(self.purchasing_left, self.catalog_left, self.console,
+                                            review_path=self.report_path("比對候選", ".xlsx"))
+        # ---------------------------------------------------------------------/
+    
+    
+    def save_log(self):
+        """
+        儲存 '(SR)處理紀錄' ("rich" : terminal 的文字紀錄, "jsonl" : 關閉 `log`)
+        """
+        if self.log is not None:
+            self.log.close()
+        elif self.console.record:
+            self.console.save_text(self.new_log)
+        # ---------------------------------------------------------------------/
+    
+    
+    def run(self, purchasing_df: pd.DataFrame = None,
+            validate: bool = True, suggest: bool = True,
+            catalog_df: pd.DataFrame = None):
+        """
+        執行全部步驟, 結束或發生錯誤時都會儲存 '(SR)處理紀錄'
+        
+        發生錯誤時先記錄在 '(SR)處理紀錄' 再 raise
+        """
+        if (self.log_mode == "jsonl") and (self.log is None):
+            self.log = EventLog(self.new_log, self.console)
+        
+        try:
+            self.load(purchasing_df, catalog_df)
+            self.compile_plan()
+            self.check_registry()
+            if validate:
+                self.validate()
+            self.sync()
+            self.export()
+            self.export_columnar()
+            self.register()
+            if suggest:
+                self.suggest()
+        except Exception as e:
+            if self.log is None:
+                self.console.print_exception()
+            else:
+                self.log.error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.save_log()
+        
+        return self
+        # ---------------------------------------------------------------------/
@@ -0,0 +1,203 @@
+import glob
+import io
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pandas as pd
+import rich.progress
+from rich.console import Console
+from rich.table import Table
+
+from .backfiller import Backfiller
+from .cache import SheetCache
+from .pipeline import get_output_paths
+from .profiling import profiler
+from .registry import RegistrationRegistry
+# -----------------------------------------------------------------------------/
+
+# 每個 worker process 各自的狀態 (由 `init_worker` 設定)
+worker_state: dict = {}
+
+
+def find_catalog_wbs(pattern: str):
+    """
+    `pattern` 可以是資料夾 (資料夾內所有的 .xlsx), glob 或單一檔案
+    
+    會略過 Excel 開啟中的暫存檔 ('~$') 以及輸出的 '(SR)' 檔案
+    """
+    path = Path(pattern)
+    if path.is_dir():
+        paths = sorted(path.glob("*.xlsx"))
+    else:
+        paths = sorted(Path(p) for p in glob.glob(pattern))
+    
+    return [p for p in paths
+            if (p.suffix == ".xlsx") and (not p.name.startswith("~$"))
+                and (not p.name.startswith("(SR)"))]
+    # -------------------------------------------------------------------------/
+
+
+def init_worker(purchasing_df: pd.DataFrame, new_wb_dir: Path, options: dict):
+    """
+    `purchasing_df` 每個 worker 只傳送一次, 不會每個檔案都重新傳送
+    """
+    worker_state["purchasing_df"] = purchasing_df
+    worker_state["new_wb_dir"] = new_wb_dir
+    worker_state["options"] = options
+    # -------------------------------------------------------------------------/
+
+
+def backfill_worker(catalog_wb: Path):
+    """
+    處理一個 '編目箱單', 任何錯誤都記錄在該檔案的 '(SR)處理紀錄' 不會往外丟
+    """
+    purchasing_df: pd.DataFrame = worker_state["purchasing_df"]
+    new_wb_dir: Path = worker_state["new_wb_dir"]
+    options: dict = worker_state["options"]
+    
+    # JSON Lines 模式不保留文字紀錄
+    is_jsonl = (options["log_mode"] == "jsonl")
+    console = Console(record=(not is_jsonl), file=io.StringIO())
+    _, new_log = get_output_paths(catalog_wb, new_wb_dir, options["log_mode"])
+    if options["profile"]:
+        profiler.enable()
+    result = {"catalog": catalog_wb, "status": "OK", "error": None,
+              "handled_type_cnt": None, "catalog_left": None}
+    
+    try:
+        cache = None
+        if options["use_cache"]:
+            cache = SheetCache(options["cache_dir"], console,
+                               max_bytes=options["cache_max_bytes"])
+        registry = None
+        if options["registry_path"] is not None:
+            registry = RegistrationRegistry(options["registry_path"], console)
+        backfiller = Backfiller(None, catalog_wb, new_wb_dir, console,
+                                engine=options["engine"], backend=options["backend"],
+                                cache=cache, log_mode=options["log_mode"],
+                                writer=options["writer"],
+                                compact=options["compact"], registry=registry,
+                                columnar=options["columnar"])
+        # 錯誤由 `Backfiller.run()` 記錄在 '(SR)處理紀錄'
+        backfiller.run(purchasing_df, validate=options["validate"],
+                       suggest=options["suggest"])
+        result["handled_type_cnt"] = dict(backfiller.handled_type_cnt)
+        result["catalog_left"] = len(backfiller.catalog_left)
+    except Exception as e:
+        result["status"] = "Error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if options["profile"]:
+            profiler.append_to_log(new_log)
+            profiler.disable()
+    
+    return result
+    # -------------------------------------------------------------------------/
+
+
+def run_pool(catalog_wbs: list[Path], purchasing_df: pd.DataFrame,
+             new_wb_dir: Path, options: dict, max_workers: int,
+             progress: rich.progress.Progress, task_id):
+    """
+    回傳 ({catalog_wb: result}, worker process 異常結束而沒有處理完的檔案)
+    """
+    results: dict[Path, dict] = {}
+    broken: list[Path] = []
+    
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=init_worker,
+                             initargs=(purchasing_df, new_wb_dir, options)) as pool:
+        futures = {pool.submit(backfill_worker, wb): wb for wb in catalog_wbs}
+        for future in as_completed(futures):
+            catalog_wb = futures[future]
+            try:
+                results[catalog_wb] = future.result()
+                progress.advance(task_id)
+            except BrokenProcessPool:
+                broken.append(catalog_wb)
+    
+    return results, broken
+    # -------------------------------------------------------------------------/
+
+
+def run_batch(catalog_wbs: list[Path], purchasing_df: pd.DataFrame,
+              new_wb_dir: Path, console: Console,
+              max_workers: int = None, engine: str = "bulk",
+              validate: bool = True, log_mode: str = "rich",
+              writer: str = "stream", suggest: bool = True, backend: str = "openpyxl", cache_dir: Path = None,
+              cache_max_bytes: int = 1024**3, use_cache: bool = True,
+              profile: bool = False, compact: bool = False, registry_path: Path = None,
+              columnar: list[str] = ()):
+    """
+    用多個 process 同時處理多個 '編目箱單', 每個檔案各自輸出
+    '(SR)回填' xlsx 與 '(SR)處理紀錄' log, 一個檔案失敗不影響其他檔案
+    
+    `profile=True` 時, 每個檔案的效能分析加到各自的 '(SR)處理紀錄'
+    
+    `registry_path` : '登錄號' 資料庫 (見 `modules.registry`), 同時處理的檔案之間,
+    還沒有記錄的 '登錄號' 互相看不到 (下一次執行時才會檢查到)
+    
+    回傳每個檔案的處理結果 (依 `catalog_wbs` 順序)
+    """
+    options = {
+        "engine": engine,
+        "validate": validate,
+        "log_mode": log_mode,
+        "writer": writer,
+        "suggest": suggest,
+        "backend": backend,
+        "cache_dir": cache_dir,
+        "cache_max_bytes": cache_max_bytes,
+        "use_cache": use_cache and (cache_dir is not None),
+        "profile": profile,
+        "compact": compact,
+        "registry_path": registry_path,
+        "columnar": list(columnar),
+    }
+    
+    with rich.progress.Progress(console=console) as progress:
+        task_id = progress.add_task("編目箱單", total=len(catalog_wbs))
+        results, broken = run_pool(catalog_wbs, purchasing_df, new_wb_dir,
+                                   options, max_workers, progress, task_id)
+        
+        # worker process 異常結束 (例如記憶體不足) 時整個 pool 都無法使用,
+        # 受影響的檔案改用新的 pool 一個一個重新處理
+        for catalog_wb in broken:
+            retry, still_broken = run_pool([catalog_wb], purchasing_df, new_wb_dir,
+                                           options, 1, progress, task_id)
+            results.update(retry)
+            if still_broken:
+                results[catalog_wb] = {
+                    "catalog": catalog_wb, "status": "Error",
+                    "error": "worker process 異常結束",
+                    "handled_type_cnt": None, "catalog_left": None,
+                }
+                progress.advance(task_id)
+    
+    return [results[catalog_wb] for catalog_wb in catalog_wbs]
+    # -------------------------------------------------------------------------/
+
+
+def show_batch_summary(results: list[dict], console: Console):
+    """
+    """
+    table = Table(title="批次處理結果")
+    table.add_column("編目箱單")
+    table.add_column("狀態")
+    table.add_column("處理模式")
+    table.add_column("編目箱單 未處理", justify="right")
+    
+    for result in results:
+        if result["status"] == "OK":
+            status = "[green]OK"
+            detail = ", ".join(f"{k}: {v}" for k, v in result["handled_type_cnt"].items())
+            left = str(result["catalog_left"])
+        else:
+            status = "[red]Error"
+            detail = result["error"]
+            left = "-"
+        table.add_row(result["catalog"].name, status, detail, left)
+    
+    console.print(table)
+    # -------------------------------------------------------------------------/
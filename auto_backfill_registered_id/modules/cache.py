@@ -0,0 +1,278 @@
+import hashlib
+import importlib.util
+import json
+import os
+import posixpath
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+# 格式改變時要 +1, 舊的快取就不會再被使用
+cache_version: int = 2
+
+xlsx_ns: dict = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+}
+
+
+def get_sheet_parts(zf: zipfile.ZipFile):
+    """
+    回傳 ({ws_name: 工作表在 zip 中的路徑 (例如 'xl/worksheets/sheet1.xml')}, workbook.xml 的 root)
+    """
+    wb_xml = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    rels_xml = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    
+    rels: dict[str, str] = {}
+    for rel in rels_xml.findall("rel:Relationship", xlsx_ns):
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join("xl", target))
+        rels[rel.get("Id")] = target
+    
+    ws_parts: dict[str, str] = {}
+    for sheet in wb_xml.find("main:sheets", xlsx_ns):
+        ws_parts[sheet.get("name")] = rels.get(sheet.get(f"{{{xlsx_ns['r']}}}id"))
+    
+    return ws_parts, wb_xml
+    # -------------------------------------------------------------------------/
+
+
+def read_shared_strings(zf: zipfile.ZipFile):
+    """
+    xl/sharedStrings.xml 的字串 (rich text 合併成一般文字, 不包含注音 `rPh`)
+    """
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    
+    root = ElementTree.fromstring(zf.read("xl/sharedStrings.xml"))
+    strings: list[str] = []
+    for si in root.findall("main:si", xlsx_ns):
+        t = si.find("main:t", xlsx_ns)
+        if t is not None:
+            strings.append(t.text or "")
+        else:
+            strings.append("".join(rt.text or "" for rt in si.findall("main:r/main:t", xlsx_ns)))
+    
+    return strings
+    # -------------------------------------------------------------------------/
+
+
+def get_sheet_digests(wb_path: Path):
+    """
+    不解析儲存格, 直接由 xlsx (zip) 的內容計算每個工作表的 content hash
+    
+    hash 包含工作表本身, sharedStrings, styles 的內容 (blake2b, 不使用 zip 目錄的 CRC32 與大小),
+    以及 date1904 設定, 只修改某個工作表的數值時, 其他工作表的 hash 不會改變
+    
+    回傳 {ws_name: hex digest}, 依工作表順序
+    """
+    with zipfile.ZipFile(wb_path) as zf:
+        names = set(zf.namelist())
+        ws_parts, wb_xml = get_sheet_parts(zf)
+        
+        def member_sig(name):
+            if name not in names:
+                return "-"
+            member_hash = hashlib.blake2b(digest_size=20)
+            with zf.open(name) as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    member_hash.update(chunk)
+            return member_hash.hexdigest()
+        
+        wb_pr = wb_xml.find("main:workbookPr", xlsx_ns)
+        date1904 = "0" if wb_pr is None else wb_pr.get("date1904", "0")
+        shared_sig = f"{member_sig('xl/sharedStrings.xml')}|{member_sig('xl/styles.xml')}|{date1904}"
+        
+        digests: dict[str, str] = {}
+        for ws_name, ws_part in ws_parts.items():
+            ws_sig = f"{ws_part}|{member_sig(ws_part)}|{shared_sig}"
+            digests[ws_name] = hashlib.sha256(ws_sig.encode("utf-8")).hexdigest()
+    
+    return digests
+    # -------------------------------------------------------------------------/
+
+
+def frame_to_arrow(ws_df: pd.DataFrame, all_names: list, extent: dict = None):
+    """
+    DataFrame 轉成 Arrow Table, 工作表上完整的 column names 與資料範圍
+    (`modules.reader.ExtentTracker.to_dict`) 存在 schema metadata
+    
+    無法轉換時 (例如同一個 column 同時有數字和文字) raise `pa.ArrowException`, `TypeError` 或 `ValueError`
+    """
+    import pyarrow as pa
+    table = pa.Table.from_pandas(ws_df, preserve_index=False)
+    
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"all_names"] = json.dumps(all_names, ensure_ascii=False).encode("utf-8")
+    metadata[b"extent"] = json.dumps(extent, ensure_ascii=False).encode("utf-8")
+    
+    return table.replace_schema_metadata(metadata)
+    # -------------------------------------------------------------------------/
+
+
+def arrow_to_frame(table):
+    """
+    `frame_to_arrow` 的反向, 回傳 (DataFrame, 工作表上完整的 column names, 資料範圍)
+    """
+    all_names = json.loads(table.schema.metadata[b"all_names"])
+    extent = json.loads(table.schema.metadata.get(b"extent", b"null"))
+    ws_df = table.to_pandas()
+    
+    # Arrow 的 null 在 object column 會變成 None, 改回與 `pd.read_excel` 相同的 NaN
+    for col_name in ws_df.columns[ws_df.dtypes == object]:
+        ws_df[col_name] = ws_df[col_name].where(ws_df[col_name].notna(), np.nan)
+    
+    return ws_df, all_names, extent
+    # -------------------------------------------------------------------------/
+
+
+class SheetCache:
+    """
+    解析過的工作表 (DataFrame) 以 Arrow IPC 格式存在 `cache_dir`, 讀取時使用 memory map
+    
+    - key : 工作表 content hash + 工作表名稱 + dtype + header row + usecols + 讀取範圍的設定
+    - 超過 `max_bytes` 時, 刪除最久沒有使用的檔案
+    - 沒有安裝 `pyarrow` 或 `enabled=False` 時不使用快取
+    """
+    def __init__(self, cache_dir: Path, console: Console,
+                 max_bytes: int = 1024**3, enabled: bool = True):
+        """
+        """
+        self.cache_dir: Path = Path(cache_dir)
+        self.console: Console = console
+        self.max_bytes: int = max_bytes
+        self.enabled: bool = enabled
+        
+        if self.enabled and (importlib.util.find_spec("pyarrow") is None):
+            self.console.print(":warning: 沒有安裝 `pyarrow`, 不使用快取")
+            self.enabled = False
+        
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # ---------------------------------------------------------------------/
+    
+    
+    def make_key(self, ws_digest: str, ws_name: str,
+                 ws_dtype: dict[str, str], colidx: int, usecols: set = None,
+                 key_cols: set = None, max_blank_rows: int = None):
+        """
+        """
+        key = json.dumps({
+            "version": cache_version,
+            "pandas": pd.__version__,
+            "digest": ws_digest,
+            "ws_name": ws_name,
+            "dtype": sorted(ws_dtype.items()),
+            "header": colidx,
+            "usecols": None if usecols is None else sorted(usecols),
+            "key_cols": None if key_cols is None else sorted(key_cols),
+            "max_blank_rows": max_blank_rows,
+        }, ensure_ascii=False)
+        
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+        # ---------------------------------------------------------------------/
+    
+    
+    def get_path(self, key: str):
+        """
+        """
+        return self.cache_dir.joinpath(f"{key}.arrow")
+        # ---------------------------------------------------------------------/
+    
+    
+    def load(self, key: str):
+        """
+        回傳 (DataFrame, 工作表上完整的 column names, 資料範圍), 沒有快取時回傳 None
+        """
+        if not self.enabled:
+            return None
+        
+        path = self.get_path(key)
+        if not path.exists():
+            return None
+        
+        import pyarrow as pa
+        try:
+            with pa.memory_map(str(path), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            ws_df, all_names, extent = arrow_to_frame(table)
+        except (pa.ArrowException, OSError, KeyError, ValueError) as e:
+            self.console.print(f":warning: 快取損毀, 重新讀取 : '{path.name}' ({e})")
+            path.unlink(missing_ok=True)
+            return None
+        
+        # LRU: 更新使用時間
+        os.utime(path)
+        
+        return ws_df, all_names, extent
+        # ---------------------------------------------------------------------/
+    
+    
+    def save(self, key: str, ws_df: pd.DataFrame, all_names: list, extent: dict = None):
+        """
+        """
+        if not self.enabled:
+            return
+        
+        import pyarrow as pa
+        try:
+            table = frame_to_arrow(ws_df, all_names, extent)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            # 例如同一個 column 同時有數字和文字
+            self.console.print(f":warning: 無法快取, 略過 : {e}")
+            return
+        
+        self.save_table(key, table)
+        # ---------------------------------------------------------------------/
+    
+    
+    def save_table(self, key: str, table):
+        """
+        `table` : `frame_to_arrow` 的結果 (已經轉換過時不需要再由 DataFrame 轉換)
+        """
+        if not self.enabled:
+            return
+        
+        import pyarrow as pa
+        
+        # 先寫入暫存檔再改名, 中斷時不會留下寫到一半的快取
+        path = self.get_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        
+        self.evict()
+        # ---------------------------------------------------------------------/
+    
+    
+    def evict(self):
+        """
+        超過 `max_bytes` 時, 由最久沒有使用的檔案開始刪除
+        
+        批次處理時其他 worker 可能同時刪除同一個資料夾的檔案, 已經不存在的檔案略過
+        """
+        files = []
+        for path in self.cache_dir.glob("*.arrow"):
+            try:
+                files.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        total = sum(st.st_size for _, st in files)
+        
+        for path, st in sorted(files, key=lambda x: x[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+        # ---------------------------------------------------------------------/
@@ -0,0 +1,96 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import pandas as pd
+# -----------------------------------------------------------------------------/
+
+# 輸出格式 : {格式: 副檔名} (可以同時輸出多種)
+columnar_formats: dict[str, str] = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "jsonl": ".jsonl",
+}
+
+# 輸出的資料 : {名稱: 檔名的種類}
+columnar_parts: dict[str, str] = {
+    "new": "回填",
+    "purchasing_left": "未回填交貨清單",
+    "catalog_left": "未回填編目箱單",
+}
+
+has_pyarrow: bool = importlib.util.find_spec("pyarrow") is not None
+
+
+def to_columnar_frame(df: pd.DataFrame):
+    """
+    去掉 'index' column 與 '採購序號' index, 同一個 column 同時有數字和文字時轉成 "string"
+    (Parquet 每個 column 只能有一種型態)
+    """
+    df = df.drop(columns="index", errors="ignore").reset_index(drop=True)
+    
+    for col_name in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col_name], skipna=True) not in ("string", "empty"):
+            df[col_name] = df[col_name].astype("string")
+    
+    return df
+    # -------------------------------------------------------------------------/
+
+
+def write_frame(df: pd.DataFrame, path: Path, fmt: str, metadata: dict):
+    """
+    `metadata` (合計, 處理模式等) 在 Parquet 存在 schema metadata (key : "backfill"),
+    CSV / JSON Lines 沒有 metadata, 只存在摘要檔 (見 `write_columnar`)
+    """
+    if fmt == "csv":
+        # utf-8-sig : 讓 Excel 直接開啟 CSV 時中文不會變成亂碼
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    elif fmt == "jsonl":
+        if len(df) == 0:
+            path.write_text("", encoding="utf-8") # pandas 會寫入一個空行
+        else:
+            df.to_json(path, orient="records", lines=True, force_ascii=False)
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[b"backfill"] = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+        pq.write_table(table.replace_schema_metadata(schema_metadata), path)
+    else:
+        raise ValueError(f"不支援的輸出格式 : '{fmt}', 請使用 {list(columnar_formats)}")
+    # -------------------------------------------------------------------------/
+
+
+def write_columnar(frames: dict[str, pd.DataFrame], paths: dict[str, Path],
+                   summary_path: Path, formats: list[str], metadata: dict):
+    """
+    `frames` ({名稱: DataFrame}, 見 `columnar_parts`) 每個各自存成 `formats` 的每一種格式
+    (`paths[名稱]` 再加上副檔名), 每個 DataFrame 只轉換一次
+    
+    合計等 `metadata` 與每個檔案的筆數存成摘要檔 `summary_path` (JSON),
+    輸出的資料不包含 "合計" 列, 讀取時不需要另外排除
+    
+    回傳摘要 (dict)
+    """
+    invalid = [fmt for fmt in formats if fmt not in columnar_formats]
+    if invalid:
+        raise ValueError(f"不支援的輸出格式 : {invalid}, 請使用 {list(columnar_formats)}")
+    if ("parquet" in formats) and (not has_pyarrow):
+        raise ValueError("輸出 Parquet 需要安裝 `pyarrow`")
+    
+    summary = {**metadata, "rows": {}, "files": {}}
+    for name, df in frames.items():
+        df = to_columnar_frame(df)
+        summary["rows"][name] = len(df)
+        summary["files"][name] = {}
+        for fmt in formats:
+            path = paths[name].with_name(f"{paths[name].name}{columnar_formats[fmt]}")
+            write_frame(df, path, fmt, metadata)
+            summary["files"][name][fmt] = path.name
+    
+    with open(summary_path, mode="w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    
+    return summary
+    # -------------------------------------------------------------------------/
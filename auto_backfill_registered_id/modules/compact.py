@@ -0,0 +1,84 @@
+import importlib.util
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+# -----------------------------------------------------------------------------/
+
+# 沒有安裝 `pyarrow` 時, "string[pyarrow]" 改用一般的 "string"
+has_pyarrow: bool = importlib.util.find_spec("pyarrow") is not None
+
+# "int" : 依數值範圍縮小成 Int8 / Int16 / Int32 (不會改變數值)
+int_dtypes: list[str] = ["Int8", "Int16", "Int32"]
+
+
+def downcast_int(series: pd.Series):
+    """
+    nullable 整數縮小成可以容納所有數值的最小型態, 全部是 NA 時回傳 Int8
+    """
+    if not pd.api.types.is_integer_dtype(series):
+        return series
+    
+    values = series.dropna()
+    if len(values) == 0:
+        return series.astype(int_dtypes[0])
+    
+    v_min, v_max = values.min(), values.max()
+    for dtype in int_dtypes:
+        info = np.iinfo(dtype.lower())
+        if (info.min <= v_min) and (v_max <= info.max):
+            return series.astype(dtype)
+    
+    return series
+    # -------------------------------------------------------------------------/
+
+
+def compact_frame(df: pd.DataFrame, compact_dtype: dict[str, str]):
+    """
+    依 `compact_dtype` ({col_name: "category" | "string[pyarrow]" | "int"}) 轉換,
+    `df` 沒有的 column 略過; 回傳新的 DataFrame (數值不變, 只改變記憶體的表示方式)
+    """
+    df = df.copy(deep=False)
+    
+    for col_name, dtype in compact_dtype.items():
+        if col_name not in df.columns:
+            continue
+        if dtype == "int":
+            df[col_name] = downcast_int(df[col_name])
+        elif dtype == "string[pyarrow]":
+            df[col_name] = df[col_name].astype(dtype if has_pyarrow else "string")
+        else:
+            df[col_name] = df[col_name].astype(dtype)
+    
+    return df
+    # -------------------------------------------------------------------------/
+
+
+def show_memory_usage(before_df: pd.DataFrame, after_df: pd.DataFrame,
+                      title: str, console: Console):
+    """
+    每個 column 轉換前後的記憶體用量 (只列出有改變的 column 與合計)
+    """
+    before = before_df.memory_usage(index=False, deep=True)
+    after = after_df.memory_usage(index=False, deep=True)
+    
+    table = Table(title=f"記憶體用量 : {title}")
+    table.add_column("column")
+    table.add_column("dtype")
+    table.add_column("轉換前 (KB)", justify="right")
+    table.add_column("轉換後 (KB)", justify="right")
+    
+    for col_name in after_df.columns:
+        dtype = after_df[col_name].dtype
+        if before_df[col_name].dtype == dtype:
+            continue
+        if isinstance(dtype, pd.StringDtype):
+            dtype = f"string[{dtype.storage}]"
+        table.add_row(col_name, escape(str(dtype)),
+                      f"{before[col_name] / 1024:,.1f}", f"{after[col_name] / 1024:,.1f}")
+    table.add_row("[bold]合計", "", f"{before.sum() / 1024:,.1f}", f"{after.sum() / 1024:,.1f}")
+    
+    console.print(table)
+    # -------------------------------------------------------------------------/
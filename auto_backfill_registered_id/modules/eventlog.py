@@ -0,0 +1,115 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+# 處理紀錄的格式
+# - "rich" : 與 terminal 相同的文字紀錄 (`Console(record=True)` + `save_text`)
+# - "jsonl" : 每一本書一行 JSON, 直接寫入檔案; terminal 只顯示 warning, error 與進度
+log_modes = ("rich", "jsonl")
+
+
+def json_value(value):
+    """
+    pandas / numpy 的值轉成 JSON 可以使用的型態 (NA -> null)
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [json_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: json_value(v) for k, v in value.items()}
+    if pd.isna(value):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    
+    return str(value)
+    # -------------------------------------------------------------------------/
+
+
+def format_purc_sn(purc_sn):
+    """
+    """
+    return "----" if pd.isna(purc_sn) else f"{int(purc_sn):04}"
+    # -------------------------------------------------------------------------/
+
+
+class EventLog:
+    """
+    JSON Lines 處理紀錄, 每個事件直接寫入檔案 (不會保留在記憶體)
+    
+    - book : 每一本書的處理結果
+    - warning : 書名 / ISBN 不相等, 同時顯示在 terminal
+    - error : 停止處理的錯誤
+    - summary : 處理模式統計與合計
+    - profile : 效能分析 (見 `modules.profiling`, 處理完成後才加入)
+    """
+    def __init__(self, path: Path, console: Console):
+        """
+        """
+        self.path: Path = Path(path)
+        self.console: Console = console
+        self.file = open(self.path, mode="w", encoding="utf-8")
+        # ---------------------------------------------------------------------/
+    
+    
+    def __enter__(self):
+        """
+        """
+        return self
+        # ---------------------------------------------------------------------/
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        """
+        if exc_value is not None:
+            self.error(f"{exc_type.__name__}: {exc_value}")
+        self.close()
+        # ---------------------------------------------------------------------/
+    
+    
+    def write(self, event: str, **fields):
+        """
+        """
+        record = {"event": event}
+        record.update({k: json_value(v) for k, v in fields.items()})
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # ---------------------------------------------------------------------/
+    
+    
+    def book(self, purc_sn, isbn, bookname, handled_type: str, reg_ids=()):
+        """
+        """
+        self.write("book", 採購序號=purc_sn, ISBN=isbn, 書名=bookname,
+                   處理模式=handled_type, 登錄號=list(reg_ids))
+        # ---------------------------------------------------------------------/
+    
+    
+    def warning(self, msg: str, purc_sn=None, **fields):
+        """
+        """
+        self.console.print(f"[yellow]:warning: 採購序號 {format_purc_sn(purc_sn)} : {msg}")
+        self.write("warning", 採購序號=purc_sn, msg=msg, **fields)
+        # ---------------------------------------------------------------------/
+    
+    
+    def error(self, msg: str, purc_sn=None):
+        """
+        """
+        self.write("error", 採購序號=purc_sn, msg=msg)
+        # ---------------------------------------------------------------------/
+    
+    
+    def close(self):
+        """
+        """
+        if not self.file.closed:
+            self.file.close()
+        # ---------------------------------------------------------------------/
@@ -0,0 +1,180 @@
+import importlib.util
+import os
+import warnings
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from xml.etree import ElementTree
+
+import pandas as pd
+import rich.progress
+from rich.console import Console
+from rich.markup import escape
+
+from .cache import SheetCache, arrow_to_frame, frame_to_arrow, get_sheet_parts
+from .profiling import profiler
+from .reader import read_sheets
+from .utils import check_ws_header, load_cached_sheets
+# -----------------------------------------------------------------------------/
+
+# 沒有安裝 `pyarrow` 時, 解析結果直接以 pickle 傳回
+has_pyarrow: bool = importlib.util.find_spec("pyarrow") is not None
+
+
+def list_sheet_names(wb_path: Path):
+    """
+    不解析儲存格, 由 xlsx (zip) 的目錄取得工作表名稱 (依工作表順序), 失敗時回傳 None
+    """
+    try:
+        with zipfile.ZipFile(wb_path) as zf:
+            ws_parts, _ = get_sheet_parts(zf)
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        return None
+    
+    return list(ws_parts.keys())
+    # -------------------------------------------------------------------------/
+
+
+def to_ipc_bytes(table):
+    """
+    Arrow Table -> IPC stream (bytes), 傳回主 process 時不需要 pickle 每個 object
+    """
+    import pyarrow as pa
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    
+    return sink.getvalue().to_pybytes()
+    # -------------------------------------------------------------------------/
+
+
+def from_ipc_bytes(data: bytes):
+    """
+    """
+    import pyarrow as pa
+    
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+    # -------------------------------------------------------------------------/
+
+
+def split_sheets(ws_names: list[str], n_chunks: int):
+    """
+    依順序分成最多 `n_chunks` 段連續的工作表 (每個 worker 都要重新開啟 workbook,
+    工作表比 worker 多時, 同一個 worker 一次解析多個工作表)
+    """
+    n_chunks = max(1, min(n_chunks, len(ws_names)))
+    size, extra = divmod(len(ws_names), n_chunks)
+    
+    chunks: list[list[str]] = []
+    start = 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(ws_names[start:end])
+        start = end
+    
+    return chunks
+    # -------------------------------------------------------------------------/
+
+
+def parse_sheet_worker(wb_path: Path, backend: str, colidx: int,
+                       ws_dtype: dict[str, str], usecols: set, ws_names: list[str],
+                       key_cols: set = None, max_blank_rows: int = None):
+    """
+    在 worker process 解析 `ws_names` 的工作表 (None 時為全部的工作表)
+    
+    回傳 ([(ws_name, Arrow IPC bytes 或 DataFrame, 工作表上完整的 column names, 資料範圍)], 警告訊息),
+    無法轉成 Arrow 的工作表 (例如同一個 column 同時有數字和文字) 直接傳回 DataFrame
+    """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        with open(wb_path, "rb") as f:
+            parsed = read_sheets(f, backend, colidx, ws_dtype, usecols=usecols,
+                                 ws_names=ws_names, key_cols=key_cols,
+                                 max_blank_rows=max_blank_rows)
+    messages = [f"{w.category.__name__}: {w.message}" for w in caught]
+    
+    results: list[tuple] = []
+    for name, (ws_df, all_names, extent) in parsed.items():
+        payload = ws_df
+        if has_pyarrow:
+            import pyarrow as pa
+            try:
+                payload = to_ipc_bytes(frame_to_arrow(ws_df, all_names, extent))
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                messages.append(f"[工作表]'{name}' 無法轉成 Arrow, 改用 pickle 傳回 ({e})")
+        results.append((name, payload, all_names, extent))
+    
+    return results, messages
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def ingest_workbooks(jobs: list[dict], console: Console,
+                     backend: str = "openpyxl", cache: SheetCache = None,
+                     max_workers: int = None):
+    """
+    多個 workbook 的工作表同時在不同的 process 解析 (解析是 CPU-bound, 不受 GIL 限制)
+    
+    `jobs` : 每個 workbook 一個 dict, key 與 `read_wb` 的參數相同
+    (wb_path, ws_dtype, colidx, default_key, ws_names, usecols, key_cols, max_blank_rows)
+    
+    - 沒有修改過的工作表由快取讀取, 只有需要解析的工作表送到 worker
+    - 每個 workbook 最多分成 `max_workers` 段 (見 `split_sheets`)
+    - 結果依 `jobs` 與工作表的順序處理 (與 worker 完成的順序無關), 合併的順序固定
+    - worker 的警告與 `check_ws_header` 的訊息也依相同順序顯示在 `console`
+    
+    回傳每個 workbook 的 {ws_name: DataFrame} (與 `read_wb` 相同), 依 `jobs` 順序
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    plans: list[tuple] = []
+    tasks: list[tuple] = []
+    for i, job in enumerate(jobs):
+        wb_path = Path(job["wb_path"])
+        ws_dfs, cache_keys, parse_names = load_cached_sheets(
+            wb_path, job["ws_dtype"], job["colidx"], console,
+            ws_names=job.get("ws_names"), usecols=job.get("usecols"), cache=cache,
+            key_cols=job.get("key_cols"), max_blank_rows=job.get("max_blank_rows"))
+        if parse_names is None:
+            parse_names = list_sheet_names(wb_path)
+        # 無法取得工作表名稱時, 整個 workbook 由一個 worker 解析
+        chunks = [None] if parse_names is None else split_sheets(parse_names, max_workers)
+        for chunk in chunks:
+            if (chunk is None) or (len(chunk) > 0):
+                tasks.append((i, (wb_path, backend, job["colidx"], job["ws_dtype"],
+                                  job.get("usecols"), chunk,
+                                  job.get("key_cols"), job.get("max_blank_rows"))))
+        plans.append((ws_dfs, cache_keys))
+    
+    if len(tasks) > 0:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+            futures = [(i, pool.submit(parse_sheet_worker, *args)) for i, args in tasks]
+            with rich.progress.Progress(console=console, transient=True) as progress:
+                task_id = progress.add_task("解析工作表", total=len(futures))
+                for i, future in futures:
+                    results, messages = future.result()
+                    for message in messages:
+                        console.print(f":warning: Warning : {escape(message)}")
+                    ws_dfs, cache_keys = plans[i]
+                    for ws_name, payload, all_names, extent in results:
+                        if isinstance(payload, bytes):
+                            table = from_ipc_bytes(payload)
+                            ws_dfs[ws_name] = arrow_to_frame(table)
+                            if ws_name in cache_keys:
+                                cache.save_table(cache_keys[ws_name], table)
+                        else:
+                            ws_dfs[ws_name] = (payload, all_names, extent)
+                            if ws_name in cache_keys:
+                                cache.save(cache_keys[ws_name], payload, all_names, extent)
+                    progress.advance(task_id)
+    
+    wb_dfs_list: list[dict[str, pd.DataFrame]] = []
+    for job, (ws_dfs, _) in zip(jobs, plans):
+        wb_dfs: dict[str, pd.DataFrame] = {}
+        for ws_name, (ws_df, all_names, extent) in ws_dfs.items():
+            check_ws_header(ws_df, ws_name, job["default_key"], console,
+                            current_key=set(all_names), extent=extent)
+            wb_dfs[ws_name] = ws_df
+        wb_dfs_list.append(wb_dfs)
+    
+    return wb_dfs_list
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,244 @@
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+# 書名 n-gram 的長度 (中文書名通常很短, 使用 2-gram)
+ngram_size: int = 2
+
+# 出現在超過這個比例書名中的 n-gram 不使用 (例如 "之" "的"), 避免候選數量過多
+ngram_max_df: float = 0.2
+
+# 比對候選清單的 columns
+candidate_colnames: list[str] = [
+    "原序號", "箱號", "登錄號", "書目", "ISBN",
+    "候選排名", "候選 採購序號", "候選 書名", "候選 ISBN", "分數", "依據",
+]
+
+
+def canonical_isbn(value, strict: bool = False):
+    """
+    ISBN-10 / ISBN-13 統一成 ISBN-13 文字, 無法辨識時回傳 None
+    
+    檢查碼錯誤時: `strict=True` 回傳 None, 否則回傳去除符號後的 13 (或 10) 碼,
+    讓打錯檢查碼的 ISBN 仍然可以和相同的錯誤值比對
+    
+    - 移除 "-", 空白, "ISBN" 等文字
+    - Excel 轉成數字的 ISBN (例如 9789571234567.0, 9.789571234567E+12)
+    
+    由小數 / 科學記號轉換的值無法確定原本的每一碼, 一律檢查檢查碼;
+    文字型態的科學記號有效位數不足 (例如 "9.78957E+12") 時回傳 None
+    """
+    if pd.isna(value):
+        return None
+    
+    if isinstance(value, (int, np.integer)):
+        text = str(int(value))
+    elif isinstance(value, (float, np.floating)):
+        if not float(value).is_integer():
+            return None
+        text = str(int(value))
+        strict = True
+    else:
+        text = unicodedata.normalize("NFKC", str(value)).upper()
+        # 文字型態的科學記號 / 小數 (由數字轉成文字時產生)
+        if re.fullmatch(r"\d+(\.\d+)?(E\+?\d+)?", text) and (("." in text) or ("E" in text)):
+            number = float(text)
+            if not number.is_integer():
+                return None
+            mantissa = text.split("E")[0].replace(".", "").lstrip("0")
+            text = str(int(number))
+            if len(mantissa) < len(text):
+                return None
+            strict = True
+        text = re.sub(r"[^0-9X]", "", text)
+    
+    # ISBN-10 (最後一碼可能是 X)
+    if (len(text) == 10) and text[:9].isdigit():
+        total = sum((10 - i) * int(d) for i, d in enumerate(text[:9]))
+        check = (11 - total % 11) % 11
+        if text[9] != ("X" if check == 10 else str(check)):
+            return None if strict else text
+        text = "978" + text[:9]
+        return text + isbn13_check_digit(text)
+    
+    # ISBN-13
+    if (len(text) == 13) and text.isdigit():
+        if strict and (text[12] != isbn13_check_digit(text[:12])):
+            return None
+        return text
+    
+    return None
+    # -------------------------------------------------------------------------/
+
+
+def isbn13_check_digit(digits: str):
+    """
+    """
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits[:12]))
+    
+    return str((10 - total % 10) % 10)
+    # -------------------------------------------------------------------------/
+
+
+def canonicalize_isbn(series: pd.Series):
+    """
+    `canonical_isbn` 的 Series 版本, 每個不同的值只計算一次
+    """
+    uniques = series.dropna().unique()
+    mapping = {v: canonical_isbn(v) for v in uniques}
+    
+    return series.map(mapping).astype("string")
+    # -------------------------------------------------------------------------/
+
+
+def normalize_title(title):
+    """
+    比對用的書名: 只取 "/" 之前 (與 '書目' 的比對規則相同), 全形轉半形, 小寫, 移除空白與標點
+    """
+    if pd.isna(title):
+        return ""
+    
+    title = unicodedata.normalize("NFKC", str(title)).split("/")[0].lower()
+    
+    return "".join(ch for ch in title
+                   if unicodedata.category(ch)[0] in ("L", "N"))
+    # -------------------------------------------------------------------------/
+
+
+def get_ngrams(text: str, n: int = ngram_size):
+    """
+    """
+    if len(text) < n:
+        return {text} if text else set()
+    
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+    # -------------------------------------------------------------------------/
+
+
+class TitleIndex:
+    """
+    '交貨清單' 書名的 n-gram inverted index (n-gram -> row positions)
+    
+    查詢時只需要看查詢書名的 n-gram 對應到的列, 不用和每一列比較
+    """
+    def __init__(self, titles: pd.Series, n: int = ngram_size,
+                 max_df: float = ngram_max_df):
+        """
+        """
+        self.n: int = n
+        self.grams: list[set] = [get_ngrams(normalize_title(t), n) for t in titles]
+        
+        postings: dict[str, list[int]] = {}
+        for pos, grams in enumerate(self.grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(pos)
+        
+        max_len = max(1, int(len(self.grams) * max_df))
+        self.postings: dict[str, np.ndarray] = {
+            gram: np.array(pos, dtype=np.intp)
+            for gram, pos in postings.items() if len(pos) <= max_len
+        }
+        # ---------------------------------------------------------------------/
+    
+    
+    def similarity(self, pos: int, query_grams: set):
+        """
+        Dice 係數
+        """
+        n_total = len(query_grams) + len(self.grams[pos])
+        if n_total == 0:
+            return 0.0
+        
+        return 2 * len(query_grams & self.grams[pos]) / n_total
+        # ---------------------------------------------------------------------/
+    
+    
+    def query(self, title, top_k: int = 3, min_score: float = 0.3):
+        """
+        回傳 [(row position, Dice 係數)], 依分數由高到低
+        """
+        query_grams = get_ngrams(normalize_title(title), self.n)
+        if len(query_grams) == 0:
+            return []
+        
+        shared = Counter()
+        for gram in query_grams:
+            pos = self.postings.get(gram)
+            if pos is not None:
+                shared.update(pos.tolist())
+        
+        # 常見的 n-gram 不在 `postings` 中, 分數以完整的 n-gram 計算
+        scores = []
+        for pos in shared:
+            score = self.similarity(pos, query_grams)
+            if score >= min_score:
+                scores.append((pos, score))
+        scores.sort(key=lambda x: (-x[1], x[0]))
+        
+        return scores[:top_k]
+        # ---------------------------------------------------------------------/
+
+
+def propose_candidates(purc_df: pd.DataFrame, purchasing_colalias: dict,
+                       cata_df: pd.DataFrame, catalog_colalias: dict,
+                       console: Console, top_k: int = 3, min_score: float = 0.3):
+    """
+    替每一筆沒有對應到的 '編目箱單' (`cata_df`) 在 '交貨清單' (`purc_df`) 中找出候選
+    
+    - ISBN (統一成 ISBN-13 後) 相同 : +0.5
+    - 書名 n-gram 相似度 (Dice) : × 0.5
+    
+    回傳候選清單 (`candidate_colnames`), 沒有候選的 '編目箱單' 也會列出 (候選欄位空白)
+    """
+    purc_sn = purc_df[purchasing_colalias["採購序號"]].to_numpy()
+    purc_title = purc_df[purchasing_colalias["書名"]].to_numpy()
+    purc_isbn_raw = purc_df[purchasing_colalias["ISBN"]].to_numpy()
+    purc_isbn = canonicalize_isbn(purc_df[purchasing_colalias["ISBN"]])
+    
+    # ISBN -> row positions
+    isbn_index: dict[str, list[int]] = {}
+    for pos, isbn in enumerate(purc_isbn):
+        if not pd.isna(isbn):
+            isbn_index.setdefault(isbn, []).append(pos)
+    title_index = TitleIndex(purc_df[purchasing_colalias["書名"]])
+    
+    cata_isbn = canonicalize_isbn(cata_df[catalog_colalias["ISBN"]]).to_numpy()
+    cata_cols = [catalog_colalias["採購序號"], "箱號", "登錄號",
+                 catalog_colalias["書名"], catalog_colalias["ISBN"]]
+    
+    records = []
+    for cata_row, isbn in zip(cata_df[cata_cols].itertuples(index=False, name=None),
+                              cata_isbn):
+        title = cata_row[3]
+        title_scores = dict(title_index.query(title, top_k=top_k * 3, min_score=min_score))
+        isbn_pos = set() if pd.isna(isbn) else set(isbn_index.get(isbn, []))
+        
+        scored = []
+        for pos in set(title_scores) | isbn_pos:
+            title_score = title_scores.get(pos)
+            if title_score is None:
+                # 只有 ISBN 相同時, 書名相似度另外計算
+                title_score = title_index.similarity(pos, get_ngrams(normalize_title(title),
+                                                                     title_index.n))
+            reason = "+".join([r for r, ok in (("ISBN", pos in isbn_pos),
+                                               ("書名", title_score >= min_score)) if ok])
+            scored.append((pos, 0.5 * (pos in isbn_pos) + 0.5 * title_score, reason))
+        scored.sort(key=lambda x: (-x[1], x[0]))
+        
+        if len(scored) == 0:
+            records.append(list(cata_row) + [None] * 6)
+        for rank, (pos, score, reason) in enumerate(scored[:top_k], start=1):
+            records.append(list(cata_row) + [rank, purc_sn[pos], purc_title[pos],
+                                             purc_isbn_raw[pos], round(score, 3), reason])
+    
+    candidate_df = pd.DataFrame(records, columns=candidate_colnames)
+    n_found = candidate_df.loc[candidate_df["候選排名"] == 1].shape[0]
+    console.print(f"'編目箱單' 沒有對應的資料 : {len(cata_df)} 筆, 找到候選 : {n_found} 筆")
+    
+    return candidate_df
+    # -------------------------------------------------------------------------/
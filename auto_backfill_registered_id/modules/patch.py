@@ -0,0 +1,682 @@
+import re
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+import pandas as pd
+from openpyxl.formula.tokenizer import Token, Tokenizer
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import to_excel
+from rich.console import Console
+
+from .cache import get_sheet_parts, read_shared_strings, xlsx_ns
+from .schema import cata_rp2_purc, purchasing_colalias, purchasing_wsname
+# -----------------------------------------------------------------------------/
+
+# 修改清單的欄位 ('列' 為修改後的列, '原始列' 為原本 '交貨清單' 的列, 插入的列為空白)
+patch_colnames: list[str] = ["動作", "列", "原始列", "欄", "欄位", "原本", "修改後", "採購序號"]
+
+# 在前幾列中尋找標題列 (有 '採購序號' 的列)
+header_search_rows: int = 20
+
+# 公式中的儲存格 / 範圍 ("A5", "$O$4:O1003") 與整列範圍 ("3:4")
+cell_ref_re = re.compile(r"(\$?[A-Za-z]{1,3}\$?)(\d+)")
+range_ref_re = re.compile(r"\$?[A-Za-z]{1,3}\$?\d+(:\$?[A-Za-z]{1,3}\$?\d+)?")
+row_range_re = re.compile(r"(\$?)(\d+):(\$?)(\d+)")
+
+# 工作表 XML 的元素 (namespace prefix 通常為空白, 部分程式會寫成 "x:")
+sheet_data_re = re.compile(r"<(\w+:|)sheetData\b[^>]*?(/>|>)")
+ref_attr_re = re.compile(r'(?<=\s)(ref|sqref|activeCell|topLeftCell)="([^"]*)"')
+xml_entities: dict[str, str] = {"&quot;": '"', "&apos;": "'"}
+
+
+def to_cell_value(value):
+    """
+    pandas / numpy 的值轉成寫入儲存格的值 (NA -> None)
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if pd.isna(value):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    
+    return value
+    # -------------------------------------------------------------------------/
+
+
+def is_same_value(old, new):
+    """
+    儲存格原本的值與回填的值是否相同 (數字與文字依顯示的內容比較, 例如 2020 與 "2020")
+    """
+    if isinstance(old, str) and (old.strip() == ""):
+        old = None
+    if (old is None) or (new is None):
+        return (old is None) and (new is None)
+    
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return float(old) == float(new)
+    
+    def to_text(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+    
+    return to_text(old) == to_text(new)
+    # -------------------------------------------------------------------------/
+
+
+def get_row_mapper(insert_counts: dict[int, int]):
+    """
+    原本的列 -> 插入之後的列 (`insert_counts` : {原本的列: 之後插入的列數})
+    """
+    anchors = np.array(sorted(insert_counts), dtype=np.int64)
+    cum_counts = np.cumsum([insert_counts[a] for a in anchors], dtype=np.int64)
+    
+    def map_row(row: int):
+        n = np.searchsorted(anchors, row, side="left")
+        return row + (int(cum_counts[n - 1]) if n > 0 else 0)
+    
+    return map_row
+    # -------------------------------------------------------------------------/
+
+
+def shift_formula(formula: str, map_row, ws_title: str, on_ws: bool):
+    """
+    與 Excel 插入列相同, 公式中指到 `ws_title` 的列號改成插入之後的列
+    (範圍內插入的列會被包含, 例如 =SUM(O4:O1003) -> =SUM(O4:O1590))
+    
+    `on_ws` : 公式是否在 `ws_title` 工作表上 (沒有工作表名稱的參照才需要修改)
+    """
+    tokenizer = Tokenizer(formula)
+    is_changed = False
+    for token in tokenizer.items:
+        if (token.type != Token.OPERAND) or (token.subtype != Token.RANGE):
+            continue
+        sheet, sep, ref = token.value.rpartition("!")
+        if sep and (sheet.strip("'").replace("''", "'") != ws_title):
+            continue
+        if (not sep) and (not on_ws):
+            continue
+        
+        if row_range_re.fullmatch(ref):
+            m = row_range_re.fullmatch(ref)
+            new_ref = f"{m[1]}{map_row(int(m[2]))}:{m[3]}{map_row(int(m[4]))}"
+        elif range_ref_re.fullmatch(ref):
+            new_ref = cell_ref_re.sub(lambda m: f"{m[1]}{map_row(int(m[2]))}", ref)
+        else:
+            # 整欄 ("A:A") 或名稱
+            continue
+        if new_ref != ref:
+            token.value = f"{sheet}{sep}{new_ref}"
+            is_changed = True
+    
+    return tokenizer.render() if is_changed else formula
+    # -------------------------------------------------------------------------/
+
+
+def get_target_colnames(columns: pd.Index):
+    """
+    回填會改變的 '交貨清單' 欄位 (`cata_rp2_purc`, '部冊號' 加在 '書名', '套書' 標記在 '登錄號')
+    """
+    colnames = ["書名", "登錄號"]
+    for k in cata_rp2_purc.keys():
+        if k == "部冊號":
+            continue
+        colnames.append(k if k in columns else purchasing_colalias[k])
+    
+    return list(dict.fromkeys(colnames))
+    # -------------------------------------------------------------------------/
+
+
+def read_sheet_values(ws_xml: str, shared_strings: list[str]):
+    """
+    直接由工作表 XML 讀取儲存格的值 (與 openpyxl 相同: 公式為 "=..." 文字, 日期為數字),
+    回傳每一列的 tuple, 列號與 XML 的 `r` 相同 (空白列為空的 tuple)
+    """
+    ns = f"{{{xlsx_ns['main']}}}"
+    root = ElementTree.fromstring(ws_xml)
+    
+    rows: dict[int, dict[int, object]] = {}
+    row = 0
+    for row_el in root.iter(f"{ns}row"):
+        row = int(row_el.get("r") or row + 1)
+        values: dict[int, object] = {}
+        col = 0
+        for c in row_el.iterfind(f"{ns}c"):
+            ref = c.get("r")
+            col = column_index_from_string(ref.rstrip("0123456789")) if ref else col + 1
+            f = c.find(f"{ns}f")
+            if f is not None:
+                # 共用公式的其他儲存格沒有文字, 只標記為公式
+                values[col] = f"={f.text or ''}"
+                continue
+            
+            t = c.get("t", "n")
+            if t == "inlineStr":
+                values[col] = "".join(el.text or "" for el in c.iter(f"{ns}t"))
+                continue
+            v = c.find(f"{ns}v")
+            if (v is None) or (v.text is None):
+                continue
+            if t == "s":
+                values[col] = shared_strings[int(v.text)]
+            elif t == "b":
+                values[col] = v.text == "1"
+            elif t in ("str", "e"):
+                values[col] = v.text
+            elif any(ch in v.text for ch in ".eE"):
+                values[col] = float(v.text)
+            else:
+                values[col] = int(v.text)
+        rows[row] = values
+    
+    max_row = max(rows.keys(), default=0)
+    max_col = max((max(values.keys(), default=0) for values in rows.values()), default=0)
+    
+    return [tuple(rows.get(row, {}).get(col) for col in range(1, max_col + 1))
+            for row in range(1, max_row + 1)]
+    # -------------------------------------------------------------------------/
+
+
+class SheetLayout:
+    """
+    原本 '交貨清單' 工作表的位置資訊 (只讀取一次儲存格的值)
+    
+    - colidx : {col_name: column (1-based)}
+    - sn_rows : {採購序號: row (1-based)}
+    - last_row : 最後一筆有 '採購序號' 的列
+    - total_row : 資料之後 '書名' 為 "合計" 的列, 沒有時為 None
+    """
+    def __init__(self, rows: list[tuple], ws_title: str):
+        """
+        `rows` : `read_sheet_values` 的結果
+        """
+        self.rows: list[tuple] = rows
+        
+        header_row = None
+        for row, values in enumerate(self.rows[:header_search_rows], start=1):
+            if purchasing_colalias["採購序號"] in values:
+                header_row = row
+                break
+        if header_row is None:
+            raise ValueError(f"[工作表]'{ws_title}' 找不到 '{purchasing_colalias['採購序號']}' 的標題列")
+        
+        self.colidx: dict[str, int] = {}
+        for col, value in enumerate(self.rows[header_row - 1], start=1):
+            if (value is not None) and (str(value) not in self.colidx):
+                self.colidx[str(value)] = col
+        
+        sn_col = self.colidx[purchasing_colalias["採購序號"]]
+        self.sn_rows: dict[int, int] = {}
+        for row in range(header_row + 1, len(self.rows) + 1):
+            purc_sn = self.get(row, sn_col)
+            if (purc_sn is None) or (str(purc_sn).strip() == ""):
+                continue
+            try:
+                purc_sn = int(purc_sn)
+            except (TypeError, ValueError):
+                continue
+            if purc_sn in self.sn_rows:
+                raise ValueError(f"'採購序號' 重複 : {purc_sn:04} (第 {self.sn_rows[purc_sn]}, {row} 列)")
+            self.sn_rows[purc_sn] = row
+        self.last_row: int = max(self.sn_rows.values(), default=header_row)
+        
+        self.total_row: int = None
+        title_col = self.colidx.get("書名")
+        for row in range(self.last_row + 1, len(self.rows) + 1):
+            value = self.get(row, title_col)
+            if isinstance(value, str) and (value.strip() == "合計"):
+                self.total_row = row
+                break
+        # ---------------------------------------------------------------------/
+    
+    
+    def get(self, row: int, col: int):
+        """
+        第 `row` 列第 `col` 欄 (1-based) 的值, 超出該列的範圍 (空白儲存格) 時回傳 None
+        """
+        values = self.rows[row - 1]
+        
+        return values[col - 1] if col <= len(values) else None
+        # ---------------------------------------------------------------------/
+
+
+def compute_patch(new_df: pd.DataFrame, layout: SheetLayout):
+    """
+    `new_df` : `report_backfill` 的結果 (最後一列為合計)
+    
+    - 對應到原本的列 ('index' 不是 NA) : 只比較回填會改變的欄位, 不同才修改
+    - 套書的每一冊, 副本的第二本之後 : 插入在前一個對應到原本的列之後
+    - 合計 : 已經有 "合計" 列時修改 '總冊數', '小計', 否則插入在最後一筆資料之後
+    
+    回傳 (修改清單 DataFrame, {原本的列: 之後插入的列數})
+    """
+    target_colnames = get_target_colnames(new_df.columns)
+    missing = [c for c in target_colnames + ["總冊數", "小計"] if c not in layout.colidx]
+    if len(missing) > 0:
+        raise ValueError(f"'交貨清單' 沒有這些欄位, 無法修改 : {missing}")
+    
+    data_df = new_df.iloc[:-1]
+    total = new_df.iloc[-1]
+    write_colnames = [c for c in data_df.columns if (c != "index") and (c in layout.colidx)]
+    
+    edits: list[dict] = []
+    inserted: dict[int, list[dict]] = {}
+    anchor_row: int = None
+    for record in data_df.loc[:, write_colnames + ["index"]].to_dict("records"):
+        purc_sn = to_cell_value(record[purchasing_colalias["採購序號"]])
+        if not pd.isna(record["index"]):
+            anchor_row = layout.sn_rows.get(purc_sn)
+            if anchor_row is None:
+                raise ValueError(f"'交貨清單' 找不到 '採購序號' : {purc_sn}")
+            for col_name in target_colnames:
+                old = layout.get(anchor_row, layout.colidx[col_name])
+                new = to_cell_value(record[col_name])
+                if not is_same_value(old, new):
+                    edits.append({"動作": "修改", "原始列": anchor_row, "欄位": col_name,
+                                  "原本": old, "修改後": new, "採購序號": purc_sn})
+            continue
+        
+        values = {col_name: to_cell_value(record[col_name]) for col_name in write_colnames}
+        inserted.setdefault(anchor_row, []).append(
+            {"動作": "插入", "values": values, "採購序號": purc_sn})
+    
+    # 合計
+    total_values = {"書名": "合計",
+                    "總冊數": to_cell_value(total["總冊數"]),
+                    "小計": to_cell_value(total["小計"])}
+    if layout.total_row is not None:
+        for col_name in ["總冊數", "小計"]:
+            old = layout.get(layout.total_row, layout.colidx[col_name])
+            if isinstance(old, str) and old.startswith("="):
+                # 保留公式 (插入的列不在公式的範圍內時, 需要手動調整)
+                continue
+            if not is_same_value(old, total_values[col_name]):
+                edits.append({"動作": "合計", "原始列": layout.total_row, "欄位": col_name,
+                              "原本": old, "修改後": total_values[col_name], "採購序號": None})
+    else:
+        inserted.setdefault(layout.last_row, []).append(
+            {"動作": "合計", "values": total_values, "採購序號": None})
+    
+    # 修改後的列
+    insert_counts = {row: len(rows) for row, rows in sorted(inserted.items())}
+    map_row = get_row_mapper(insert_counts)
+    
+    diff_rows: list[dict] = []
+    for edit in edits:
+        col = layout.colidx[edit["欄位"]]
+        diff_rows.append({**edit, "列": map_row(edit["原始列"]),
+                          "欄": get_column_letter(col)})
+    for row, rows in inserted.items():
+        new_row = map_row(row)
+        for insert in rows:
+            new_row += 1
+            for col_name, value in insert["values"].items():
+                if value is None:
+                    continue
+                diff_rows.append({"動作": insert["動作"], "列": new_row, "原始列": None,
+                                  "欄": get_column_letter(layout.colidx[col_name]),
+                                  "欄位": col_name, "原本": None, "修改後": value,
+                                  "採購序號": insert["採購序號"]})
+    
+    diff_df = pd.DataFrame(diff_rows, columns=patch_colnames)
+    diff_df["原始列"] = diff_df["原始列"].astype("Int64")
+    diff_df["採購序號"] = diff_df["採購序號"].astype("Int64")
+    # 依修改後的位置排序 (同一列依 column 順序)
+    sort_key = diff_df["列"] * (len(layout.colidx) + 1) + diff_df["欄位"].map(layout.colidx)
+    diff_df = diff_df.iloc[np.argsort(sort_key.to_numpy(), kind="stable")]
+    
+    return diff_df.reset_index(drop=True), insert_counts
+    # -------------------------------------------------------------------------/
+
+
+@lru_cache(maxsize=None)
+def get_attr_re(name: str):
+    """
+    XML 屬性 `name="..."` 的 regex (不包含有 prefix 的同名屬性, 例如 "xr:uid")
+    """
+    return re.compile(rf'(?<![\w:]){name}="([^"]*)"')
+    # -------------------------------------------------------------------------/
+
+
+def get_attr(attrs: str, name: str):
+    """
+    XML 開始標籤的屬性值, 沒有時回傳 None
+    """
+    m = get_attr_re(name).search(attrs)
+    
+    return None if m is None else m[1]
+    # -------------------------------------------------------------------------/
+
+
+def set_attr(attrs: str, name: str, value: str):
+    """
+    修改 / 加入屬性, `value=None` 時移除
+    """
+    attr_re = get_attr_re(name)
+    m = attr_re.search(attrs)
+    if m is None:
+        return attrs if value is None else f' {name}="{value}"{attrs}'
+    if value is None:
+        return attrs[:m.start()].rstrip() + attrs[m.end():]
+    
+    return f'{attrs[:m.start()]}{name}="{value}"{attrs[m.end():]}'
+    # -------------------------------------------------------------------------/
+
+
+def shift_ref(ref: str, map_row):
+    """
+    儲存格 / 範圍清單 ("A5", "A1:Y1003 B7") 的列號改成插入之後的列
+    """
+    return " ".join(cell_ref_re.sub(lambda m: f"{m[1]}{map_row(int(m[2]))}", part)
+                    for part in ref.split())
+    # -------------------------------------------------------------------------/
+
+
+def shift_xml_formulas(xml: str, prefix: str, map_row, ws_title: str, on_ws: bool):
+    """
+    XML 中的公式 (`<f>`, 以及設定格式化的條件 / 資料驗證的 `<formula>`) 套用 `shift_formula`,
+    沒有改變的公式保留原本的文字
+    """
+    def shift_text(text: str):
+        formula = unescape(text, xml_entities)
+        new_formula = shift_formula(f"={formula}", map_row, ws_title, on_ws)[1:]
+        return text if new_formula == formula else escape(new_formula)
+    
+    def repl_f(m: re.Match):
+        attrs, text = m[1], m[2]
+        if on_ws and (get_attr(attrs, "ref") is not None):
+            attrs = set_attr(attrs, "ref", shift_ref(get_attr(attrs, "ref"), map_row))
+        if text is None:
+            return f"<{prefix}f{attrs}/>"
+        return f"<{prefix}f{attrs}>{shift_text(text)}</{prefix}f>"
+    
+    xml = re.sub(rf"<{prefix}f\b([^>]*?)(?:/>|>(.*?)</{prefix}f>)", repl_f, xml, flags=re.S)
+    xml = re.sub(rf"<({prefix}formula[12]?)>(.*?)</\1>",
+                 lambda m: f"<{m[1]}>{shift_text(m[2])}</{m[1]}>", xml, flags=re.S)
+    
+    return xml
+    # -------------------------------------------------------------------------/
+
+
+def make_cell_xml(prefix: str, ref: str, style: str, value):
+    """
+    新的儲存格 (`<c>`), 文字寫成 inline string, 不修改 sharedStrings
+    """
+    attrs = f' r="{ref}"' if style is None else f' r="{ref}" s="{style}"'
+    if value is None:
+        return f"<{prefix}c{attrs}/>"
+    
+    if isinstance(value, (datetime, date, time)):
+        value = to_excel(value)
+    if isinstance(value, bool):
+        return f'<{prefix}c{attrs} t="b"><{prefix}v>{int(value)}</{prefix}v></{prefix}c>'
+    if isinstance(value, (int, float)):
+        return f"<{prefix}c{attrs}><{prefix}v>{value!r}</{prefix}v></{prefix}c>"
+    
+    text = escape(str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    
+    return (f'<{prefix}c{attrs} t="inlineStr"><{prefix}is>'
+            f"<{prefix}t{space}>{text}</{prefix}t></{prefix}is></{prefix}c>")
+    # -------------------------------------------------------------------------/
+
+
+def patch_sheet_xml(xml: str, ws_title: str, diff_df: pd.DataFrame,
+                    insert_counts: dict[int, int]):
+    """
+    只改寫 `<sheetData>` 中需要改變的列, 其他列原樣保留:
+    
+    - 修改 : 取代原本的儲存格 (保留格式 `s`)
+    - 移動 : 原本的列改成插入之後的列號, 公式與合併儲存格等範圍的參照跟著調整 (`shift_formula`)
+    - 插入 : 接在 anchor 之後, 列與儲存格格式複製 anchor (不複製值與公式)
+    
+    共用公式 (shared formula) 參照其他列且中間有插入時, 結果可能與 Excel 不同
+    """
+    m = sheet_data_re.search(xml)
+    if (m is None) or (m[2] == "/>"):
+        raise ValueError(f"[工作表]'{ws_title}' 沒有資料")
+    p = m[1]
+    body_start = m.end()
+    body_end = xml.index(f"</{p}sheetData>", body_start)
+    head, body, tail = xml[:body_start], xml[body_start:body_end], xml[body_end:]
+    
+    map_row = get_row_mapper(insert_counts)
+    edits: dict[int, dict[int, object]] = {}
+    inserts: dict[int, dict[int, object]] = {}
+    for row, orig_row, col, value in diff_df.loc[:, ["列", "原始列", "欄", "修改後"]].itertuples(index=False):
+        col = column_index_from_string(col)
+        if pd.isna(orig_row):
+            inserts.setdefault(int(row), {})[col] = to_cell_value(value)
+        else:
+            edits.setdefault(int(orig_row), {})[col] = to_cell_value(value)
+    
+    # 欄的預設格式 (原本沒有的儲存格使用)
+    col_styles: dict[int, str] = {}
+    for cm in re.finditer(rf"<{p}col\b([^>]*?)/?>", head):
+        style = get_attr(cm[1], "style")
+        if style is not None:
+            for col in range(int(get_attr(cm[1], "min")), int(get_attr(cm[1], "max")) + 1):
+                col_styles[col] = style
+    
+    cell_re = re.compile(rf"<{p}c\b([^>]*?)(?:/>|>(.*?)</{p}c>)", re.S)
+    cell_ref_attr_re = re.compile(rf'(<{p}c\b[^>]*?(?<![\w:])r="[A-Za-z]+)\d+"')
+    
+    def rebuild_row(attrs: str, inner: str, new_row: int, row_edits: dict):
+        row_style = get_attr(attrs, "s") if get_attr(attrs, "customFormat") in ("1", "true") else None
+        cells: dict[int, str] = {}
+        styles: dict[int, str] = {}
+        col = 0
+        for cm in cell_re.finditer(inner or ""):
+            c_attrs, c_inner = cm[1], cm[2]
+            ref = get_attr(c_attrs, "r")
+            col = column_index_from_string(re.match(r"[A-Za-z]+", ref)[0]) if ref else col + 1
+            cell_ref = f"{get_column_letter(col)}{new_row}"
+            style = get_attr(c_attrs, "s")
+            if style is not None:
+                styles[col] = style
+            if col in row_edits:
+                cells[col] = make_cell_xml(p, cell_ref, style, row_edits.pop(col))
+                continue
+            c_attrs = set_attr(c_attrs, "r", cell_ref)
+            if c_inner is None:
+                cells[col] = f"<{p}c{c_attrs}/>"
+            else:
+                if f"<{p}f" in c_inner:
+                    c_inner = shift_xml_formulas(c_inner, p, map_row, ws_title, True)
+                cells[col] = f"<{p}c{c_attrs}>{c_inner}</{p}c>"
+        for col, value in row_edits.items():
+            cells[col] = make_cell_xml(p, f"{get_column_letter(col)}{new_row}",
+                                       row_style or col_styles.get(col), value)
+        
+        attrs = set_attr(set_attr(attrs, "r", str(new_row)), "spans", None)
+        cells_xml = "".join(cells[col] for col in sorted(cells))
+        
+        return f"<{p}row{attrs}>{cells_xml}</{p}row>", styles
+    
+    out: list[str] = []
+    pos, row, max_row = 0, 0, 0
+    for rm in re.finditer(rf"<{p}row\b([^>]*?)(?:/>|>(.*?)</{p}row>)", body, flags=re.S):
+        out.append(body[pos:rm.start()])
+        pos = rm.end()
+        attrs, inner = rm[1], rm[2]
+        r = get_attr(attrs, "r")
+        row = int(r) if r is not None else row + 1
+        new_row = map_row(row)
+        row_edits = edits.pop(row, {})
+        
+        n_insert = insert_counts.get(row, 0)
+        max_row = max(max_row, new_row)
+        if ((r is not None) and (len(row_edits) == 0) and (n_insert == 0)
+                and ((inner is None) or (f"<{p}f" not in inner))):
+            if new_row == row:
+                out.append(rm[0])
+            else:
+                # 只移動 : 列號與儲存格的 `r`
+                attrs = set_attr(attrs, "r", str(new_row))
+                inner = "" if inner is None else cell_ref_attr_re.sub(rf'\g<1>{new_row}"', inner)
+                out.append(f"<{p}row{attrs}>{inner}</{p}row>")
+            continue
+        
+        row_xml, styles = rebuild_row(attrs, inner, new_row, row_edits)
+        out.append(row_xml)
+        
+        # 插入的列
+        insert_attrs = set_attr(set_attr(attrs, "r", None), "spans", None)
+        for new_row in range(new_row + 1, new_row + n_insert + 1):
+            values = inserts.pop(new_row, {})
+            cells_xml = "".join(
+                make_cell_xml(p, f"{get_column_letter(col)}{new_row}", styles.get(col), values.get(col))
+                for col in sorted(styles.keys() | values.keys()))
+            out.append(f'<{p}row r="{new_row}"{insert_attrs}>{cells_xml}</{p}row>')
+            max_row = max(max_row, new_row)
+    out.append(body[pos:])
+    
+    if (len(edits) > 0) or (len(inserts) > 0):
+        raise ValueError(f"[工作表]'{ws_title}' 找不到要修改的列 : "
+                         f"{sorted(edits.keys() | inserts.keys())[:10]}")
+    
+    if len(insert_counts) > 0:
+        head = ref_attr_re.sub(lambda m: f'{m[1]}="{shift_ref(m[2], map_row)}"', head)
+        tail = ref_attr_re.sub(lambda m: f'{m[1]}="{shift_ref(m[2], map_row)}"', tail)
+        tail = shift_xml_formulas(tail, p, map_row, ws_title, True)
+        
+        # 工作表範圍包含最後插入的列
+        def repl_dim(m: re.Match):
+            start, sep, end = m[2].partition(":")
+            if not sep:
+                return m[0]
+            end_col = re.match(r"[A-Za-z]*", end)[0]
+            return f"{m[1]}{start}:{end_col}{max(max_row, int(end[len(end_col):] or 0))}{m[3]}"
+        
+        head = re.sub(rf'(<{p}dimension\b[^>]*?\bref=")([^"]*)(")', repl_dim, head)
+    
+    return f"{head}{''.join(out)}{tail}"
+    # -------------------------------------------------------------------------/
+
+
+def patch_workbook_xml(wb_xml: str, map_row, ws_title: str):
+    """
+    workbook.xml : 名稱 (例如列印範圍) 的參照跟著插入的列調整,
+    並設定開啟時重新計算 (公式的快取值不會由這裡更新)
+    """
+    def repl_name(m: re.Match):
+        formula = unescape(m[2], xml_entities)
+        new_formula = shift_formula(f"={formula}", map_row, ws_title, False)[1:]
+        return m[0] if new_formula == formula else f"{m[1]}{escape(new_formula)}{m[3]}"
+    
+    wb_xml = re.sub(r"(<(?:\w+:)?definedName\b[^>]*>)(.*?)(</(?:\w+:)?definedName>)",
+                    repl_name, wb_xml, flags=re.S)
+    
+    p = re.search(r"<(\w+:|)workbook\b", wb_xml)[1]
+    m = re.search(rf"<{p}calcPr\b([^>]*?)(?:/>|>\s*</{p}calcPr>)", wb_xml)
+    if m is not None:
+        attrs = set_attr(m[1], "fullCalcOnLoad", "1")
+        return f"{wb_xml[:m.start()]}<{p}calcPr{attrs}/>{wb_xml[m.end():]}"
+    
+    # calcPr 在 sheets, functionGroups, externalReferences, definedNames 之後
+    pos = max(wb_xml.rfind(f"</{p}{tag}>") + len(f"</{p}{tag}>")
+              for tag in ["sheets", "functionGroups", "externalReferences", "definedNames"])
+    
+    return f'{wb_xml[:pos]}<{p}calcPr fullCalcOnLoad="1"/>{wb_xml[pos:]}'
+    # -------------------------------------------------------------------------/
+
+
+def apply_patch(zin: zipfile.ZipFile, ws_xml: str, new_wb: Path, diff_df: pd.DataFrame,
+                insert_counts: dict[int, int]):
+    """
+    直接修改 xlsx (zip) 中的 XML, 沒有改變的檔案 (其他工作表, 圖片, 樣式...) 原樣複製:
+    
+    1. '交貨清單' 工作表 : 見 `patch_sheet_xml`
+    2. 其他工作表中指到 '交貨清單' 的公式, 名稱 : 改成插入之後的列
+    3. 移除 calcChain (位置已經改變, Excel 開啟時會重新建立)
+    
+    zip 的檔案順序與時間都沿用原本的檔案, 同樣的輸入會得到相同的輸出
+    """
+    map_row = get_row_mapper(insert_counts)
+    ws_parts, _ = get_sheet_parts(zin)
+    ws_part = ws_parts[purchasing_wsname]
+    
+    replaced: dict[str, bytes] = {}
+    replaced[ws_part] = patch_sheet_xml(ws_xml, purchasing_wsname,
+                                        diff_df, insert_counts).encode("utf-8")
+    if len(insert_counts) > 0:
+        for other_part in ws_parts.values():
+            if (other_part == ws_part) or (other_part not in zin.namelist()):
+                continue
+            xml = zin.read(other_part).decode("utf-8")
+            m = sheet_data_re.search(xml)
+            if (m is None) or (escape(purchasing_wsname) not in xml):
+                continue
+            new_xml = shift_xml_formulas(xml, m[1], map_row, purchasing_wsname, False)
+            if new_xml != xml:
+                replaced[other_part] = new_xml.encode("utf-8")
+    
+    replaced["xl/workbook.xml"] = patch_workbook_xml(
+        zin.read("xl/workbook.xml").decode("utf-8"), map_row, purchasing_wsname).encode("utf-8")
+    
+    # calcChain
+    drop = {"xl/calcChain.xml"}
+    for name, pattern in [("xl/_rels/workbook.xml.rels",
+                           r'<Relationship\b[^>]*?Target="[^"]*calcChain\.xml"[^>]*/>'),
+                          ("[Content_Types].xml",
+                           r'<Override\b[^>]*?PartName="/xl/calcChain\.xml"[^>]*/>')]:
+        xml = zin.read(name).decode("utf-8")
+        new_xml = re.sub(pattern, "", xml)
+        if new_xml != xml:
+            replaced[name] = new_xml.encode("utf-8")
+    
+    with zipfile.ZipFile(new_wb, "w") as zout:
+        for info in zin.infolist():
+            if info.filename in drop:
+                continue
+            data = replaced.get(info.filename)
+            zout.writestr(info, zin.read(info) if data is None else data)
+    # -------------------------------------------------------------------------/
+
+
+def patch_workbook(new_df: pd.DataFrame, purchasing_wb: Path, new_wb: Path,
+                   console: Console, diff_path: Path = None, dry_run: bool = False):
+    """
+    將回填結果寫入原本 '交貨清單' 的複本 (`new_wb`), 只修改有改變的儲存格,
+    欄寬, 格式, 公式, 圖片與其他工作表都保留; 每次都由原本的 '交貨清單' 重新計算,
+    重新執行的結果相同
+    
+    `dry_run=True` 時只輸出修改清單 (`diff_path`), 不寫入任何 workbook
+    
+    回傳修改清單 (DataFrame)
+    """
+    purchasing_wb, new_wb = Path(purchasing_wb), Path(new_wb)
+    if purchasing_wb.resolve() == new_wb.resolve():
+        raise ValueError(f"輸出的檔案不能是原本的 '交貨清單' : '{new_wb}'")
+    
+    with zipfile.ZipFile(purchasing_wb) as zf:
+        ws_parts, _ = get_sheet_parts(zf)
+        if purchasing_wsname not in ws_parts:
+            raise ValueError(f"找不到 [工作表]'{purchasing_wsname}' 請確認輸入的檔案. File: '{purchasing_wb}'")
+        ws_xml = zf.read(ws_parts[purchasing_wsname]).decode("utf-8")
+        layout = SheetLayout(read_sheet_values(ws_xml, read_shared_strings(zf)), purchasing_wsname)
+        
+        diff_df, insert_counts = compute_patch(new_df, layout)
+        
+        if diff_path is not None:
+            # utf-8-sig : 讓 Excel 直接開啟 CSV 時中文不會變成亂碼
+            diff_df.to_csv(diff_path, index=False, encoding="utf-8-sig")
+        
+        cnt = diff_df["動作"].value_counts()
+        console.print(f"修改清單 : 修改 {cnt.get('修改', 0)} 個儲存格, "
+                      f"插入 {sum(insert_counts.values())} 列 (合計 {cnt.get('合計', 0)} 個儲存格)")
+        
+        if not dry_run:
+            apply_patch(zf, ws_xml, new_wb, diff_df, insert_counts)
+    
+    return diff_df
+    # -------------------------------------------------------------------------/
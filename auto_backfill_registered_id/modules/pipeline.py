@@ -0,0 +1,475 @@
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import rich.progress
+from rich.console import Console
+
+from .cache import SheetCache
+from .columnar import columnar_parts, write_columnar
+from .compact import compact_frame, show_memory_usage
+from .eventlog import EventLog
+from .ingest import ingest_workbooks
+from .matching import propose_candidates
+from .patch import patch_workbook
+from .profiling import profiler
+from .reconcile import reconcile_catalog
+from .registry import (RegistrationRegistry, registry_issues,
+                       show_registry_report, to_registry_frame)
+from .schema import (ColumnPlan, catalog_colalias, catalog_colnames,
+                     catalog_compact_dtype, catalog_dtype, catalog_key_cols,
+                     catalog_st_rowidx, catalog_usecols, keep_number_format,
+                     max_blank_rows, purchasing_colalias, purchasing_colnames,
+                     purchasing_compact_dtype, purchasing_dtype,
+                     purchasing_key_cols, purchasing_st_rowidx,
+                     purchasing_wsname)
+from .utils import (PurcSnIndex, RowBuffer, add_total_sum, col_strip,
+                    concat_frames, copy_as_index, get_total_sum, read_wb,
+                    sync_catalog_bulk, sync_catalog_value)
+from .validate import validate_catalog
+from .writer import excel_writers, patch_writers, write_sheet_stream
+# -----------------------------------------------------------------------------/
+
+# 回填引擎
+# - "bulk" : 一次處理全部 (快)
+# - "loop" : 逐筆處理, 紀錄每本書的處理過程
+backfill_engines: tuple = ("bulk", "loop")
+
+
+def prepare_purchasing(purchasing_df: pd.DataFrame, wb_path: Path, console: Console,
+                       compact: bool = False):
+    """
+    strip '書名', 'ISBN' 並移除最後一個 '採購序號' 之後的列
+    
+    `compact=True` 時轉成 `purchasing_compact_dtype` 並顯示記憶體用量
+    """
+    # work sheet error
+    if purchasing_df is None:
+        raise ValueError(f"找不到 [工作表]'{purchasing_wsname}' 請確認輸入的檔案. File: '{wb_path}'")
+    
+    # strip string columns
+    col_strip(purchasing_df, purchasing_colalias["書名"])
+    col_strip(purchasing_df, purchasing_colalias["ISBN"])
+    
+    # get valid filnal row (沒有多餘的列時不複製)
+    final_row = int(purchasing_df[purchasing_colalias["採購序號"]].dropna().iloc[-1])
+    if final_row < len(purchasing_df.index):
+        purchasing_df = purchasing_df.iloc[:final_row, :].copy()
+    
+    purchasing_df.reset_index(inplace=True)
+    
+    if compact:
+        compact_df = compact_frame(purchasing_df, purchasing_compact_dtype)
+        show_memory_usage(purchasing_df, compact_df, "交貨清單", console)
+        purchasing_df = compact_df
+    
+    return purchasing_df
+    # -------------------------------------------------------------------------/
+
+
+def prepare_catalog(catalog_dfs: dict[str, pd.DataFrame], console: Console,
+                    compact: bool = False):
+    """
+    合併 '編目箱單' 的所有工作表 (依工作表順序), strip '書名', 'ISBN', '部冊號'
+    
+    `compact=True` 時轉成 `catalog_compact_dtype` 並顯示記憶體用量
+    """
+    # concat work sheet
+    catalog_df = pd.concat(list(catalog_dfs.values()))
+    
+    # strip string columns
+    col_strip(catalog_df, catalog_colalias["書名"])
+    col_strip(catalog_df, catalog_colalias["ISBN"])
+    col_strip(catalog_df, "部冊號")
+    
+    catalog_df.reset_index(inplace=True)
+    
+    if compact:
+        compact_df = compact_frame(catalog_df, catalog_compact_dtype)
+        show_memory_usage(catalog_df, compact_df, "編目箱單", console)
+        catalog_df = compact_df
+    
+    return catalog_df
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def load_purchasing(wb_path: Path, console: Console,
+                    backend: str = "openpyxl", cache: SheetCache = None,
+                    compact: bool = False):
+    """
+    讀取 '交貨清單' (見 `prepare_purchasing`)
+    """
+    purchasing_df = read_wb(wb_path, purchasing_dtype,
+                            purchasing_st_rowidx, purchasing_colnames,
+                            console, ws_names=[purchasing_wsname],
+                            backend=backend, cache=cache,
+                            key_cols=purchasing_key_cols,
+                            max_blank_rows=max_blank_rows).get(purchasing_wsname)
+    
+    return prepare_purchasing(purchasing_df, wb_path, console, compact=compact)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def load_catalog(wb_path: Path, console: Console,
+                 backend: str = "openpyxl", cache: SheetCache = None,
+                 compact: bool = False):
+    """
+    讀取 '編目箱單' 的所有工作表並合併 (見 `prepare_catalog`)
+    """
+    catalog_dfs = read_wb(wb_path, catalog_dtype,
+                          catalog_st_rowidx, catalog_colnames,
+                          console, usecols=catalog_usecols,
+                          backend=backend, cache=cache,
+                          key_cols=catalog_key_cols, max_blank_rows=max_blank_rows)
+    
+    return prepare_catalog(catalog_dfs, console, compact=compact)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def load_inputs(purchasing_wb: Path, catalog_wb: Path, console: Console,
+                backend: str = "openpyxl", cache: SheetCache = None,
+                compact: bool = False, max_workers: int = None):
+    """
+    '交貨清單' 與 '編目箱單' 的每個工作表同時在不同的 process 解析 (見 `modules.ingest`),
+    結果與 `load_purchasing`, `load_catalog` 相同
+    
+    回傳 (purchasing_df, catalog_df)
+    """
+    purchasing_dfs, catalog_dfs = ingest_workbooks([
+        {"wb_path": purchasing_wb, "ws_dtype": purchasing_dtype,
+         "colidx": purchasing_st_rowidx, "default_key": purchasing_colnames,
+         "ws_names": [purchasing_wsname],
+         "key_cols": purchasing_key_cols, "max_blank_rows": max_blank_rows},
+        {"wb_path": catalog_wb, "ws_dtype": catalog_dtype,
+         "colidx": catalog_st_rowidx, "default_key": catalog_colnames,
+         "usecols": catalog_usecols,
+         "key_cols": catalog_key_cols, "max_blank_rows": max_blank_rows},
+    ], console, backend=backend, cache=cache, max_workers=max_workers)
+    
+    purchasing_df = prepare_purchasing(purchasing_dfs.get(purchasing_wsname), purchasing_wb,
+                                       console, compact=compact)
+    catalog_df = prepare_catalog(catalog_dfs, console, compact=compact)
+    
+    return purchasing_df, catalog_df
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def compile_plan(purchasing_df: pd.DataFrame, catalog_df: pd.DataFrame):
+    """
+    依讀取的 column 編譯欄位對應 (見 `modules.schema.ColumnPlan`),
+    缺少欄位時在回填前 raise
+    """
+    return ColumnPlan(purchasing_df.columns, catalog_df.columns)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def validate_backfill(purchasing_df: pd.DataFrame, catalog_df: pd.DataFrame,
+                      console: Console, report_path: Path = None):
+    """
+    回填前的檢查, 有任何錯誤時列出全部錯誤後 raise (不會開始回填)
+    
+    `purchasing_df`, `catalog_df` 會被 `copy_as_index` (與 `run_backfill` 相同)
+    """
+    copy_as_index(purchasing_df, purchasing_colalias["採購序號"], "purc_sn")
+    copy_as_index(catalog_df, catalog_colalias["採購序號"], "purc_sn")
+    
+    errors = validate_catalog(purchasing_df, purchasing_colalias,
+                              catalog_df, catalog_colalias,
+                              console, report_path=report_path)
+    if len(errors) > 0:
+        raise ValueError(f"驗證失敗, {len(errors)} 個 '採購序號' 有錯誤, 請修正後重新執行")
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def check_registry(catalog_df: pd.DataFrame, registry: RegistrationRegistry,
+                   catalog_wb: Path, console: Console, tag: str = "",
+                   report_path: Path = None, log: EventLog = None):
+    """
+    回填前一次檢查 '編目箱單' 所有的 '登錄號' (重複, 已經登錄過, 缺號; 見 `modules.registry`),
+    只會警告不會停止, 有問題時存成 `report_path` CSV
+    
+    `catalog_wb` + `tag` 為登錄的來源 (同一個來源之前的記錄不算重複)
+    """
+    reg_df = to_registry_frame(catalog_df, catalog_colalias["採購序號"])
+    issue_df = registry.check(reg_df, str(catalog_wb.resolve()), tag)
+    show_registry_report(issue_df, console)
+    
+    if (report_path is not None) and (len(issue_df) > 0):
+        issue_df.to_csv(report_path, index=False, encoding="utf-8-sig")
+    if log is not None:
+        log.write("registry", **{issue: int((issue_df["類型"] == issue).sum())
+                                 for issue in registry_issues})
+    
+    return issue_df
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def register_backfill(new_df: pd.DataFrame, registry: RegistrationRegistry,
+                      catalog_wb: Path, console: Console, tag: str = "",
+                      purchasing_name: str = ""):
+    """
+    記錄回填到 '交貨清單' (`purchasing_name`) 的 '登錄號' (同一個來源之前的記錄會被取代)
+    """
+    reg_df = to_registry_frame(new_df, purchasing_colalias["採購序號"])
+    n_registered = registry.register(reg_df, str(catalog_wb.resolve()), tag,
+                                     purchasing=purchasing_name)
+    console.print(f"'登錄號' 已記錄 : {n_registered} 筆 ('{registry.db_path.name}')")
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def reconcile_backfill(purchasing_df: pd.DataFrame, catalog_df: pd.DataFrame,
+                       console: Console, report_path: Path = None,
+                       log: EventLog = None):
+    """
+    回填前一次比對全部的 '書名', 'ISBN' (不相等只會警告, 不會停止)
+    
+    `purchasing_df`, `catalog_df` 會被 `copy_as_index` (與 `run_backfill` 相同)
+    """
+    copy_as_index(purchasing_df, purchasing_colalias["採購序號"], "purc_sn")
+    copy_as_index(catalog_df, catalog_colalias["採購序號"], "purc_sn")
+    
+    return reconcile_catalog(purchasing_df, catalog_df, console,
+                             report_path=report_path, log=log)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile(cprofile=True)
+def run_backfill(purchasing_df: pd.DataFrame, catalog_df: pd.DataFrame,
+                 console: Console, engine: str = "bulk",
+                 log: EventLog = None, column_plan: ColumnPlan = None):
+    """
+    `purchasing_df`, `catalog_df` 會被修改 (`copy_as_index`, 移除已處理的資料)
+    
+    `column_plan` : `compile_plan` 的結果 (None 或 column 不同時在這裡編譯)
+    
+    `log` 不是 None 時, 每本書的處理結果寫入 `log`, terminal 只顯示 warning, error 與進度
+    
+    回傳 (new_df, handled_type_cnt, 剩下的 purchasing_df, 剩下的 catalog_df)
+    """
+    # 交貨清單
+    copy_as_index(purchasing_df, purchasing_colalias["採購序號"], "purc_sn")
+    # 編目箱單
+    copy_as_index(catalog_df, catalog_colalias["採購序號"], "purc_sn")
+    if (column_plan is None) or (not column_plan.purc_columns.equals(purchasing_df.columns)) \
+            or (not column_plan.cata_columns.equals(catalog_df.columns)):
+        column_plan = compile_plan(purchasing_df, catalog_df)
+    
+    # Cases
+    handled_type_cnt = Counter()
+    
+    if engine == "bulk":
+        new_df, handled_type_cnt = \
+                sync_catalog_bulk(column_plan,
+                                  purchasing_df, purchasing_colalias,
+                                  catalog_df, catalog_colalias,
+                                  console, log)
+        if len(catalog_df) == 0:
+            console.print("[green] '編目箱單' 已無資料\n")
+    elif engine == "loop":
+        purc_sn_index = PurcSnIndex(purchasing_df)
+        cata_sn_index = PurcSnIndex(catalog_df)
+        new_rows = RowBuffer(purchasing_df.iloc[0:0])
+        
+        with rich.progress.Progress(console=console, transient=True,
+                                    disable=(log is None)) as progress:
+            task_id = progress.add_task("回填", total=len(purchasing_df))
+            
+            for purc_sn in list(purchasing_df.index):
+            
+                if log is None:
+                    console.rule()
+                
+                new_rows, handled_type = \
+                        sync_catalog_value(new_rows, purc_sn, column_plan,
+                                           purc_sn_index, purchasing_colalias,
+                                           cata_sn_index, catalog_colalias,
+                                           console, log)
+                
+                handled_type_cnt.update([handled_type])
+                if log is None:
+                    console.print(f":mage: 處理模式 : {handled_type}")
+                    console.line()
+                progress.advance(task_id)
+                
+                # 如果編目已經處理完畢
+                if len(cata_sn_index) == 0:
+                    if log is None:
+                        console.rule()
+                    console.print("[green] '編目箱單' 已無資料\n")
+                    break
+        
+        new_df = new_rows.to_frame()
+        
+        # 未處理的部分
+        purchasing_df = purc_sn_index.leftover()
+        catalog_df = cata_sn_index.leftover()
+    else:
+        raise ValueError(f"不支援的回填引擎 : '{engine}', 請使用 {backfill_engines}")
+    
+    return new_df, handled_type_cnt, purchasing_df, catalog_df
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def report_backfill(new_df: pd.DataFrame, handled_type_cnt: Counter,
+                    console: Console, log: EventLog = None):
+    """
+    顯示處理模式的統計, 並加上合計列
+    """
+    console.print(handled_type_cnt, "\n")
+    # add total sum
+    new_df = add_total_sum(new_df)
+    console.print(f"合計 (總冊數) : {new_df['總冊數'].values[-1]}")
+    console.print(f"合計 (小計) : {new_df['小計'].values[-1]}")
+    
+    if log is not None:
+        log.write("summary", 處理模式=dict(handled_type_cnt),
+                  總冊數=new_df["總冊數"].values[-1],
+                  小計=new_df["小計"].values[-1])
+    
+    return new_df
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def suggest_matches(purchasing_left: pd.DataFrame, catalog_left: pd.DataFrame,
+                    console: Console, review_path: Path = None):
+    """
+    沒有對應到 '採購序號' 的 '編目箱單' (例如 '原序號' 打錯), 以 ISBN 和書名
+    在剩下的 '交貨清單' 中找出候選, `review_path` 不是 None 時存成 '比對候選' 工作表
+    """
+    if len(catalog_left) == 0:
+        return None
+    
+    candidate_df = propose_candidates(purchasing_left, purchasing_colalias,
+                                      catalog_left, catalog_colalias, console)
+    
+    if review_path is not None:
+        write_sheet_stream(review_path, "比對候選", list(candidate_df.columns),
+                           [candidate_df], {"原序號": "0", "候選 採購序號": "04"})
+    
+    return candidate_df
+    # -------------------------------------------------------------------------/
+
+
+def get_output_name(catalog_wb: Path, tag: str = ""):
+    """
+    輸出檔名中 '編目箱單' 的部分, 有 `tag` 時加在後面 (例如多個 '交貨清單' 時的檔名)
+    """
+    name = catalog_wb.stem.replace("(OK)", "").replace("編目箱單", "")
+    
+    return f"{name}_{tag}" if tag else name
+    # -------------------------------------------------------------------------/
+
+
+def get_output_paths(catalog_wb: Path, new_wb_dir: Path, log_mode: str = "rich",
+                     tag: str = ""):
+    """
+    回傳 ('(SR)回填' xlsx, '(SR)處理紀錄' log)
+    
+    `log_mode="jsonl"` 時處理紀錄為 '.jsonl'
+    """
+    name = get_output_name(catalog_wb, tag)
+    new_wb = new_wb_dir.joinpath(f"(SR)回填{name}{catalog_wb.suffix}")
+    log_suffix = ".jsonl" if log_mode == "jsonl" else ".log"
+    new_log = new_wb_dir.joinpath(f"(SR)處理紀錄{name}{log_suffix}")
+    
+    return new_wb, new_log
+    # -------------------------------------------------------------------------/
+
+
+def get_report_path(catalog_wb: Path, new_wb_dir: Path,
+                    kind: str = "驗證報告", suffix: str = ".log", tag: str = ""):
+    """
+    回傳 '(SR)驗證報告' log, 或其他報告 (例如 kind="書名ISBN不相等", suffix=".csv")
+    """
+    name = get_output_name(catalog_wb, tag)
+    
+    return new_wb_dir.joinpath(f"(SR){kind}{name}{suffix}")
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def export_backfill(new_df: pd.DataFrame, purchasing_df: pd.DataFrame,
+                    new_wb: Path, writer: str = "stream"):
+    """
+    `new_df` + 5 列空白 + 沒有處理到的 `purchasing_df`, 存成 '交貨清單' 工作表
+    
+    - writer="stream" : 一列一列寫入, '採購序號' 等以儲存格格式補零 (`keep_number_format`)
+    - writer="pandas" : concat 後 `to_excel`, '採購序號' 轉成補零的文字
+    """
+    new_df = new_df.drop('index', axis=1)
+    purchasing_df = purchasing_df.drop('index', axis=1)
+    
+    if writer == "stream":
+        columns = list(dict.fromkeys(list(new_df.columns) + list(purchasing_df.columns)))
+        write_sheet_stream(new_wb, purchasing_wsname, columns,
+                           [new_df, 5, purchasing_df], keep_number_format)
+        return
+    elif writer in patch_writers:
+        raise ValueError(f"輸出方式 '{writer}' 需要原本的 '交貨清單', 請使用 `patch_backfill`")
+    elif writer != "pandas":
+        raise ValueError(f"不支援的輸出方式 : '{writer}', 請使用 {excel_writers}")
+    
+    # empty rows (dtype 依 `new_df`, 見 `concat_frames`)
+    empty_df = pd.DataFrame(index=range(5), columns=new_df.columns)
+    
+    new_df = concat_frames([new_df, empty_df, purchasing_df], new_df.dtypes)
+    sn_col = purchasing_colalias["採購序號"]
+    new_df[sn_col] = new_df[sn_col].astype("string")
+    new_df[sn_col] = np.where(pd.isna(new_df[sn_col]), new_df[sn_col], new_df[sn_col].str.zfill(4))
+    
+    with open(new_wb, mode="wb") as f:
+        new_df.to_excel(f, engine="openpyxl", sheet_name=purchasing_wsname, index=False)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def export_columnar(backfill_df: pd.DataFrame, purchasing_left: pd.DataFrame,
+                    catalog_left: pd.DataFrame, handled_type_cnt: Counter,
+                    catalog_wb: Path, new_wb_dir: Path, formats: list[str],
+                    tag: str = ""):
+    """
+    回填結果 (`run_backfill` 的 new_df, 沒有合計列), 沒有處理到的 '交貨清單' 與 '編目箱單'
+    一次存成 CSV / Parquet / JSON Lines (見 `modules.columnar`), 匯入其他系統時不需要重新解析 xlsx
+    
+    合計 (總冊數, 小計 `ROUND_HALF_UP`) 與處理模式存成 '(SR)回填摘要' JSON
+    (Parquet 另外存在每個檔案的 schema metadata), 回傳摘要
+    """
+    total_book, total_ntd = get_total_sum(backfill_df)
+    metadata = {
+        "總冊數": int(total_book),
+        "小計": int(total_ntd) if total_ntd.is_finite() else None,
+        "處理模式": {k: int(v) for k, v in handled_type_cnt.items()},
+        "number_formats": keep_number_format,
+    }
+    frames = {"new": backfill_df, "purchasing_left": purchasing_left, "catalog_left": catalog_left}
+    paths = {name: get_report_path(catalog_wb, new_wb_dir, kind, "", tag)
+             for name, kind in columnar_parts.items()}
+    
+    return write_columnar(frames, paths, get_report_path(catalog_wb, new_wb_dir, "回填摘要", ".json", tag),
+                          formats, metadata)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def patch_backfill(new_df: pd.DataFrame, purchasing_wb: Path, new_wb: Path,
+                   console: Console, diff_path: Path = None, dry_run: bool = False):
+    """
+    writer="patch" : 複製原本的 '交貨清單' 存成 `new_wb`, 只修改回填改變的儲存格
+    (沒有處理到的列留在原本的位置), 修改清單存成 `diff_path` CSV
+    
+    writer="diff" (`dry_run=True`) : 只輸出修改清單
+    """
+    return patch_workbook(new_df, purchasing_wb, new_wb, console,
+                          diff_path=diff_path, dry_run=dry_run)
+    # -------------------------------------------------------------------------/
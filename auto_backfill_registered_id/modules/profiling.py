@@ -0,0 +1,234 @@
+import cProfile
+import functools
+import io
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from .eventlog import json_value
+
+try:
+    import resource # 只有 Unix 有, Windows 不記錄 max RSS
+except ImportError:
+    resource = None
+# -----------------------------------------------------------------------------/
+
+
+def get_max_rss():
+    """
+    到目前為止 process 的最大 RSS (bytes), 無法取得時回傳 None
+    """
+    if resource is None:
+        return None
+    
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    # Linux 的單位是 KB, macOS 是 bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+    # -------------------------------------------------------------------------/
+
+
+def count_rows(result):
+    """
+    由回傳值推測處理的資料筆數 (DataFrame, {ws_name: DataFrame}, tuple 的第一個值)
+    """
+    if isinstance(result, pd.DataFrame):
+        return len(result.index)
+    if isinstance(result, dict):
+        rows = [count_rows(v) for v in result.values()]
+        rows = [r for r in rows if r is not None]
+        return sum(rows) if rows else None
+    if isinstance(result, tuple) and (len(result) > 0):
+        return count_rows(result[0])
+    
+    return None
+    # -------------------------------------------------------------------------/
+
+
+class StageProfiler:
+    """
+    記錄每個步驟的 wall time, CPU time, tracemalloc peak, max RSS 與資料筆數
+    
+    - 沒有 `enable()` 時不做任何事 (只多一次 `if`)
+    - 步驟可以巢狀, 名稱以 "/" 連接 (例如 'load_catalog/read_wb')
+    - `cprofile=True` 的步驟另外以 cProfile 記錄, 存成 `cprofile_path`
+    """
+    def __init__(self):
+        """
+        """
+        self.enabled: bool = False
+        self.trace_memory: bool = False
+        self.cprofile_path: Path = None
+        self.records: list[dict] = []
+        # 執行中的步驟 [record, tracemalloc 的起點, 到目前為止的 peak]
+        self.frames: list[list] = []
+        # ---------------------------------------------------------------------/
+    
+    
+    def enable(self, trace_memory: bool = True, cprofile_path: Path = None):
+        """
+        `trace_memory=True` 時使用 tracemalloc (記憶體的數值較準確, 但會讓執行變慢)
+        """
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.cprofile_path = None if cprofile_path is None else Path(cprofile_path)
+        self.records = []
+        self.frames = []
+        if trace_memory and (not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        # ---------------------------------------------------------------------/
+    
+    
+    def disable(self):
+        """
+        """
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = False
+        # ---------------------------------------------------------------------/
+    
+    
+    @contextmanager
+    def stage(self, name: str, cprofile: bool = False):
+        """
+        with profiler.stage("save_log") as record:
+            ...
+            record["rows"] = len(df)
+        """
+        if not self.enabled:
+            yield {}
+            return
+        
+        parent = self.frames[-1] if self.frames else None
+        record = {
+            "stage": name if parent is None else f"{parent[0]['stage']}/{name}",
+            "depth": len(self.frames),
+            "rows": None,
+        }
+        # 先加入, 巢狀的步驟會排在後面
+        self.records.append(record)
+        
+        frame = [record, 0, 0]
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # `reset_peak()` 之前, 先把 peak 記到外層的步驟
+            if parent is not None:
+                parent[2] = max(parent[2], peak)
+            tracemalloc.reset_peak()
+            frame[1:] = [current, current]
+        self.frames.append(frame)
+        
+        prof = None
+        if cprofile and (self.cprofile_path is not None):
+            prof = cProfile.Profile()
+        
+        wall_st = time.perf_counter()
+        cpu_st = time.process_time()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield record
+        finally:
+            if prof is not None:
+                prof.disable()
+            record["wall_s"] = round(time.perf_counter() - wall_st, 4)
+            record["cpu_s"] = round(time.process_time() - cpu_st, 4)
+            self.frames.pop()
+            
+            if self.trace_memory:
+                peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak - frame[1]
+                if parent is not None:
+                    parent[2] = max(parent[2], peak)
+            record["max_rss"] = get_max_rss()
+            
+            if prof is not None:
+                prof.dump_stats(self.cprofile_path)
+        # ---------------------------------------------------------------------/
+    
+    
+    def profile(self, name: str = None, cprofile: bool = False):
+        """
+        decorator 版本的 `stage()`, 資料筆數由回傳值推測 (`count_rows`)
+        """
+        def decorator(fn):
+            stage_name = fn.__name__ if name is None else name
+            
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.stage(stage_name, cprofile=cprofile) as record:
+                    result = fn(*args, **kwargs)
+                    record["rows"] = count_rows(result)
+                return result
+            
+            return wrapper
+        
+        return decorator
+        # ---------------------------------------------------------------------/
+    
+    
+    def make_table(self):
+        """
+        """
+        table = Table(title="效能分析")
+        table.add_column("步驟")
+        table.add_column("筆數", justify="right")
+        table.add_column("wall (s)", justify="right")
+        table.add_column("CPU (s)", justify="right")
+        table.add_column("peak (MB)", justify="right")
+        table.add_column("max RSS (MB)", justify="right")
+        
+        for record in self.records:
+            peak = record.get("peak_bytes")
+            max_rss = record.get("max_rss")
+            table.add_row("  " * record["depth"] + record["stage"].split("/")[-1],
+                          "" if record["rows"] is None else str(record["rows"]),
+                          f"{record.get('wall_s', 0):.3f}",
+                          f"{record.get('cpu_s', 0):.3f}",
+                          "" if peak is None else f"{peak / 1024**2:.1f}",
+                          "" if max_rss is None else f"{max_rss / 1024**2:.1f}")
+        
+        return table
+        # ---------------------------------------------------------------------/
+    
+    
+    def show(self, console: Console):
+        """
+        """
+        if self.enabled and (len(self.records) > 0):
+            console.print(self.make_table())
+        # ---------------------------------------------------------------------/
+    
+    
+    def append_to_log(self, log_path: Path):
+        """
+        加到 '(SR)處理紀錄' 的最後
+        ('.jsonl' 時每個步驟一行 "profile" 事件, 否則為文字表格)
+        """
+        if not (self.enabled and (len(self.records) > 0)):
+            return
+        
+        log_path = Path(log_path)
+        with open(log_path, mode="a", encoding="utf-8") as f:
+            if log_path.suffix == ".jsonl":
+                for record in self.records:
+                    record = {"event": "profile", **json_value(record)}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                console = Console(file=io.StringIO(), width=120)
+                console.print(self.make_table())
+                f.write("\n" + console.file.getvalue())
+        # ---------------------------------------------------------------------/
+
+
+# 所有模組共用, 由 `main_cli.py` / `batch_cli.py` 決定是否 `enable()`
+profiler = StageProfiler()
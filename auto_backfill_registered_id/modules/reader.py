@@ -0,0 +1,457 @@
+import importlib.util
+import re
+import zipfile
+from typing import BinaryIO, Iterator
+from xml.sax.saxutils import unescape
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.utils import column_index_from_string, get_column_letter
+from pandas.io.parsers import TextParser
+
+from .cache import get_sheet_parts, read_shared_strings
+from .profiling import profiler
+# -----------------------------------------------------------------------------/
+
+# 讀取 Excel 的方式
+# - "openpyxl" : `pd.read_excel(engine="openpyxl")`
+# - "openpyxl-stream" : openpyxl `read_only` 逐列讀取, 讀取時就只保留需要的 column
+# - "calamine" : `pd.read_excel(engine="calamine")`, 需要安裝 `python-calamine`
+# - "auto" : 有安裝 `python-calamine` 就用 "calamine", 否則用 "openpyxl-stream"
+reader_backends: tuple = ("openpyxl", "openpyxl-stream", "calamine", "auto")
+
+# 略過的儲存格最多記錄幾個 (其他的只計數)
+max_skipped_samples: int = 20
+
+# 找資料範圍時直接讀取工作表 XML (不需要完整解析, 見 `scan_xml_extent`)
+xml_row_re = re.compile(rb"<(?:\w+:)?row\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?row>)", re.S)
+xml_cell_re = re.compile(rb"<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+xml_r_re = re.compile(rb'\br="([A-Z]*)(\d+)"')
+xml_t_re = re.compile(rb'\bt="(\w+)"')
+xml_v_re = re.compile(rb"<(?:\w+:)?v>([^<]*)</(?:\w+:)?v>")
+xml_text_re = re.compile(rb"<(?:\w+:)?t\b[^>]*>([^<]*)</(?:\w+:)?t>")
+xml_entities: dict = {"&quot;": '"', "&apos;": "'"}
+
+
+def resolve_backend(backend: str):
+    """
+    """
+    if backend not in reader_backends:
+        raise ValueError(f"不支援的 reader backend : '{backend}', "
+                         f"請使用 {reader_backends}")
+    
+    has_calamine = importlib.util.find_spec("python_calamine") is not None
+    
+    if backend == "auto":
+        return "calamine" if has_calamine else "openpyxl-stream"
+    
+    if (backend == "calamine") and (not has_calamine):
+        raise ValueError("reader backend 'calamine' 需要安裝 `python-calamine`")
+    
+    return backend
+    # -------------------------------------------------------------------------/
+
+
+def convert_value(value):
+    """
+    與 pandas `OpenpyxlReader._convert_cell()` 相同的轉換
+    """
+    if value is None:
+        return ""  # compat with xlrd
+    elif isinstance(value, str) and (value in ERROR_CODES):
+        return np.nan
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    
+    return value
+    # -------------------------------------------------------------------------/
+
+
+def get_header_names(header_row: list, width: int):
+    """
+    用 pandas 的規則命名 column ('Unnamed: N', 重複的名稱加上 '.1')
+    """
+    header_row = list(header_row) + [""] * (width - len(header_row))
+    
+    return list(TextParser([header_row], header=0).read().columns)
+    # -------------------------------------------------------------------------/
+
+
+class ExtentTracker:
+    """
+    逐列找出工作表實際的資料範圍 (不需要讀到工作表標示的最後一列)
+    
+    - 保留到最後一個 `key_cols` 有值的列, 之後有值的儲存格都略過 (記錄位置)
+    - 連續 `max_blank_rows` 列的 `key_cols` 都是空白時停止讀取 (None : 讀到最後)
+    - header 沒有任何 `key_cols` 時不限制範圍 (`active` 為 False)
+    """
+    def __init__(self, header_row: list, key_cols: set, max_blank_rows: int = None,
+                 first_row: int = 0, first_col: int = 0, max_row: int = None):
+        """
+        `first_row` : 第一個資料列的 row index (0-based)
+        `first_col` : 每一列第一個值的 column index (0-based, calamine 會省略左邊的空白 column)
+        `max_row` : 工作表標示的最後一列 (只用來顯示沒有讀取的範圍)
+        """
+        self.key_names: list[str] = [name for name in header_row if name in key_cols]
+        self.key_pos: list[int] = [i for i, name in enumerate(header_row) if name in key_cols]
+        self.active: bool = len(self.key_pos) > 0
+        self.max_blank_rows: int = max_blank_rows
+        self.first_row: int = first_row
+        self.first_col: int = first_col
+        self.max_row: int = max_row
+        
+        self.n_rows: int = 0 # 保留的資料列數
+        self.n_scanned: int = 0
+        self.blank_run: int = 0
+        self.stopped: bool = False
+        # 最後一個 key 列之後有值的儲存格 (之後再出現 key 列時就不算略過)
+        self.n_pending: int = 0
+        self.pending: list[list] = []
+        # ---------------------------------------------------------------------/
+    
+    
+    def is_key_row(self, row):
+        """
+        """
+        return any((i < len(row)) and (row[i] is not None) and (row[i] != "")
+                   for i in self.key_pos)
+        # ---------------------------------------------------------------------/
+    
+    
+    def feed(self, row):
+        """
+        回傳 False 時停止讀取 (已經連續 `max_blank_rows` 列沒有 key)
+        """
+        if not self.active:
+            self.n_scanned += 1
+            self.n_rows = self.n_scanned
+            return True
+        
+        if self.is_key_row(row):
+            self.n_scanned += 1
+            self.n_rows = self.n_scanned
+            self.blank_run = 0
+            self.n_pending = 0
+            self.pending.clear()
+            return True
+        
+        row_number = self.first_row + self.n_scanned + 1 # Excel 的列號
+        for i, value in enumerate(row):
+            if (value is None) or (value == ""):
+                continue
+            self.n_pending += 1
+            if len(self.pending) < max_skipped_samples:
+                coord = f"{get_column_letter(self.first_col + i + 1)}{row_number}"
+                self.pending.append([coord, str(value)[:30]])
+        self.n_scanned += 1
+        self.blank_run += 1
+        if (self.max_blank_rows is not None) and (self.blank_run >= self.max_blank_rows):
+            self.stopped = True
+            return False
+        
+        return True
+        # ---------------------------------------------------------------------/
+    
+    
+    def to_dict(self):
+        """
+        回傳範圍與略過的儲存格 (可以存成 JSON), 沒有限制範圍時回傳 None
+        """
+        if not self.active:
+            return None
+        
+        last_row = self.first_row + self.n_rows # Excel 的列號 (0 筆資料時為 header)
+        return {
+            "key_cols": self.key_names,
+            "n_rows": self.n_rows,
+            "last_row": last_row,
+            "n_skipped": self.n_pending,
+            "skipped": self.pending,
+            "max_blank_rows": self.max_blank_rows,
+            "stop_row": (self.first_row + self.n_scanned) if self.stopped else None,
+            "max_row": self.max_row,
+        }
+        # ---------------------------------------------------------------------/
+
+
+def scan_extent(rows: Iterator, colidx: int, key_cols: set,
+                max_blank_rows: int = None, first_col: int = 0, max_row: int = None):
+    """
+    由 `rows` (每一列的值) 找出 header (`colidx`) 之後的資料範圍, 不轉換資料
+    
+    回傳 `ExtentTracker`
+    """
+    rows = iter(rows)
+    for _ in zip(range(colidx), rows):
+        pass
+    header_row = [convert_value(v) for v in next(rows, ())]
+    
+    tracker = ExtentTracker(header_row, key_cols, max_blank_rows,
+                            first_row=colidx + 1, first_col=first_col, max_row=max_row)
+    if tracker.active:
+        for row in rows:
+            if not tracker.feed(row):
+                break
+    
+    return tracker
+    # -------------------------------------------------------------------------/
+
+
+def stream_ws(ws, colidx: int, ws_dtype: dict[str, str], usecols: set = None,
+              key_cols: set = None, max_blank_rows: int = None):
+    """
+    openpyxl `read_only` 逐列讀取工作表, 只保留 `usecols` 的 column,
+    結果與 `pd.read_excel(engine="openpyxl", usecols=...)` 相同
+    
+    有給 `key_cols` 時只讀到實際的資料範圍 (見 `ExtentTracker`)
+    
+    回傳 (DataFrame, 工作表上完整的 column names, 資料範圍 (`ExtentTracker.to_dict`))
+    """
+    max_row = ws.max_row # 工作表標示的範圍 (reset 之前)
+    ws.reset_dimensions()
+    rows = ws.iter_rows(values_only=True)
+    
+    # rows before header (和 pandas 一樣, 只用來判斷工作表是否為空)
+    last_row_with_data = -1
+    row_number = -1
+    for row_number, row in zip(range(colidx), rows):
+        if any(v is not None for v in row):
+            last_row_with_data = row_number
+    
+    header_row = [convert_value(v) for v in next(rows, ())]
+    while header_row and (header_row[-1] == ""):
+        header_row.pop()
+    row_number += 1
+    if header_row:
+        last_row_with_data = row_number
+    
+    if usecols is not None:
+        raw_names = get_header_names(header_row, len(header_row))
+        keep = [i for i, name in enumerate(raw_names) if name in usecols]
+    
+    tracker = None
+    if key_cols is not None:
+        tracker = ExtentTracker(header_row, key_cols, max_blank_rows,
+                                first_row=row_number + 1, max_row=max_row)
+    
+    # data rows
+    max_width = len(header_row)
+    pending_width = 0 # 還不確定是否在範圍內的列
+    data: list[list] = []
+    n_data = 0
+    for row_number, row in enumerate(rows, start=row_number + 1):
+        if (tracker is not None) and (not tracker.feed(row)):
+            break
+        converted_row = [convert_value(v) for v in row]
+        while converted_row and (converted_row[-1] == ""):
+            converted_row.pop()
+        width = len(converted_row)
+        if width > 0:
+            last_row_with_data = row_number
+            n_data = len(data) + 1
+            pending_width = max(pending_width, width)
+        if (tracker is None) or (tracker.n_rows == len(data) + 1):
+            max_width = max(max_width, pending_width)
+            pending_width = 0
+        if usecols is None:
+            data.append(converted_row)
+        else:
+            data.append([converted_row[i] if i < width else "" for i in keep])
+    
+    # Trim trailing empty rows (與範圍之外的列)
+    if tracker is not None:
+        n_data = min(n_data, tracker.n_rows)
+    del data[n_data:]
+    extent = None if tracker is None else tracker.to_dict()
+    
+    if last_row_with_data < colidx:
+        return pd.DataFrame(), [], extent
+    
+    # pandas 會把每一列補到最寬的那列, 沒有名稱的 column 會變成 'Unnamed: N'
+    all_names = get_header_names(header_row, max_width)
+    if usecols is None:
+        keep = list(range(max_width))
+        data = [row + [""] * (max_width - len(row)) for row in data]
+    
+    header = [header_row[i] if i < len(header_row) else "" for i in keep]
+    ws_dtype = {k: v for k, v in ws_dtype.items() if k in set(all_names[i] for i in keep)}
+    parser = TextParser([header] + data, header=0, dtype=ws_dtype,
+                        skip_blank_lines=False)
+    
+    return parser.read(), all_names, extent
+    # -------------------------------------------------------------------------/
+
+
+def iter_xml_rows(f: BinaryIO, ws_name: str, chunk_size: int = 1 << 16):
+    """
+    直接由工作表 XML 逐列回傳 (列號, 該列的 XML), 解壓縮到哪裡就處理到哪裡,
+    停止讀取 (`close()`) 後不會再解壓縮後面的部分
+    """
+    with zipfile.ZipFile(f) as zf:
+        ws_parts, _ = get_sheet_parts(zf)
+        with zf.open(ws_parts[ws_name]) as ws_xml:
+            buf = b""
+            row_number = 0
+            while True:
+                chunk = ws_xml.read(chunk_size)
+                buf += chunk
+                # 只處理完整的列, 剩下的等下一個 chunk
+                end = max(buf.rfind(b"</row>") + 6, buf.rfind(b"/>") + 2) if chunk else len(buf)
+                pos = 0
+                for m in xml_row_re.finditer(buf, 0, end):
+                    pos = m.end()
+                    r = xml_r_re.search(m.group(1))
+                    row_number = int(r.group(2)) if r else row_number + 1
+                    yield row_number, m.group(2) or b""
+                buf = buf[pos:]
+                if not chunk:
+                    break
+    # -------------------------------------------------------------------------/
+
+
+def read_xml_row(row_xml: bytes, shared_strings: list[str], key_pos: set = None):
+    """
+    一列的 XML -> 每個儲存格的值 (tuple, 由 A 欄開始, 值都是文字, 與 openpyxl `data_only` 相同
+    公式只看計算結果)
+    
+    有給 `key_pos` (0-based) 時, 其中一個 column 有值就不再讀取後面的儲存格 (只需要知道是 key 列)
+    """
+    values: dict[int, str] = {}
+    col = 0
+    for m in xml_cell_re.finditer(row_xml):
+        attrs, body = m.group(1), m.group(2)
+        r = xml_r_re.search(attrs)
+        col = column_index_from_string(r.group(1).decode()) if r and r.group(1) else col + 1
+        if not body:
+            continue
+        t = xml_t_re.search(attrs)
+        t = t.group(1) if t else b"n"
+        if t == b"inlineStr":
+            value = unescape(b"".join(xml_text_re.findall(body)).decode("utf-8"), xml_entities)
+        else:
+            v = xml_v_re.search(body)
+            if (v is None) or (v.group(1) == b""):
+                continue
+            value = unescape(v.group(1).decode("utf-8"), xml_entities)
+            if t == b"s":
+                value = shared_strings[int(value)]
+        values[col - 1] = value
+        if (key_pos is not None) and (col - 1 in key_pos) and (value != ""):
+            break
+    
+    return tuple(values.get(i) for i in range(max(values, default=-1) + 1))
+    # -------------------------------------------------------------------------/
+
+
+def scan_xml_extent(f: BinaryIO, ws_name: str, colidx: int, key_cols: set,
+                    max_blank_rows: int = None, max_row: int = None):
+    """
+    `scan_extent` 的 XML 版本: key 列只檢查到 key column, 不轉換整列
+    """
+    with zipfile.ZipFile(f) as zf:
+        shared_strings = read_shared_strings(zf)
+    
+    rows = iter_xml_rows(f, ws_name)
+    try:
+        header_row = []
+        for row_number, row_xml in rows:
+            if row_number == colidx + 1:
+                header_row = [convert_value(v) for v in read_xml_row(row_xml, shared_strings)]
+            if row_number >= colidx + 1:
+                break
+        
+        tracker = ExtentTracker(header_row, key_cols, max_blank_rows,
+                                first_row=colidx + 1, max_row=max_row)
+        if not tracker.active:
+            return tracker
+        
+        key_pos = set(tracker.key_pos)
+        last_row = colidx + 1
+        for row_number, row_xml in rows:
+            # XML 沒有的列 (空白列)
+            while last_row + 1 < row_number:
+                last_row += 1
+                if not tracker.feed(()):
+                    return tracker
+            last_row = row_number
+            if not tracker.feed(read_xml_row(row_xml, shared_strings, key_pos)):
+                return tracker
+    finally:
+        rows.close()
+    
+    return tracker
+    # -------------------------------------------------------------------------/
+
+
+def scan_book_extent(f: BinaryIO, book, backend: str, ws_name: str, colidx: int,
+                     key_cols: set, max_blank_rows: int = None):
+    """
+    找出 `pd.ExcelFile` 工作表的資料範圍, 之後再用 `nrows` 只解析範圍內的列
+    
+    - calamine : 由已經載入的工作表 (`book`) 逐列檢查
+    - openpyxl : 直接讀取 XML (比 openpyxl 轉換每個儲存格快很多)
+    """
+    if backend == "calamine":
+        sheet = book.get_sheet_by_name(ws_name)
+        if sheet.start is None:
+            return ExtentTracker([], key_cols)
+        return scan_extent(sheet.iter_rows(), colidx, key_cols, max_blank_rows,
+                           first_col=sheet.start[1], max_row=sheet.end[0] + 1)
+    
+    return scan_xml_extent(f, ws_name, colidx, key_cols, max_blank_rows,
+                           max_row=book[ws_name].max_row)
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def read_sheets(f: BinaryIO, backend: str,
+                colidx: int, ws_dtype: dict[str, str],
+                usecols: set = None, ws_names: list[str] = None,
+                key_cols: set = None, max_blank_rows: int = None):
+    """
+    開啟一次 workbook 讀取所有 (或 `ws_names` 指定的) 工作表
+    
+    有給 `key_cols` 時, 只讀到最後一個 `key_cols` 有值的列,
+    連續 `max_blank_rows` 列沒有值時停止 (見 `ExtentTracker`)
+    
+    回傳 {ws_name: (DataFrame, 工作表上完整的 column names, 資料範圍)}, 依工作表順序,
+    資料範圍為 `ExtentTracker.to_dict()` (沒有限制範圍時為 None)
+    """
+    backend = resolve_backend(backend)
+    ws_dfs: dict[str, tuple[pd.DataFrame, list, dict]] = {}
+    
+    if backend == "openpyxl-stream":
+        wb = load_workbook(f, read_only=True, data_only=True, keep_links=False)
+        try:
+            for ws_name in wb.sheetnames:
+                if (ws_names is not None) and (ws_name not in ws_names):
+                    continue
+                ws_dfs[ws_name] = stream_ws(wb[ws_name], colidx, ws_dtype, usecols,
+                                            key_cols=key_cols, max_blank_rows=max_blank_rows)
+        finally:
+            wb.close()
+    else:
+        with pd.ExcelFile(f, engine=backend) as xlsx:
+            for ws_name in xlsx.sheet_names:
+                if (ws_names is not None) and (ws_name not in ws_names):
+                    continue
+                # `usecols` 會拿到所有的 column name, 順便記錄下來做 header check
+                all_names: list = []
+                def select_col(name, all_names=all_names):
+                    all_names.append(name)
+                    return (usecols is None) or (name in usecols)
+                # 先找出資料範圍, 只解析範圍內的列
+                extent, nrows = None, None
+                if key_cols is not None:
+                    tracker = scan_book_extent(f, xlsx.book, backend, ws_name, colidx,
+                                               key_cols, max_blank_rows)
+                    extent = tracker.to_dict()
+                    nrows = tracker.n_rows if tracker.active else None
+                ws_df = xlsx.parse(ws_name, header=colidx, dtype=ws_dtype,
+                                   usecols=select_col, nrows=nrows)
+                ws_dfs[ws_name] = (ws_df, all_names, extent)
+    
+    return ws_dfs
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+
+from .eventlog import EventLog, format_purc_sn
+from .schema import resolve_colname_pair
+from .utils import get_mismatch_mask
+# -----------------------------------------------------------------------------/
+
+# 比對的欄位 (比對的是回填前的值)
+reconcile_colnames: list[str] = ["書名", "ISBN"]
+
+
+def find_mismatch(purc_df: pd.DataFrame, cata_df: pd.DataFrame):
+    """
+    `purc_df`, `cata_df` 需要先 `copy_as_index` ('採購序號' 為 index),
+    欄位對應與 `modules.schema.ColumnPlan` 相同 (`resolve_colname_pair`)
+    
+    一次比對所有對得到 '採購序號' 的 '交貨清單' / '編目箱單' 組合,
+    回傳不相等的清單 (採購序號, 箱號, 登錄號, 欄位, 兩邊的值; 依 '採購序號', '箱號' 排序)
+    """
+    pairs = {k: resolve_colname_pair(k, purc_df.columns, cata_df.columns)
+             for k in reconcile_colnames}
+    
+    # 重複的 '採購序號' 由 `modules.validate` 處理, 這裡只取第一筆
+    purc_part = purc_df.loc[purc_df.index.notna(), [p for p, _ in pairs.values()]]
+    purc_part = purc_part[~purc_part.index.duplicated()]
+    purc_part.columns = [f"_purc_{k}" for k in pairs]
+    
+    cata_part = cata_df.loc[cata_df.index.notna(), [c for _, c in pairs.values()] + ["箱號", "登錄號"]]
+    cata_part.columns = [f"_cata_{k}" for k in pairs] + ["箱號", "登錄號"]
+    
+    rows = cata_part.merge(purc_part, how="inner", sort=False,
+                           left_index=True, right_index=True)
+    
+    mismatch_dfs = []
+    for col_name in pairs:
+        is_mismatch, cata_value = get_mismatch_mask(col_name, rows[f"_purc_{col_name}"],
+                                                    rows[f"_cata_{col_name}"])
+        mismatch_dfs.append(pd.DataFrame({
+            "採購序號": rows.index[is_mismatch],
+            "箱號": rows["箱號"].to_numpy()[is_mismatch],
+            "登錄號": rows["登錄號"].to_numpy()[is_mismatch],
+            "欄位": col_name,
+            "交貨清單": rows[f"_purc_{col_name}"].to_numpy()[is_mismatch],
+            "編目箱單": cata_value.to_numpy()[is_mismatch],
+        }))
+    
+    mismatch_df = pd.concat(mismatch_dfs, ignore_index=True)
+    mismatch_df.sort_values(["採購序號", "箱號"], kind="stable", inplace=True)
+    
+    return mismatch_df.reset_index(drop=True)
+    # -------------------------------------------------------------------------/
+
+
+def show_mismatch(mismatch_df: pd.DataFrame, console: Console, log: EventLog = None):
+    """
+    `log` 不是 None 時寫入 `log` (terminal 只顯示一行 warning)
+    """
+    for purc_sn, box_no, reg_id, col_name, purc_value, cata_value in \
+            mismatch_df.itertuples(index=False, name=None):
+        if log is None:
+            console.print(f":warning: {col_name}不相等 "
+                          f"(採購序號 : {format_purc_sn(purc_sn)}, 箱號 : {box_no}, 登錄號 : {reg_id})\n"
+                          f"\t'交貨清單' : {purc_value}\n"
+                          f"\t'編目箱單' : {cata_value}")
+        else:
+            log.warning(f"{col_name}不相等", purc_sn=purc_sn,
+                        箱號=box_no, 登錄號=reg_id,
+                        交貨清單=purc_value, 編目箱單=cata_value)
+    
+    if len(mismatch_df) > 0:
+        console.print(f"[yellow]書名 / ISBN 不相等 : {len(mismatch_df)} 筆\n")
+    # -------------------------------------------------------------------------/
+
+
+def reconcile_catalog(purc_df: pd.DataFrame, cata_df: pd.DataFrame,
+                      console: Console, report_path: Path = None,
+                      log: EventLog = None):
+    """
+    回填前比對 '書名', 'ISBN', `report_path` 不是 None 時將不相等清單存成 CSV
+    
+    回傳不相等清單 (DataFrame)
+    """
+    mismatch_df = find_mismatch(purc_df, cata_df)
+    show_mismatch(mismatch_df, console, log)
+    
+    if report_path is not None:
+        # utf-8-sig : 讓 Excel 直接開啟 CSV 時中文不會變成亂碼
+        mismatch_df.to_csv(report_path, index=False, encoding="utf-8-sig")
+    
+    return mismatch_df
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,262 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+from rich.markup import escape
+# -----------------------------------------------------------------------------/
+
+# 格式改變時要 +1 (`PRAGMA user_version`)
+registry_version: int = 1
+
+# 問題的類型 (`RegistrationRegistry.check` 回傳的 '類型')
+registry_issues: dict = {
+    "重複": "同一次回填中重複的 '登錄號'",
+    "已登錄": "之前的回填已經使用過的 '登錄號'",
+    "缺號": "同一箱 '登錄號' 中間缺少的號碼",
+}
+
+# 不是 '登錄號' 的值 (套書的 annotation row)
+non_registered_values: set = set(["套書"])
+
+registry_schema: str = """
+CREATE TABLE IF NOT EXISTS registered (
+    reg_no      TEXT NOT NULL,  -- 登錄號
+    prefix      TEXT NOT NULL,  -- 登錄號 數字前面的部分
+    num         INTEGER,        -- 登錄號 最後的數字
+    box         INTEGER,        -- 箱號
+    purc_sn     INTEGER,        -- 採購序號
+    catalog     TEXT NOT NULL,  -- '編目箱單' (完整路徑)
+    tag         TEXT NOT NULL,  -- 同一個 '編目箱單' 回填到多個 '交貨清單' 時區分 (見 `Backfiller.tag`)
+    purchasing  TEXT NOT NULL,  -- '交貨清單' (檔名, 批次處理時為空白)
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registered_reg_no ON registered (reg_no);
+CREATE INDEX IF NOT EXISTS registered_source ON registered (catalog, tag);
+"""
+
+
+def to_registry_frame(df: pd.DataFrame, purc_sn_col: str):
+    """
+    取出 '登錄號', '箱號', '採購序號' (`purc_sn_col`, 例如 '編目箱單' 的 '原序號'),
+    去掉空白與不是 '登錄號' 的列 (合計列, 套書的 annotation row)
+    
+    '登錄號' 拆成數字前面的部分 (`prefix`) 與最後的數字 (`num`, 沒有數字時為 NA)
+    """
+    reg_no = df["登錄號"].astype("string").str.strip()
+    is_valid = (reg_no.notna() & (reg_no != "") & (~reg_no.isin(non_registered_values))).to_numpy()
+    
+    reg_df = pd.DataFrame({
+        "登錄號": reg_no[is_valid].to_numpy(),
+        "箱號": df["箱號"].to_numpy()[is_valid],
+        "採購序號": df[purc_sn_col].to_numpy()[is_valid],
+    })
+    reg_df["箱號"] = pd.to_numeric(reg_df["箱號"], errors="coerce").astype("Int64")
+    reg_df["採購序號"] = pd.to_numeric(reg_df["採購序號"], errors="coerce").astype("Int64")
+    
+    parts = reg_df["登錄號"].astype("string").str.extract(r"^(.*?)(\d+)$")
+    reg_df["prefix"] = parts[0].fillna(reg_df["登錄號"]).astype(object)
+    reg_df["digits"] = parts[1].str.len().astype("Int64")
+    reg_df["num"] = pd.to_numeric(parts[1], errors="coerce").astype("Int64")
+    
+    return reg_df
+    # -------------------------------------------------------------------------/
+
+
+def find_duplicates(reg_df: pd.DataFrame):
+    """
+    同一次回填中出現不只一次的 '登錄號' (每一列都列出)
+    """
+    dup_df = reg_df[reg_df["登錄號"].duplicated(keep=False)]
+    
+    return pd.DataFrame({
+        "類型": "重複",
+        "登錄號": dup_df["登錄號"],
+        "箱號": dup_df["箱號"],
+        "採購序號": dup_df["採購序號"],
+    }).sort_values(["登錄號", "箱號"], kind="stable")
+    # -------------------------------------------------------------------------/
+
+
+def find_gaps(reg_df: pd.DataFrame):
+    """
+    每一箱 (`箱號` + '登錄號' 的 prefix) 排序後中間缺少的號碼, 每一段缺號一列
+    (例如 'C0101' ~ 'C0104'), 只看這次回填的 '登錄號'
+    """
+    num_df = reg_df[reg_df["num"].notna()]
+    num_df = num_df.drop_duplicates(["箱號", "prefix", "num"])
+    num_df = num_df.sort_values(["箱號", "prefix", "num"], kind="stable")
+    
+    prev = num_df.groupby(["箱號", "prefix"], sort=False, dropna=False)["num"].shift()
+    is_gap = ((num_df["num"] - prev) > 1).fillna(False).to_numpy(dtype=bool)
+    
+    gap_df = num_df[is_gap]
+    start = (prev[is_gap] + 1).astype("int64").to_numpy()
+    end = (gap_df["num"] - 1).astype("int64").to_numpy()
+    digits = gap_df["digits"].astype("int64").to_numpy()
+    prefix = gap_df["prefix"].to_numpy()
+    
+    def format_no(i, num):
+        return f"{prefix[i]}{str(num).zfill(digits[i])}"
+    
+    return pd.DataFrame({
+        "類型": "缺號",
+        "登錄號": [format_no(i, start[i]) if start[i] == end[i] else
+                   f"{format_no(i, start[i])} ~ {format_no(i, end[i])}" for i in range(len(gap_df))],
+        "箱號": gap_df["箱號"].to_numpy(),
+        "採購序號": pd.array([pd.NA] * len(gap_df), dtype="Int64"),
+        "缺號數": end - start + 1,
+    })
+    # -------------------------------------------------------------------------/
+
+
+class RegistrationRegistry:
+    """
+    回填過的 '登錄號' 存在本機的 SQLite (`db_path`), 之後的回填一次檢查所有的 '登錄號'
+    是否已經使用過 (有 index, 歷史資料很多時也很快)
+    
+    - 每一筆記錄 '登錄號', '箱號', '採購序號' 與來源 ('編目箱單' 的路徑 + `tag`) 和 '交貨清單'
+    - 同一個來源重新回填時, 取代之前的記錄 (不會被當成重複)
+    - 每次操作各自開啟連線 (批次處理的 process, 常駐模式的 thread 都可以使用)
+    """
+    def __init__(self, db_path: Path, console: Console, timeout: float = 60.0):
+        """
+        `timeout` : 其他 process 正在寫入時, 最多等待幾秒
+        """
+        self.db_path: Path = Path(db_path)
+        self.console: Console = console
+        self.timeout: float = timeout
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, registry_version):
+                raise ValueError(f"登錄號資料庫的版本 ({version}) 不支援, "
+                                 f"請使用版本 {registry_version}. File: '{self.db_path}'")
+            conn.executescript(registry_schema)
+            conn.execute(f"PRAGMA user_version = {registry_version}")
+        # ---------------------------------------------------------------------/
+    
+    
+    @contextmanager
+    def connect(self):
+        """
+        結束時 commit (發生錯誤時 rollback) 並關閉連線
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL") # 讀取時不會被寫入擋住
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+        # ---------------------------------------------------------------------/
+    
+    
+    def __len__(self):
+        """
+        """
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM registered").fetchone()[0]
+        # ---------------------------------------------------------------------/
+    
+    
+    def find_registered(self, reg_df: pd.DataFrame, catalog: str, tag: str = ""):
+        """
+        `reg_df` (`to_registry_frame`) 中其他來源已經登錄過的 '登錄號'
+        
+        所有的 '登錄號' 先放進暫存 table, 再用 index 一次 join
+        """
+        reg_nos = pd.unique(reg_df["登錄號"])
+        with self.connect() as conn:
+            conn.execute("CREATE TEMP TABLE incoming (reg_no TEXT PRIMARY KEY) WITHOUT ROWID")
+            conn.executemany("INSERT OR IGNORE INTO incoming VALUES (?)",
+                             ((reg_no,) for reg_no in reg_nos))
+            found_df = pd.read_sql_query(
+                "SELECT r.reg_no, r.box, r.purc_sn, r.catalog, r.purchasing, r.recorded_at "
+                "FROM incoming AS i JOIN registered AS r ON r.reg_no = i.reg_no "
+                "WHERE NOT (r.catalog = ? AND r.tag = ?)",
+                conn, params=(catalog, tag))
+            conn.execute("DROP TABLE incoming")
+        
+        found_df = found_df.rename(columns={"reg_no": "登錄號", "box": "已登錄 箱號",
+                                            "purc_sn": "已登錄 採購序號", "catalog": "已登錄 編目箱單",
+                                            "purchasing": "已登錄 交貨清單",
+                                            "recorded_at": "登錄時間"})
+        for col in ["已登錄 箱號", "已登錄 採購序號"]:
+            found_df[col] = found_df[col].astype("Int64")
+        found_df = reg_df[["登錄號", "箱號", "採購序號"]].merge(found_df, on="登錄號")
+        found_df.insert(0, "類型", "已登錄")
+        
+        return found_df
+        # ---------------------------------------------------------------------/
+    
+    
+    def check(self, reg_df: pd.DataFrame, catalog: str, tag: str = ""):
+        """
+        檢查 `reg_df` (`to_registry_frame`) 的 '登錄號' (見 `registry_issues`)
+        
+        回傳所有問題 (DataFrame, '類型' 見 `registry_issues`), 沒有問題時為空
+        """
+        issue_dfs = [find_duplicates(reg_df),
+                     self.find_registered(reg_df, catalog, tag),
+                     find_gaps(reg_df)]
+        issue_dfs = [issue_df for issue_df in issue_dfs if len(issue_df) > 0]
+        if len(issue_dfs) == 0:
+            return pd.DataFrame(columns=["類型", "登錄號", "箱號", "採購序號"])
+        
+        return pd.concat(issue_dfs, ignore_index=True)
+        # ---------------------------------------------------------------------/
+    
+    
+    def register(self, reg_df: pd.DataFrame, catalog: str, tag: str = "",
+                 purchasing: str = ""):
+        """
+        記錄 `reg_df` (`to_registry_frame`) 的 '登錄號', 同一個來源之前的記錄會被取代
+        
+        回傳記錄的筆數
+        """
+        recorded_at = datetime.now().isoformat(timespec="seconds")
+        
+        def to_int(values: pd.Series):
+            return [None if pd.isna(v) else int(v) for v in values]
+        
+        rows = zip(reg_df["登錄號"].tolist(), reg_df["prefix"].tolist(),
+                   to_int(reg_df["num"]), to_int(reg_df["箱號"]), to_int(reg_df["採購序號"]))
+        with self.connect() as conn:
+            conn.execute("DELETE FROM registered WHERE catalog = ? AND tag = ?",
+                         (catalog, tag))
+            conn.executemany("INSERT INTO registered VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             ((*row, catalog, tag, purchasing, recorded_at) for row in rows))
+        
+        return len(reg_df)
+        # ---------------------------------------------------------------------/
+
+
+def show_registry_report(issue_df: pd.DataFrame, console: Console):
+    """
+    顯示 `RegistrationRegistry.check` 的結果 (每種問題的數量與前幾筆)
+    """
+    if len(issue_df) == 0:
+        console.print("[green]'登錄號' 檢查完成, 沒有重複或缺號")
+        return
+    
+    for issue, msg in registry_issues.items():
+        sub_df = issue_df[issue_df["類型"] == issue]
+        if len(sub_df) == 0:
+            continue
+        if issue == "缺號":
+            console.print(f"[yellow]:warning: {msg} : {len(sub_df)} 段 ({int(sub_df['缺號數'].sum())} 號)")
+        else:
+            console.print(f"[red]:warning: {msg} : {sub_df['登錄號'].nunique()} 個")
+        for row in sub_df.head(5).to_dict("records"):
+            detail = f"    '{escape(row['登錄號'])}' (箱號 {row['箱號']}"
+            if issue == "已登錄":
+                detail += f", 已登錄於 '{escape(Path(row['已登錄 編目箱單']).name)}'"
+            console.print(f"{detail})")
+        if len(sub_df) > 5:
+            console.print("    …")
+    console.line()
+    # -------------------------------------------------------------------------/
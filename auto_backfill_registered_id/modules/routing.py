@@ -0,0 +1,417 @@
+import hashlib
+import importlib.util
+import json
+import os
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from .backfiller import Backfiller
+from .cache import SheetCache, get_sheet_digests
+from .pipeline import get_report_path, load_catalog, load_purchasing
+from .registry import RegistrationRegistry
+from .schema import catalog_colalias, purchasing_colalias, purchasing_wsname
+# -----------------------------------------------------------------------------/
+
+# 格式改變時要 +1, 舊的索引會全部重建
+route_index_version: int = 1
+
+# 分配方式 (依優先順序)
+# - "ISBN" : '採購序號' + ISBN 只對應到一個 '交貨清單'
+# - "書名" : '採購序號' + 書名 ('書目' "/" 之前的部分) 只對應到一個 '交貨清單'
+# - "同序號" : ISBN 對不到, 但同一個 '採購序號' 的其他冊已經分配到同一個 '交貨清單' (套書各冊的 ISBN 不同)
+# - "採購序號" : 只有一個 '交貨清單' 有這個 '採購序號'
+# - "多個交貨清單" / "找不到" : 沒有分配, 存成 '(SR)未分配' CSV
+route_methods: tuple = ("ISBN", "書名", "同序號", "採購序號", "多個交貨清單", "找不到")
+
+
+def normalize_isbn(isbn: pd.Series):
+    """
+    只用在分配, 去掉 "-" 與空白並轉成大寫 (回填時的比對仍使用原本的值)
+    """
+    return isbn.astype("string").str.replace(r"[-\s]", "", regex=True).str.upper()
+    # -------------------------------------------------------------------------/
+
+
+def get_route_keys(purchasing_df: pd.DataFrame):
+    """
+    '交貨清單' 的 ('採購序號', ISBN, 書名), 沒有 '採購序號' 的列不會出現在索引中
+    """
+    purc_sn = purchasing_df[purchasing_colalias["採購序號"]]
+    keys = pd.DataFrame({
+        "purc_sn": purc_sn.astype("Int64"),
+        "isbn": normalize_isbn(purchasing_df[purchasing_colalias["ISBN"]]),
+        "title": purchasing_df[purchasing_colalias["書名"]].astype("string").str.strip(),
+    })
+    
+    return keys[purc_sn.notna().to_numpy()].reset_index(drop=True)
+    # -------------------------------------------------------------------------/
+
+
+def match_route_keys(cata_keys: pd.DataFrame, route_keys: pd.DataFrame, key: str):
+    """
+    以 ('採購序號', `key`) 對應, 回傳每一列 ('_pos') 對應到的 '交貨清單' 數與第一個 '交貨清單'
+    """
+    # merge 時 NA 會和 NA 相等, 要先排除
+    hits = cata_keys.dropna(subset=["purc_sn", key]).merge(
+        route_keys.dropna(subset=[key]), on=["purc_sn", key], how="inner")
+    
+    return hits.groupby("_pos")["wb"].agg(["nunique", "first"])
+    # -------------------------------------------------------------------------/
+
+
+def route_catalog(catalog_df: pd.DataFrame, route_keys: pd.DataFrame):
+    """
+    `route_keys` : 全部 '交貨清單' 的 (wb, purc_sn, isbn, title)
+    
+    回傳每一列 '編目箱單' (依 `catalog_df` 順序) 分配到的 '交貨清單' 與分配方式,
+    沒有分配到的 '交貨清單' 為 None (見 `route_methods`)
+    """
+    purc_sn = catalog_df[catalog_colalias["採購序號"]].astype("Int64").reset_index(drop=True)
+    cata_keys = pd.DataFrame({
+        "purc_sn": purc_sn,
+        "isbn": normalize_isbn(catalog_df[catalog_colalias["ISBN"]]).reset_index(drop=True),
+        # 與 `get_mismatch_mask` 相同, '書目' 只取 "/" 之前的部分
+        "title": catalog_df[catalog_colalias["書名"]].astype("string")
+                     .str.split("/").str[0].str.strip().reset_index(drop=True),
+        "_pos": np.arange(len(catalog_df)),
+    })
+    route_wb = pd.Series(None, index=cata_keys.index, dtype=object)
+    method = pd.Series("找不到", index=cata_keys.index, dtype=object)
+    
+    # 1. '採購序號' + ISBN, '採購序號' + 書名
+    for key, key_method in [("isbn", "ISBN"), ("title", "書名")]:
+        hit_wb = match_route_keys(cata_keys[method == "找不到"], route_keys, key)
+        is_unique = (hit_wb["nunique"] == 1).to_numpy()
+        route_wb[hit_wb.index[is_unique]] = hit_wb["first"][is_unique]
+        method[hit_wb.index[is_unique]] = key_method
+        method[hit_wb.index[~is_unique]] = "多個交貨清單"
+    
+    # 2. 同一個 '採購序號' 的其他冊已經分配
+    is_routed = route_wb.notna()
+    sibling_wb = pd.DataFrame({"purc_sn": purc_sn[is_routed], "wb": route_wb[is_routed]}) \
+        .groupby("purc_sn")["wb"].agg(["nunique", "first"])
+    sibling_wb = sibling_wb.loc[sibling_wb["nunique"] == 1, "first"]
+    is_left = (method == "找不到") & purc_sn.notna()
+    matched = purc_sn[is_left].map(sibling_wb).dropna()
+    route_wb[matched.index] = matched
+    method[matched.index] = "同序號"
+    
+    # 3. 只有一個 '交貨清單' 有這個 '採購序號'
+    sn_wb = route_keys.drop_duplicates(["purc_sn", "wb"]) \
+        .groupby("purc_sn")["wb"].agg(["nunique", "first"])
+    is_left = (method == "找不到") & purc_sn.notna()
+    n_wb = purc_sn[is_left].map(sn_wb["nunique"]).fillna(0)
+    matched = purc_sn[is_left][n_wb == 1].map(sn_wb["first"])
+    route_wb[matched.index] = matched
+    method[matched.index] = "採購序號"
+    method[n_wb.index[n_wb > 1]] = "多個交貨清單"
+    
+    return pd.DataFrame({"交貨清單": route_wb, "分配方式": method})
+    # -------------------------------------------------------------------------/
+
+
+class RouteIndex:
+    """
+    一個資料夾內所有 '交貨清單' 的 ('採購序號', ISBN) 索引, 存在 `index_dir`
+    
+    - manifest.json : 每個 '交貨清單' 的工作表 hash 與索引檔名
+    - 每個 '交貨清單' 一個 Arrow IPC 檔 (purc_sn, isbn, title)
+    - `update()` 只重新讀取 hash 改變 (或新增) 的 '交貨清單', 已刪除的移出索引
+    - 沒有安裝 `pyarrow` 或 `enabled=False` 時不存檔, 每次都重新讀取全部
+    """
+    def __init__(self, index_dir: Path, console: Console, enabled: bool = True):
+        """
+        """
+        self.index_dir: Path = Path(index_dir)
+        self.console: Console = console
+        self.enabled: bool = enabled
+        
+        if self.enabled and (importlib.util.find_spec("pyarrow") is None):
+            self.console.print(":warning: 沒有安裝 `pyarrow`, '交貨清單' 索引不存檔")
+            self.enabled = False
+        
+        if self.enabled:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+        
+        # {'交貨清單' path (str): {"digest", "file", "rows"}}
+        self.manifest: dict[str, dict] = {}
+        # {'交貨清單' path (str): (purc_sn, isbn, title)}
+        self.keys: dict[str, pd.DataFrame] = {}
+        # 這次執行讀取過的 '交貨清單' (回填時不用重新讀取)
+        self.purchasing_dfs: dict[str, pd.DataFrame] = {}
+        # ---------------------------------------------------------------------/
+    
+    
+    @property
+    def manifest_path(self):
+        """
+        """
+        return self.index_dir.joinpath("manifest.json")
+        # ---------------------------------------------------------------------/
+    
+    
+    def load_manifest(self):
+        """
+        """
+        if (not self.enabled) or (not self.manifest_path.exists()):
+            return {}
+        
+        try:
+            with open(self.manifest_path, mode="r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            self.console.print(f":warning: 索引損毀, 重新建立 ({e})")
+            return {}
+        if manifest.get("version") != route_index_version:
+            return {}
+        
+        return manifest["workbooks"]
+        # ---------------------------------------------------------------------/
+    
+    
+    def save_manifest(self):
+        """
+        """
+        if not self.enabled:
+            return
+        
+        # 先寫入暫存檔再改名, 中斷時不會留下寫到一半的 manifest
+        tmp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump({"version": route_index_version, "workbooks": self.manifest},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        # ---------------------------------------------------------------------/
+    
+    
+    def load_keys(self, wb_key: str):
+        """
+        由 Arrow 檔讀取一個 '交貨清單' 的索引, 沒有或損毀時回傳 None
+        """
+        path = self.index_dir.joinpath(self.manifest[wb_key]["file"])
+        if not path.exists():
+            return None
+        
+        import pyarrow as pa
+        try:
+            with pa.memory_map(str(path), "r") as source:
+                return pa.ipc.open_file(source).read_all().to_pandas()
+        except (pa.ArrowException, OSError) as e:
+            self.console.print(f":warning: 索引損毀, 重新讀取 : '{Path(wb_key).name}' ({e})")
+            return None
+        # ---------------------------------------------------------------------/
+    
+    
+    def save_keys(self, wb_key: str, digest: str, keys: pd.DataFrame):
+        """
+        """
+        file_name = f"{hashlib.sha256(wb_key.encode('utf-8')).hexdigest()}.arrow"
+        self.manifest[wb_key] = {"digest": digest, "file": file_name, "rows": len(keys)}
+        if not self.enabled:
+            return
+        
+        import pyarrow as pa
+        table = pa.Table.from_pandas(keys, preserve_index=False)
+        path = self.index_dir.joinpath(file_name)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        # ---------------------------------------------------------------------/
+    
+    
+    def update(self, purchasing_wbs: list[Path], backend: str = "openpyxl",
+               cache: SheetCache = None, compact: bool = False):
+        """
+        只重新讀取新增或修改過的 '交貨清單', 無法讀取的檔案會警告並略過
+        
+        回傳重新讀取的 '交貨清單'
+        """
+        old_manifest = self.load_manifest()
+        self.manifest = {}
+        self.keys = {}
+        updated: list[Path] = []
+        
+        for wb_path in purchasing_wbs:
+            wb_key = str(Path(wb_path).resolve())
+            try:
+                digest = get_sheet_digests(wb_path).get(purchasing_wsname)
+            except (KeyError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+                self.console.print(f":warning: 無法讀取 '{wb_path.name}', 略過 ({e})")
+                continue
+            if digest is None:
+                self.console.print(f":warning: '{wb_path.name}' 沒有 [工作表]'{purchasing_wsname}', 略過")
+                continue
+            
+            if (wb_key in old_manifest) and (old_manifest[wb_key]["digest"] == digest):
+                self.manifest[wb_key] = old_manifest[wb_key]
+                keys = self.load_keys(wb_key)
+                if keys is not None:
+                    self.keys[wb_key] = keys
+                    continue
+            
+            try:
+                purchasing_df = load_purchasing(wb_path, self.console, backend=backend,
+                                                cache=cache, compact=compact)
+            except ValueError as e:
+                self.console.print(f":warning: '{wb_path.name}' 讀取失敗, 略過 ({e})")
+                self.manifest.pop(wb_key, None)
+                continue
+            self.purchasing_dfs[wb_key] = purchasing_df
+            self.keys[wb_key] = get_route_keys(purchasing_df)
+            self.save_keys(wb_key, digest, self.keys[wb_key])
+            updated.append(wb_path)
+        
+        # 已刪除的 '交貨清單'
+        if self.enabled:
+            for wb_key in set(old_manifest) - set(self.manifest):
+                self.index_dir.joinpath(old_manifest[wb_key]["file"]).unlink(missing_ok=True)
+        self.save_manifest()
+        
+        self.console.print(f"'交貨清單' 索引 : {len(self.manifest)} 個檔案, "
+                           f"重新讀取 {len(updated)} 個")
+        
+        return updated
+        # ---------------------------------------------------------------------/
+    
+    
+    def route(self, catalog_df: pd.DataFrame):
+        """
+        見 `route_catalog`
+        """
+        route_keys = pd.concat([keys.assign(wb=wb_key) for wb_key, keys in self.keys.items()],
+                               ignore_index=True) if self.keys else \
+                     pd.DataFrame({"purc_sn": pd.Series(dtype="Int64"),
+                                   "isbn": pd.Series(dtype="string"),
+                                   "title": pd.Series(dtype="string"),
+                                   "wb": pd.Series(dtype=object)})
+        
+        return route_catalog(catalog_df, route_keys)
+        # ---------------------------------------------------------------------/
+    
+    
+    def get_purchasing(self, wb_key: str, backend: str = "openpyxl",
+                       cache: SheetCache = None, compact: bool = False):
+        """
+        這次執行已經讀取過的 '交貨清單' 不會重新讀取
+        """
+        if wb_key not in self.purchasing_dfs:
+            self.purchasing_dfs[wb_key] = load_purchasing(Path(wb_key), self.console,
+                                                          backend=backend, cache=cache,
+                                                          compact=compact)
+        
+        return self.purchasing_dfs[wb_key]
+        # ---------------------------------------------------------------------/
+
+
+def show_route_summary(route_df: pd.DataFrame, console: Console):
+    """
+    每個 '交貨清單' 分配到的筆數 (依分配方式)
+    """
+    table = Table(title="'編目箱單' 分配結果")
+    table.add_column("交貨清單")
+    for method in route_methods[:4]:
+        table.add_column(method, justify="right")
+    
+    routed = route_df[route_df["交貨清單"].notna()]
+    for wb_key, wb_df in routed.groupby("交貨清單", sort=False):
+        cnt = wb_df["分配方式"].value_counts()
+        table.add_row(Path(wb_key).name, *[str(cnt.get(m, 0)) for m in route_methods[:4]])
+    console.print(table)
+    
+    unrouted = route_df.loc[route_df["交貨清單"].isna(), "分配方式"].value_counts()
+    for method, cnt in unrouted.items():
+        console.print(f"[yellow]:warning: 沒有分配 ({method}) : {cnt} 筆")
+    # -------------------------------------------------------------------------/
+
+
+def run_routed(catalog_wb: Path, route_index: RouteIndex,
+               new_wb_dir: Path, console: Console, options: dict,
+               cache: SheetCache = None, registry: RegistrationRegistry = None):
+    """
+    一個 '編目箱單' 一次分配到所有相關的 '交貨清單' 並分別回填,
+    每個 '交貨清單' 各自輸出 '(SR)回填…_{交貨清單}' 與處理紀錄, 一個失敗不影響其他
+    
+    `options` : engine, validate, log_mode, writer, suggest, backend, compact, columnar
+    (與 `modules.batch.run_batch` 相同)
+    
+    回傳每個 '交貨清單' 的處理結果 (依 `route_index` 的順序)
+    """
+    catalog_df = load_catalog(catalog_wb, console, backend=options["backend"],
+                              cache=cache, compact=options["compact"])
+    console.print(len(catalog_df.index), "\n")
+    
+    route_df = route_index.route(catalog_df)
+    show_route_summary(route_df, console)
+    
+    is_unrouted = route_df["交貨清單"].isna().to_numpy()
+    if is_unrouted.any():
+        unrouted_df = catalog_df.loc[is_unrouted, ["箱號", catalog_colalias["採購序號"], "登錄號",
+                                                   catalog_colalias["書名"], catalog_colalias["ISBN"]]]
+        unrouted_df = unrouted_df.assign(分配方式=route_df["分配方式"].to_numpy()[is_unrouted])
+        # utf-8-sig : 讓 Excel 直接開啟 CSV 時中文不會變成亂碼
+        unrouted_df.to_csv(get_report_path(catalog_wb, new_wb_dir, "未分配", ".csv"),
+                           index=False, encoding="utf-8-sig")
+    
+    results = []
+    for wb_key in route_index.manifest:
+        is_routed = (route_df["交貨清單"] == wb_key).to_numpy()
+        if not is_routed.any():
+            continue
+        
+        result = {"purchasing": Path(wb_key), "status": "OK", "error": None,
+                  "rows": int(is_routed.sum()), "handled_type_cnt": None, "catalog_left": None}
+        backfiller = Backfiller(Path(wb_key), catalog_wb, new_wb_dir, console,
+                                engine=options["engine"], backend=options["backend"],
+                                cache=cache, log_mode=options["log_mode"],
+                                writer=options["writer"], compact=options["compact"],
+                                tag=Path(wb_key).stem, registry=registry,
+                                columnar=options["columnar"])
+        console.rule(f"'{Path(wb_key).name}' : {result['rows']} 筆")
+        try:
+            purchasing_df = route_index.get_purchasing(wb_key, backend=options["backend"],
+                                                       cache=cache, compact=options["compact"])
+            backfiller.run(purchasing_df, validate=options["validate"],
+                           suggest=options["suggest"],
+                           catalog_df=catalog_df[is_routed].reset_index(drop=True))
+            result["handled_type_cnt"] = dict(backfiller.handled_type_cnt)
+            result["catalog_left"] = len(backfiller.catalog_left)
+        except Exception as e:
+            result["status"] = "Error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        results.append(result)
+    
+    return results
+    # -------------------------------------------------------------------------/
+
+
+def show_routed_summary(results: list[dict], console: Console):
+    """
+    """
+    table = Table(title="回填結果 (多個交貨清單)")
+    table.add_column("交貨清單")
+    table.add_column("分配筆數", justify="right")
+    table.add_column("狀態")
+    table.add_column("處理模式")
+    table.add_column("編目箱單 未處理", justify="right")
+    
+    for result in results:
+        if result["status"] == "OK":
+            status = "[green]OK"
+            detail = ", ".join(f"{k}: {v}" for k, v in result["handled_type_cnt"].items())
+            left = str(result["catalog_left"])
+        else:
+            status = "[red]Error"
+            detail = result["error"]
+            left = "-"
+        table.add_row(result["purchasing"].name, str(result["rows"]), status, detail, left)
+    
+    console.print(table)
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,226 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tomllib # Python 3.11+
+except ImportError:
+    tomllib = None
+# -----------------------------------------------------------------------------/
+
+# 欄位設定 (修改欄位名稱只需要修改這個檔案)
+schema_path: Path = Path(__file__).parent.parent.joinpath("schema.toml")
+
+# `compact_dtype` 可用的值 (見 `modules.compact.compact_frame`)
+compact_dtypes: set = set(["category", "string[pyarrow]", "int"])
+
+
+def load_schema(path: Path):
+    """
+    讀取欄位設定 (TOML), 回傳一般的 dict
+    """
+    if not path.is_file():
+        raise ValueError(f"欄位設定檔不存在, Current path: '{path}'")
+    
+    with open(path, mode="r", encoding="utf-8") as f:
+        text = f.read()
+    if tomllib is not None:
+        return tomllib.loads(text)
+    
+    import tomlkit
+    return tomlkit.loads(text).unwrap()
+    # -------------------------------------------------------------------------/
+
+
+def check_schema(schema: dict, path: Path):
+    """
+    檢查欄位設定, 所有錯誤一次列出 (raise ValueError)
+    """
+    errors: list[str] = []
+    
+    sections = {"backfill": ["max_blank_rows", "subrow_colnames", "keep_number_format",
+                             "cata_match2purc", "cata_rp2_purc"],
+                "purchasing": ["wsname", "st_rowidx", "colnames", "required_colnames",
+                               "dtype", "colalias", "compact_dtype"],
+                "catalog": ["st_rowidx", "colnames", "required_colnames",
+                            "dtype", "colalias", "compact_dtype"]}
+    for section, keys in sections.items():
+        missing = [k for k in keys if k not in schema.get(section, {})]
+        if missing:
+            errors.append(f"[{section}] 缺少 : {missing}")
+    if errors:
+        raise ValueError(f"欄位設定錯誤 ('{path}') :\n" + "\n".join(errors))
+    
+    for section in ["purchasing", "catalog"]:
+        wb_schema = schema[section]
+        colnames = set(wb_schema["colnames"])
+        for key in ["required_colnames", "dtype", "compact_dtype"]:
+            unknown = [k for k in wb_schema[key] if k not in colnames]
+            if unknown:
+                errors.append(f"[{section}.{key}] 不在 colnames 中 : {unknown}")
+        unknown = [v for v in wb_schema["colalias"].values() if v not in colnames]
+        if unknown:
+            errors.append(f"[{section}.colalias] 不在 colnames 中 : {unknown}")
+        invalid = [k for k, v in wb_schema["compact_dtype"].items() if v not in compact_dtypes]
+        if invalid:
+            errors.append(f"[{section}.compact_dtype] 不支援的 dtype : {invalid}, 請使用 {sorted(compact_dtypes)}")
+        if "採購序號" not in wb_schema["colalias"]:
+            errors.append(f"[{section}.colalias] 缺少 '採購序號'")
+    
+    backfill = schema["backfill"]
+    purc_colnames = set(schema["purchasing"]["colnames"])
+    cata_colnames = set(schema["catalog"]["colnames"])
+    unknown = [k for k in backfill["subrow_colnames"] if k not in purc_colnames]
+    if unknown:
+        errors.append(f"[backfill.subrow_colnames] 不在 '交貨清單' colnames 中 : {unknown}")
+    for key in ["cata_match2purc", "cata_rp2_purc"]:
+        for k in backfill[key]:
+            if k == "部冊號":
+                if k not in cata_colnames:
+                    errors.append(f"[backfill.{key}] '部冊號' 不在 '編目箱單' colnames 中")
+            elif not ((k in purc_colnames) and (k in cata_colnames)):
+                missing = [s for s in ["purchasing", "catalog"] if k not in schema[s]["colalias"]]
+                if missing:
+                    errors.append(f"[backfill.{key}] '{k}' 兩邊沒有同名欄位, "
+                                  f"需要設定 colalias : {missing}")
+    is_category = [k for k in backfill["cata_rp2_purc"]
+                   if schema["purchasing"]["compact_dtype"].get(
+                       schema["purchasing"]["colalias"].get(k, k)) == "category"]
+    if is_category:
+        errors.append(f"[purchasing.compact_dtype] 回填的欄位不能使用 'category' : {is_category}")
+    if (not isinstance(backfill["max_blank_rows"], int)) or (backfill["max_blank_rows"] < 0):
+        errors.append("[backfill.max_blank_rows] 需要是 >= 0 的整數")
+    
+    if errors:
+        raise ValueError(f"欄位設定錯誤 ('{path}') :\n" + "\n".join(errors))
+    # -------------------------------------------------------------------------/
+
+
+schema: dict = load_schema(schema_path)
+check_schema(schema, schema_path)
+
+# 保留原始資料格式
+keep_number_format: dict = schema["backfill"]["keep_number_format"]
+
+# 相等檢查
+cata_match2purc: dict = schema["backfill"]["cata_match2purc"]
+
+# replace to 交貨清單
+cata_rp2_purc: dict = schema["backfill"]["cata_rp2_purc"]
+
+# 套書/副本 子列只保留的欄位
+selected_colnames: list[str] = schema["backfill"]["subrow_colnames"]
+
+# 讀取範圍: 只讀到最後一個 key column 有值的列, 連續幾列沒有值就停止讀取 (None : 讀到最後)
+max_blank_rows: int = schema["backfill"]["max_blank_rows"] or None
+
+# 交貨清單
+purchasing_wsname: str = schema["purchasing"]["wsname"]
+purchasing_st_rowidx: int = schema["purchasing"]["st_rowidx"]
+purchasing_colnames: set = set(schema["purchasing"]["colnames"])
+purchasing_required_colnames: list[str] = schema["purchasing"]["required_colnames"] # 程式直接使用, 回填前檢查
+purchasing_dtype: dict = schema["purchasing"]["dtype"]
+purchasing_colalias: dict = schema["purchasing"]["colalias"]
+purchasing_key_cols: set = set([purchasing_colalias["採購序號"]]) # 讀取範圍
+purchasing_compact_dtype: dict = schema["purchasing"]["compact_dtype"]
+
+# 編目箱單
+catalog_st_rowidx: int = schema["catalog"]["st_rowidx"]
+catalog_colnames: set = set(schema["catalog"]["colnames"])
+catalog_required_colnames: list[str] = schema["catalog"]["required_colnames"] # 程式直接使用, 回填前檢查
+catalog_dtype: dict = schema["catalog"]["dtype"]
+catalog_colalias: dict = schema["catalog"]["colalias"]
+catalog_key_cols: set = set([catalog_colalias["採購序號"]]) # 讀取範圍
+catalog_compact_dtype: dict = schema["catalog"]["compact_dtype"]
+catalog_usecols: set = set(catalog_dtype) | set(catalog_colalias.values()) # 其他 column 不會用到
+
+
+def resolve_colname_pair(col_name: str, purc_columns: pd.Index, cata_columns: pd.Index):
+    """
+    兩邊都有 `col_name` 才直接對應, 否則改用 alias (沒有 alias 時為 None)
+    """
+    if (col_name in purc_columns) and (col_name in cata_columns):
+        return col_name, col_name
+    
+    return purchasing_colalias.get(col_name), catalog_colalias.get(col_name)
+    # -------------------------------------------------------------------------/
+
+
+class ColumnPlan:
+    """
+    依實際讀取的 column 編譯一次欄位對應 (`cata_rp2_purc`, colalias, `selected_colnames`),
+    缺少或拼錯的欄位在回填前一次列出 (raise ValueError)
+    
+    - `pairs` : {共同名稱: ('交貨清單' 欄位, '編目箱單' 欄位)}, 依 `cata_rp2_purc` 的順序
+      ('部冊號' 為 ('書名' 的欄位, '部冊號'))
+    - `steps` : 逐筆回填使用的 column 位置 [(是否為 '部冊號', 交貨清單位置, 編目箱單位置)]
+    - `subrow_pos` : `selected_colnames` 在 '交貨清單' 的位置
+    """
+    def __init__(self, purc_columns: pd.Index, cata_columns: pd.Index):
+        """
+        """
+        self.purc_columns: pd.Index = pd.Index(purc_columns)
+        self.cata_columns: pd.Index = pd.Index(cata_columns)
+        
+        # {缺少的欄位: 共同名稱}
+        purc_missing: dict[str, str] = {}
+        cata_missing: dict[str, str] = {}
+        
+        def require(columns: pd.Index, missing: dict, col_name: str, k: str):
+            if (col_name is None) or (col_name not in columns):
+                missing.setdefault(col_name or k, k)
+        
+        self.pairs: dict[str, tuple[str, str]] = {}
+        for k in cata_rp2_purc.keys():
+            if k == "部冊號":
+                self.pairs[k] = (purchasing_colalias.get("書名", "書名"), k)
+            else:
+                self.pairs[k] = resolve_colname_pair(k, self.purc_columns, self.cata_columns)
+        match_pairs = {k: resolve_colname_pair(k, self.purc_columns, self.cata_columns)
+                       for k in cata_match2purc.keys()}
+        match_pairs["採購序號"] = (purchasing_colalias["採購序號"], catalog_colalias["採購序號"])
+        for k, (purc_col, cata_col) in {**self.pairs, **match_pairs}.items():
+            require(self.purc_columns, purc_missing, purc_col, k)
+            require(self.cata_columns, cata_missing, cata_col, k)
+        for col_name in purchasing_required_colnames + selected_colnames:
+            require(self.purc_columns, purc_missing, col_name, col_name)
+        for col_name in catalog_required_colnames:
+            require(self.cata_columns, cata_missing, col_name, col_name)
+        
+        if purc_missing or cata_missing:
+            lines = []
+            for wb_name, missing in [("交貨清單", purc_missing), ("編目箱單", cata_missing)]:
+                if missing:
+                    lines.append(f"'{wb_name}' 缺少欄位 : " +
+                                 ", ".join(f"'{c}'" if c == k else f"'{c}' ({k})"
+                                           for c, k in missing.items()))
+            raise ValueError("欄位設定與讀取的欄位不符 (請檢查標題列或 schema.toml) :\n"
+                             + "\n".join(lines))
+        
+        self.steps: list[tuple[bool, int, int]] = [
+            (k == "部冊號", self.purc_columns.get_loc(purc_col), self.cata_columns.get_loc(cata_col))
+            for k, (purc_col, cata_col) in self.pairs.items()]
+        self.subrow_colnames: list[str] = list(selected_colnames)
+        self.subrow_pos: np.ndarray = self.purc_columns.get_indexer(self.subrow_colnames)
+        # ---------------------------------------------------------------------/
+    
+    
+    def apply(self, purc_values: np.ndarray, cata_values: np.ndarray):
+        """
+        一列 '編目箱單' 的值回填到一列 '交貨清單' (依 column 位置), 回傳新的 list
+        """
+        values = list(purc_values)
+        
+        for is_booksn, purc_pos, cata_pos in self.steps:
+            value = cata_values[cata_pos]
+            # action1: '書名' = '書名' + '部冊號'
+            if is_booksn:
+                if not pd.isna(value):
+                    values[purc_pos] = f"{values[purc_pos]} - {value}"
+            # action2: replace target values in "編目箱單" to "交貨清單"
+            else:
+                values[purc_pos] = value
+        
+        return values
+        # ---------------------------------------------------------------------/
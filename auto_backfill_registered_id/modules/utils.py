@@ -1,15 +1,31 @@
 import inspect
-from copy import deepcopy
+import zipfile
+from collections import Counter
 from decimal import ROUND_HALF_UP, Decimal
 from pathlib import Path
+from xml.etree import ElementTree
 
 import numpy as np
 import pandas as pd
 import rich.progress
 import tomlkit
 from rich.console import Console
+from rich.markup import escape
+
+from .cache import SheetCache, get_sheet_digests
+from .eventlog import EventLog
+from .profiling import profiler
+from .reader import read_sheets
+from .schema import ColumnPlan
 # -----------------------------------------------------------------------------/
 
+# `sync_catalog_value` 會 raise 的錯誤
+handled_errors: dict = {
+    "E1": "'交貨清單' filtering 後偵測到多筆資料",
+    "E2": "'交貨清單' 總冊數 ≠ '編目箱單' 冊數",
+    "E3": "'交貨清單' 冊數(套書) or 數量(副本) 數值異常",
+}
+
 
 def load_config(path: Path,
                 console: Console):
@@ -29,6 +45,49 @@ def load_config(path: Path,
     # -------------------------------------------------------------------------/
 
 
+def show_sheet_extent(ws_name: str, extent: dict, console: Console):
+    """
+    顯示只讀取部分範圍時略過的儲存格 (`extent` 見 `modules.reader.ExtentTracker.to_dict`)
+    """
+    if extent is None:
+        return
+    
+    key_name = "' / '".join(extent["key_cols"])
+    if extent["n_skipped"] > 0:
+        cells = ", ".join(f"{coord}={escape(repr(value))}" for coord, value in extent["skipped"])
+        if extent["n_skipped"] > len(extent["skipped"]):
+            cells += ", …"
+        console.print(f":warning: Warning : [工作表]'{ws_name}' 最後一筆 '{key_name}' 在第 {extent['last_row']} 列, "
+                      f"之後有值的 {extent['n_skipped']} 個儲存格沒有讀取 : {cells}")
+    if (extent["stop_row"] is not None) and (extent["max_row"] or 0) > extent["stop_row"]:
+        console.print(f"[工作表]'{ws_name}' 連續 {extent['max_blank_rows']} 列沒有 '{key_name}', "
+                      f"第 {extent['stop_row'] + 1} ~ {extent['max_row']} 列沒有讀取")
+    # -------------------------------------------------------------------------/
+
+
+def check_ws_header(ws_df: pd.DataFrame, ws_name: str,
+                    default_key: set, console: Console,
+                    current_key: set = None, extent: dict = None):
+    """
+    只讀取部分 column 時, `current_key` 為工作表上完整的 column names
+    
+    只讀取部分範圍時, 同時顯示略過的儲存格 (見 `show_sheet_extent`)
+    """
+    # col name check
+    if current_key is None:
+        current_key = set(ws_df.keys())
+    diff_key = default_key.symmetric_difference(current_key)
+    if len(diff_key) > 0:
+        console.print(f":warning: Warning : [工作表]'{ws_name}' 的 Column Name 與 default 不同, \n"
+                      f"Default : {default_key}\n"
+                      f"Current : {current_key}\n"
+                      f"Difference : {diff_key}\n")
+    # show info
+    show_sheet_extent(ws_name, extent, console)
+    console.print(f"[工作表]'{ws_name}' row count : {len(ws_df.index)}")
+    # -------------------------------------------------------------------------/
+
+
 def read_ws(wb_path: Path,
             ws_name: str, ws_dtype: dict[str, str],
             colidx: int, default_key: set,
@@ -41,21 +100,97 @@ def read_ws(wb_path: Path,
     with rich.progress.open(wb_path, "rb", description=ws_name) as f:
         ws_df = pd.read_excel(f, engine="openpyxl", sheet_name=ws_name,
                               header=colidx, dtype=ws_dtype)
-    # col name check
-    current_key = set(ws_df.keys())
-    diff_key = default_key.symmetric_difference(current_key)
-    if len(diff_key) > 0:
-        console.print(f":warning: Warning : [工作表]'{ws_name}' 的 Column Name 與 default 不同, \n"
-                      f"Default : {default_key}\n"
-                      f"Current : {current_key}\n"
-                      f"Difference : {diff_key}\n")
-    # show info
-    console.print(f"[工作表]'{ws_name}' row count : {len(ws_df.index)}")
+    check_ws_header(ws_df, ws_name, default_key, console)
     
     return ws_df
     # -------------------------------------------------------------------------/
 
 
+def load_cached_sheets(wb_path: Path,
+                       ws_dtype: dict[str, str], colidx: int,
+                       console: Console,
+                       ws_names: list[str] = None,
+                       usecols: set = None,
+                       cache: SheetCache = None,
+                       key_cols: set = None, max_blank_rows: int = None):
+    """
+    由快取讀取沒有修改過的工作表
+    
+    回傳 ({ws_name: (DataFrame, 工作表上完整的 column names, 資料範圍) | None}, {ws_name: cache key},
+    需要解析的工作表), 沒有使用快取時需要解析的工作表為 `ws_names` (None 為全部)
+    """
+    ws_dfs: dict[str, tuple] = {}
+    cache_keys: dict[str, str] = {}
+    parse_names = ws_names
+    
+    if (cache is not None) and cache.enabled:
+        try:
+            digests = get_sheet_digests(wb_path)
+        except (KeyError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+            console.print(f":warning: 無法計算 '{wb_path.name}' 的 hash, 不使用快取 ({e})")
+            digests = {}
+        for ws_name, digest in digests.items():
+            if (ws_names is not None) and (ws_name not in ws_names):
+                continue
+            cache_keys[ws_name] = cache.make_key(digest, ws_name, ws_dtype, colidx, usecols,
+                                                 key_cols=key_cols, max_blank_rows=max_blank_rows)
+            ws_dfs[ws_name] = cache.load(cache_keys[ws_name])
+            if ws_dfs[ws_name] is not None:
+                console.print(f"[工作表]'{ws_name}' 使用快取")
+        if len(digests) > 0:
+            parse_names = [ws_name for ws_name, v in ws_dfs.items() if v is None]
+    
+    return ws_dfs, cache_keys, parse_names
+    # -------------------------------------------------------------------------/
+
+
+@profiler.profile()
+def read_wb(wb_path: Path,
+            ws_dtype: dict[str, str],
+            colidx: int, default_key: set,
+            console: Console,
+            ws_names: list[str] = None,
+            usecols: set = None,
+            backend: str = "openpyxl",
+            cache: SheetCache = None,
+            key_cols: set = None, max_blank_rows: int = None):
+    """
+    開啟一次 workbook 讀取所有 (或 `ws_names` 指定的) 工作表, 依工作表順序回傳
+    {ws_name: DataFrame}, 指定但不存在的工作表不會出現在結果中
+    
+    colidx 是 class attr
+    default_key 是 class attr
+    usecols : 只讀取這些 column, `None` 為全部
+    backend : 見 `modules.reader.reader_backends`
+    cache : 有給的話, 沒有修改過的工作表直接由快取讀取
+    key_cols : 只讀到最後一個 `key_cols` 有值的列, 連續 `max_blank_rows` 列沒有值時停止,
+    略過的儲存格顯示在 `console` (見 `modules.reader.ExtentTracker`)
+    """
+    ws_dfs, cache_keys, parse_names = load_cached_sheets(wb_path, ws_dtype, colidx, console,
+                                                         ws_names=ws_names, usecols=usecols,
+                                                         cache=cache, key_cols=key_cols,
+                                                         max_blank_rows=max_blank_rows)
+    
+    if (parse_names is None) or (len(parse_names) > 0):
+        with rich.progress.open(wb_path, "rb", description=wb_path.name) as f:
+            parsed = read_sheets(f, backend, colidx, ws_dtype,
+                                 usecols=usecols, ws_names=parse_names,
+                                 key_cols=key_cols, max_blank_rows=max_blank_rows)
+        for ws_name, (ws_df, all_names, extent) in parsed.items():
+            ws_dfs[ws_name] = (ws_df, all_names, extent)
+            if ws_name in cache_keys:
+                cache.save(cache_keys[ws_name], ws_df, all_names, extent)
+    
+    wb_dfs: dict[str, pd.DataFrame] = {}
+    for ws_name, (ws_df, all_names, extent) in ws_dfs.items():
+        check_ws_header(ws_df, ws_name, default_key, console,
+                        current_key=set(all_names), extent=extent)
+        wb_dfs[ws_name] = ws_df
+    
+    return wb_dfs
+    # -------------------------------------------------------------------------/
+
+
 # def set_df_dtype(df: pd.DataFrame, dtype:dict, colalias:dict):
 #     """
 #     """
@@ -66,15 +201,15 @@ def read_ws(wb_path: Path,
 #             df[key] = df[key].astype(dtype[key])
 #         else:
 #             df[key] = df[key].astype("string")
-    
+
 #     # ISBN
 #     isbn = colalias["ISBN"]
 #     df[isbn] = df[isbn].astype("Float64")
 #     df[isbn] = df[isbn].astype("Int64")
 #     df[isbn] = df[isbn].astype("string")
-    
+
 #     df[isbn] = np.where(pd.isna(df[isbn]), df[isbn], df[isbn].str.strip())
-    
+
 #     return df
 #     # -------------------------------------------------------------------------/
 
@@ -85,8 +220,10 @@ def col_strip(df: pd.DataFrame, col_name: str):
     assert pd.api.types.is_string_dtype(df[col_name])
     # df[col_name] = df[col_name].apply(lambda x: x.strip()).astype("string")
     
-    df[col_name] = np.where(pd.isna(df[col_name]), df[col_name], df[col_name].str.strip())
-    df[col_name] = df[col_name].astype("string")
+    with profiler.stage(f"col_strip({col_name})") as record:
+        df[col_name] = np.where(pd.isna(df[col_name]), df[col_name], df[col_name].str.strip())
+        df[col_name] = df[col_name].astype("string")
+        record["rows"] = len(df.index)
     # -------------------------------------------------------------------------/
 
 
@@ -99,150 +236,214 @@ def copy_as_index(df: pd.DataFrame, col_name: str, idx_name: str):
     # -------------------------------------------------------------------------/
 
 
-def val_match_check(col_name: str,
-                    purc_filtered: pd.DataFrame, purchasing_colalias: dict,
-                    cata_filtered: pd.DataFrame, catalog_colalias: dict,
-                    console:Console):
+class PurcSnIndex:
     """
+    '採購序號' -> row positions, 在 `copy_as_index` 之後建立一次
+    
+    已處理的資料以 bitmap 標記 (不會 drop / 重新配置 DataFrame),
+    `leftover()` 取得尚未處理的部分
     """
-    try:
-        purc_colidx_target = purc_filtered.columns.get_loc(col_name)
-        cata_colidx_target = cata_filtered.columns.get_loc(col_name)
-    except KeyError:
-        purc_colidx_target = purc_filtered.columns.get_loc(purchasing_colalias[col_name])
-        cata_colidx_target = cata_filtered.columns.get_loc(catalog_colalias[col_name])
+    def __init__(self, df: pd.DataFrame):
+        """
+        """
+        self.df: pd.DataFrame = df
+        # NA 不會被 filter 到, `groupby()` 預設也會排除 NA
+        self.positions: dict = df.groupby(level=0, sort=False).indices
+        self.consumed: np.ndarray = np.zeros(len(df), dtype=bool)
+        self.n_left: int = len(df)
+        self._values: np.ndarray = None
+        # ---------------------------------------------------------------------/
+    
+    
+    def __len__(self):
+        """
+        """
+        return self.n_left
+        # ---------------------------------------------------------------------/
+    
+    
+    def get_positions(self, purc_sn):
+        """
+        """
+        pos = self.positions.get(purc_sn, None)
+        if pos is None:
+            return np.empty(0, dtype=np.intp)
+        
+        return pos[~self.consumed[pos]]
+        # ---------------------------------------------------------------------/
     
-    # 交貨清單
-    purc_value = purc_filtered.iloc[0, purc_colidx_target]
     
-    # 編目箱單
-    cata_value = cata_filtered.iloc[0, cata_colidx_target]
-    if col_name == "書名":
-        cata_value = cata_value.split("/")[0].strip()
-    
-    # check value
-    if purc_value != cata_value:
-        # show msg
-        console.print(f":warning: {col_name}不相等\n"
-                      f"\t'交貨清單' : {purc_value}\n"
-                      f"\t'編目箱單' : {cata_value}")
-    # -------------------------------------------------------------------------/
+    def lookup(self, purc_sn):
+        """
+        """
+        return self.df.iloc[self.get_positions(purc_sn)]
+        # ---------------------------------------------------------------------/
+    
+    
+    def lookup_values(self, purc_sn):
+        """
+        與 `lookup` 相同的列, 回傳每一列的值 (object array, 依 column 位置; 整個 DataFrame 只轉換一次)
+        """
+        if self._values is None:
+            self._values = self.df.to_numpy(dtype=object)
+        
+        return self._values[self.get_positions(purc_sn)]
+        # ---------------------------------------------------------------------/
+    
+    
+    def lookup_column(self, purc_sn, col_name: str):
+        """
+        與 `lookup_values` 相同的列, 只取 `col_name` 的值
+        """
+        return self.lookup_values(purc_sn)[:, self.df.columns.get_loc(col_name)]
+        # ---------------------------------------------------------------------/
+    
+    
+    def consume(self, purc_sn):
+        """
+        """
+        pos = self.get_positions(purc_sn)
+        self.consumed[pos] = True
+        self.n_left -= len(pos)
+        # ---------------------------------------------------------------------/
+    
+    
+    def leftover(self):
+        """
+        """
+        return self.df[~self.consumed].copy()
+        # ---------------------------------------------------------------------/
 
 
-def update_cata_value(cata_rp2_purc:dict,
-                      purc_filtered: pd.DataFrame, purchasing_colalias: dict,
-                      cata_filtered: pd.DataFrame, catalog_colalias: dict,
-                      console:Console):
+class RowBuffer:
     """
+    收集輸出的每一列, 最後 `to_frame()` 一次建立 DataFrame (取代每一列都 `pd.concat`)
+    
+    `template` 決定 column 順序與 dtype, 無法轉回原本 dtype 的 column (例如 '登錄號'
+    寫入文字) 會和 `pd.concat` 一樣改用推斷的 dtype
     """
-    # copy as new df (independent)
-    _purc_filtered: pd.DataFrame = deepcopy(purc_filtered)
-    _cata_filtered: pd.DataFrame = deepcopy(cata_filtered)
+    def __init__(self, template: pd.DataFrame):
+        """
+        """
+        self.columns: pd.Index = template.columns
+        self.dtypes: pd.Series = template.dtypes
+        self.records: list[list] = []
+        self._colpos: dict[tuple, np.ndarray] = {}
+        # ---------------------------------------------------------------------/
+    
+    
+    def __len__(self):
+        """
+        """
+        return len(self.records)
+        # ---------------------------------------------------------------------/
+    
+    
+    def get_colpos(self, colnames: list[str]):
+        """
+        `colnames` 在輸出的 DataFrame 中的位置 (同樣的 `colnames` 只計算一次)
+        """
+        key = tuple(colnames)
+        if key not in self._colpos:
+            colpos = self.columns.get_indexer(colnames)
+            if (colpos < 0).any():
+                raise KeyError(f"Column 不在輸出的 DataFrame 中 : "
+                               f"{[c for c, i in zip(colnames, colpos) if i < 0]}")
+            self._colpos[key] = colpos
+        
+        return self._colpos[key]
+        # ---------------------------------------------------------------------/
     
-    assert len(_purc_filtered) == 1, "len(_purc_filtered) != 1"
-    assert len(_cata_filtered) == 1, "len(_cata_filtered) != 1"
     
-    # check '書名' and 'ISBN'
-    val_match_check("書名",
-                    _purc_filtered, purchasing_colalias,
-                    _cata_filtered, catalog_colalias,
-                    console)
-    val_match_check("ISBN",
-                    _purc_filtered, purchasing_colalias,
-                    _cata_filtered, catalog_colalias,
-                    console)
-    console.line()
+    def append_values(self, values: list, keep_pos: np.ndarray = None):
+        """
+        加入一列 (依輸出的 column 位置), 有指定 `keep_pos` 時只保留這些位置 (其餘為 NA)
+        """
+        if keep_pos is None:
+            self.records.append(list(values))
+            return
+        
+        record = [np.nan] * len(self.columns)
+        for i in keep_pos:
+            record[i] = values[i]
+        self.records.append(record)
+        # ---------------------------------------------------------------------/
     
-    for k in cata_rp2_purc.keys():
-        # action1: '書名' = '書名' + '部冊號'
-        if k == "部冊號":
-            # get idx for `df.iloc`
-            purc_colidx_bookname = _purc_filtered.columns.get_loc("書名")
-            cata_colidx_booksn = _cata_filtered.columns.get_loc(k)
-            # update `booksn` after `bookname`
-            if not pd.isna(_cata_filtered.iloc[0, cata_colidx_booksn]):
-                _purc_filtered.iloc[0, purc_colidx_bookname] = \
-                    (f"{_purc_filtered.iloc[0, purc_colidx_bookname]}"
-                     f" - {_cata_filtered.iloc[0, cata_colidx_booksn]}")
-        # action2: replace target values in "編目箱單" to "交貨清單"
-        else:
-            try:
-                purc_colidx_target = _purc_filtered.columns.get_loc(k)
-                cata_colidx_target = _cata_filtered.columns.get_loc(k)
-            except KeyError:
-                purc_colidx_target = _purc_filtered.columns.get_loc(purchasing_colalias[k])
-                cata_colidx_target = _cata_filtered.columns.get_loc(catalog_colalias[k])
-            _purc_filtered.iloc[0, purc_colidx_target] = \
-                                _cata_filtered.iloc[0, cata_colidx_target]
+    
+    def to_frame(self):
+        """
+        """
+        df = pd.DataFrame(self.records, columns=self.columns, dtype=object)
         
-    return _purc_filtered
+        return cast_frame(df, self.dtypes)
+        # ---------------------------------------------------------------------/
+
+
+def cast_frame(df: pd.DataFrame, dtypes: pd.Series):
+    """
+    `df` 的 column 轉回 `dtypes`, 無法轉換的 column (例如 '登錄號' 寫入文字) 改用推斷的 dtype
+    """
+    for col_name, dtype in dtypes.items():
+        try:
+            df[col_name] = df[col_name].astype(dtype)
+        except (TypeError, ValueError):
+            df[col_name] = df[col_name].infer_objects()
+    
+    return df
     # -------------------------------------------------------------------------/
 
 
-def case_normal(df: pd.DataFrame, cata_rp2_purc:dict,
-                purc_filtered: pd.DataFrame, purchasing_colalias: dict,
-                cata_filtered: pd.DataFrame, catalog_colalias: dict,
-                console:Console):
+def concat_frames(dfs: list[pd.DataFrame], dtypes: pd.Series):
     """
+    依序合併 `dfs` (缺少的 column 為 NA), 結果以 `cast_frame` 轉回 `dtypes`
+    
+    先全部轉成 object 再合併, 沒有資料或全部是 NA 的部分不會影響結果的 dtype
+    (`pd.concat` 的這個行為已經 deprecated), 與 `RowBuffer.to_frame` 的 dtype 相同
     """
-    tmp_df = update_cata_value(cata_rp2_purc,
-                               purc_filtered, purchasing_colalias,
-                               cata_filtered, catalog_colalias,
-                               console)
+    df = pd.concat([df.astype(object) for df in dfs], ignore_index=True)
     
-    return pd.concat([df, tmp_df], ignore_index=True)
+    return cast_frame(df, dtypes)
     # -------------------------------------------------------------------------/
 
 
-def case_bookset(df: pd.DataFrame, cata_rp2_purc:dict,
-                 purc_filtered: pd.DataFrame, purchasing_colalias: dict,
-                 cata_filtered: pd.DataFrame, catalog_colalias: dict,
-                 console:Console):
+def case_normal(df: RowBuffer, column_plan: ColumnPlan,
+                purc_values: np.ndarray, cata_values: np.ndarray):
     """
+    `purc_values`, `cata_values` 為 filtering 後每一列的值 (見 `PurcSnIndex.lookup_values`),
+    依 `column_plan` 的 column 位置回填 ('書名', 'ISBN' 的比對在回填前一次完成, 見 `modules.reconcile`)
     """
-    selected_colnames = [
-        '序號', '採購序號', '原始序號', '箱號', '登錄號', '書名', '作者', '出版社', '出版年', 'ISBN',
-        '館藏地代碼', '資料類型/特藏號', # '定價', '折扣價\n79折', '總冊數', '數量', '小計',
-        '主題分類', '得獎/推薦1', '得獎/推薦2', '套書/複本', '書單來源', '分類號', # '冊數', '單位',
-    ]
+    df.append_values(column_plan.apply(purc_values[0], cata_values[0]))
     
+    return df
+    # -------------------------------------------------------------------------/
+
+
+def case_bookset(df: RowBuffer, column_plan: ColumnPlan,
+                 purc_values: np.ndarray, cata_values: np.ndarray):
+    """
+    """
     # annotation row ("登錄號" column = "套書")
-    tmp_df = deepcopy(purc_filtered)
-    tmp_df["登錄號"] = "套書"
-    df = pd.concat([df, tmp_df], ignore_index=True)
+    anno_values = list(purc_values[0])
+    anno_values[column_plan.purc_columns.get_loc("登錄號")] = "套書"
+    df.append_values(anno_values)
     
-    for i in range(len(cata_filtered)):
-        tmp_df = update_cata_value(cata_rp2_purc,
-                                   purc_filtered, purchasing_colalias,
-                                   pd.DataFrame([cata_filtered.iloc[i]]), catalog_colalias,
-                                   console)
-        df = pd.concat([df, tmp_df.loc[:, selected_colnames]], ignore_index=True)
+    for cata_row in cata_values:
+        df.append_values(column_plan.apply(purc_values[0], cata_row), column_plan.subrow_pos)
     
     return df
     # -------------------------------------------------------------------------/
 
 
-def case_bookcopy(df: pd.DataFrame, cata_rp2_purc:dict,
-                  purc_filtered: pd.DataFrame, purchasing_colalias: dict,
-                  cata_filtered: pd.DataFrame, catalog_colalias: dict,
-                  console:Console):
+def case_bookcopy(df: RowBuffer, column_plan: ColumnPlan,
+                  purc_values: np.ndarray, cata_values: np.ndarray):
     """
     """
-    selected_colnames = [
-        '序號', '採購序號', '原始序號', '箱號', '登錄號', '書名', '作者', '出版社', '出版年', 'ISBN',
-        '館藏地代碼', '資料類型/特藏號', # '定價', '折扣價\n79折', '總冊數', '數量', '小計',
-        '主題分類', '得獎/推薦1', '得獎/推薦2', '套書/複本', '書單來源', '分類號', # '冊數', '單位',
-    ]
-    
-    for i in range(len(cata_filtered)):
-        tmp_df = update_cata_value(cata_rp2_purc,
-                                   purc_filtered, purchasing_colalias,
-                                   pd.DataFrame([cata_filtered.iloc[i]]), catalog_colalias,
-                                   console)
+    for i, cata_row in enumerate(cata_values):
+        values = column_plan.apply(purc_values[0], cata_row)
         if i == 0:
-            df = pd.concat([df, tmp_df], ignore_index=True)
+            df.append_values(values)
         else:
-            df = pd.concat([df, tmp_df.loc[:, selected_colnames]], ignore_index=True)
+            df.append_values(values, column_plan.subrow_pos)
     
     return df
     # -------------------------------------------------------------------------/
@@ -260,7 +461,7 @@ def case_bookcopy(df: pd.DataFrame, cata_rp2_purc:dict,
 #                                    pd.DataFrame([cata_filtered.iloc[i]]), catalog_colalias,
 #                                    console)
 #         df = pd.concat([df, tmp_df], ignore_index=True)
-    
+
 #     return df
 #     # -------------------------------------------------------------------------/
 
@@ -297,79 +498,285 @@ def msg_booknum_mismatch(purc_filtered: pd.DataFrame, purchasing_colalias: dict,
     # -------------------------------------------------------------------------/
 
 
-def sync_catalog_value(df: pd.DataFrame, filter: str, cata_rp2_purc:dict,
-                       purc_df: pd.DataFrame, purchasing_colalias: dict,
-                       cata_df: pd.DataFrame, catalog_colalias: dict,
-                       console:Console):
+def log_book_info(log: EventLog, purc_sn, purc_index: PurcSnIndex, colalias: dict,
+                  handled_type: str, cata_index: PurcSnIndex):
     """
+    `show_row_info` 的 JSON Lines 版本, 加上處理模式和 '編目箱單' 的 '登錄號'
+    """
+    log.book(purc_index.lookup_column(purc_sn, colalias["採購序號"])[0],
+             purc_index.lookup_column(purc_sn, colalias["ISBN"])[0],
+             purc_index.lookup_column(purc_sn, colalias["書名"])[0], handled_type,
+             cata_index.lookup_column(purc_sn, "登錄號").tolist())
+    # -------------------------------------------------------------------------/
+
+
+def sync_catalog_value(df: RowBuffer, filter: str, column_plan: ColumnPlan,
+                       purc_index: PurcSnIndex, purchasing_colalias: dict,
+                       cata_index: PurcSnIndex, catalog_colalias: dict,
+                       console:Console, log: EventLog = None):
+    """
+    `log` 不是 None 時, 每本書的處理結果寫入 `log` (terminal 只顯示 warning / error)
+    
+    `column_plan` : 依 `purc_index`, `cata_index` 的 column 編譯的欄位對應
+    (見 `modules.schema.ColumnPlan`)
     """
     # reset variables
     handled_type: str = None
     
-    # filtering uid
-    purc_filtered = deepcopy(purc_df[(purc_df.index == filter)])
-    cata_filtered = deepcopy(cata_df[(cata_df.index == filter)])
+    # filtering uid (只取 row positions, DataFrame 只在顯示訊息時建立)
+    n_purc = len(purc_index.get_positions(filter))
+    n_cata = len(cata_index.get_positions(filter))
     
     # Error 1: 交貨清單不是唯一值
-    if len(purc_filtered) != 1:
-        msg_booknum_mismatch(purc_filtered, purchasing_colalias,
+    if n_purc != 1:
+        msg_booknum_mismatch(purc_index.lookup(filter), purchasing_colalias,
                              None, catalog_colalias, console)
-        raise ValueError("'交貨清單' filtering 後偵測到多筆資料")
+        if log is not None:
+            log.error(handled_errors["E1"], purc_sn=filter)
+        raise ValueError(handled_errors["E1"])
     # show current book info
-    show_row_info(purc_filtered.iloc[0], purchasing_colalias, console)
-    console.line()
+    if log is None:
+        show_row_info(purc_index.lookup(filter).iloc[0], purchasing_colalias, console)
+        console.line()
     
-    if len(cata_filtered) == 0:
-        console.print("[yellow]本次該書沒有交貨\n")
+    if n_cata == 0:
+        if log is None:
+            console.print("[yellow]本次該書沒有交貨\n")
         handled_type = "沒有交貨"
+        if log is not None:
+            log_book_info(log, filter, purc_index, purchasing_colalias,
+                          handled_type, cata_index)
         return df, handled_type
     
     # Error 2: '交貨清單' 總冊數 ≠ '編目箱單' 冊數
-    if purc_filtered.iloc[0]["總冊數"] != len(cata_filtered):
-        msg_booknum_mismatch(purc_filtered, purchasing_colalias,
-                             cata_filtered, catalog_colalias, console)
-        raise ValueError("'交貨清單' 總冊數 ≠ '編目箱單' 冊數")
-    
-    if (len(purc_filtered) == 1) and (len(cata_filtered) == 1):
+    if purc_index.lookup_column(filter, "總冊數")[0] != n_cata:
+        msg_booknum_mismatch(purc_index.lookup(filter), purchasing_colalias,
+                             cata_index.lookup(filter), catalog_colalias, console)
+        if log is not None:
+            log.error(handled_errors["E2"], purc_sn=filter)
+        raise ValueError(handled_errors["E2"])
+    
+    if (n_purc == 1) and (n_cata == 1):
         # Normal case
-        df = case_normal(df, cata_rp2_purc,
-                         purc_filtered, purchasing_colalias,
-                         cata_filtered, catalog_colalias,
-                         console)
+        df = case_normal(df, column_plan,
+                         purc_index.lookup_values(filter),
+                         cata_index.lookup_values(filter))
         handled_type = "Normal Case"
-    elif (len(purc_filtered) == 1) and (len(cata_filtered) > len(purc_filtered)):
-        if purc_filtered.iloc[0]["冊數"] > 1:
+    elif (n_purc == 1) and (n_cata > n_purc):
+        if purc_index.lookup_column(filter, "冊數")[0] > 1:
             # 套書
-            df = case_bookset(df, cata_rp2_purc,
-                              purc_filtered, purchasing_colalias,
-                              cata_filtered, catalog_colalias,
-                              console)
+            df = case_bookset(df, column_plan,
+                              purc_index.lookup_values(filter),
+                              cata_index.lookup_values(filter))
             handled_type = "套書"
-        elif purc_filtered.iloc[0]["數量"] > 1:
+        elif purc_index.lookup_column(filter, "數量")[0] > 1:
             # 副本
-            df = case_bookcopy(df, cata_rp2_purc,
-                               purc_filtered, purchasing_colalias,
-                               cata_filtered, catalog_colalias,
-                               console)
+            df = case_bookcopy(df, column_plan,
+                               purc_index.lookup_values(filter),
+                               cata_index.lookup_values(filter))
             handled_type = "副本"
         else:
-            msg_booknum_mismatch(purc_filtered, purchasing_colalias,
-                                 cata_filtered, catalog_colalias, console)
-            raise ValueError("'交貨清單' 冊數(套書) or 數量(副本) 數值異常")
+            msg_booknum_mismatch(purc_index.lookup(filter), purchasing_colalias,
+                                 cata_index.lookup(filter), catalog_colalias, console)
+            if log is not None:
+                log.error(handled_errors["E3"], purc_sn=filter)
+            raise ValueError(handled_errors["E3"])
     else:
         raise ValueError("Unexpected Error")
     
+    if log is not None:
+        log_book_info(log, filter, purc_index, purchasing_colalias,
+                      handled_type, cata_index)
     
     if handled_type is not None:
-        purc_df.drop(purc_filtered.index, inplace=True)
-        cata_df.drop(cata_filtered.index, inplace=True)
+        purc_index.consume(filter)
+        cata_index.consume(filter)
     
     return df, handled_type
     # -------------------------------------------------------------------------/
 
 
-def add_total_sum(df: pd.DataFrame):
+def get_mismatch_mask(col_name: str, purc_value: pd.Series, cata_value: pd.Series):
     """
+    '書名', 'ISBN' 的比對規則 ('書目' 只比對 "/" 之前的部分, NA 只和 NA 相等)
+    
+    回傳 (不相等的 bool array, 比對用的 '編目箱單' 值)
+    """
+    purc_value = purc_value.astype("string")
+    cata_value = cata_value.astype("string")
+    if col_name == "書名":
+        cata_value = cata_value.str.split("/").str[0].str.strip()
+    
+    is_mismatch = (purc_value != cata_value).to_numpy(dtype=bool, na_value=True)
+    is_mismatch &= ~(purc_value.isna().to_numpy() & cata_value.isna().to_numpy())
+    
+    return is_mismatch, cata_value
+    # -------------------------------------------------------------------------/
+
+
+def classify_purc_sn(purc_df: pd.DataFrame, cata_df: pd.DataFrame):
+    """
+    `sync_catalog_value` 判斷規則的向量化版本, 每個 '採購序號' (依 `purc_df` 順序) 一列
+    
+    - n_purc, n_cata : filtering 後的筆數
+    - handled_type : 處理模式, 錯誤時為 None
+    - error : `handled_errors` 的 key, 無錯誤時為 None
+    - processed : 原本的迴圈是否會處理到這一列 ('編目箱單' 清空後就 break)
+    """
+    purc_sn = purc_df.index
+    purc_pos = np.arange(len(purc_sn))
+    
+    # filtering 筆數 (NA 永遠 filter 不到任何資料)
+    cata_cnt = cata_df.index.value_counts(dropna=True)
+    n_purc = purc_sn.value_counts(dropna=True).reindex(purc_sn).fillna(0).to_numpy(dtype=np.int64)
+    n_cata = cata_cnt.reindex(purc_sn).fillna(0).to_numpy(dtype=np.int64)
+    
+    total_book = purc_df["總冊數"].to_numpy(dtype=np.float64, na_value=np.nan)
+    book_vol = purc_df["冊數"].to_numpy(dtype=np.float64, na_value=np.nan)
+    book_num = purc_df["數量"].to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    is_e1 = (n_purc != 1)
+    is_nodelivery = ~is_e1 & (n_cata == 0)
+    is_e2 = ~is_e1 & ~is_nodelivery & ~(total_book == n_cata)
+    is_ok = ~is_e1 & ~is_nodelivery & ~is_e2
+    is_normal = is_ok & (n_cata == 1)
+    is_multi = is_ok & (n_cata > 1)
+    is_bookset = is_multi & (book_vol > 1)
+    is_bookcopy = is_multi & ~is_bookset & (book_num > 1)
+    is_e3 = is_multi & ~is_bookset & ~is_bookcopy
+    
+    handled_type = np.select([is_nodelivery, is_normal, is_bookset, is_bookcopy],
+                             ["沒有交貨", "Normal Case", "套書", "副本"], default=None)
+    error = np.select([is_e1, is_e2, is_e3], ["E1", "E2", "E3"], default=None)
+    
+    # 原本的迴圈在 '編目箱單' 清空後就會 break,
+    # 只有每一筆 '編目箱單' 都對得到 '採購序號' 時才會清空
+    if len(cata_df) == 0:
+        last_pos = 0
+    else:
+        first_pos = pd.Series(purc_pos, index=purc_sn)
+        first_pos = first_pos[~first_pos.index.duplicated()]
+        cata_pos = first_pos.reindex(cata_cnt.index)
+        if cata_df.index.hasnans or cata_pos.isna().any():
+            last_pos = len(purc_sn) - 1
+        else:
+            last_pos = int(cata_pos.max())
+    
+    return pd.DataFrame({
+        "n_purc": n_purc,
+        "n_cata": n_cata,
+        "handled_type": handled_type,
+        "error": error,
+        "processed": purc_pos <= last_pos,
+    }, index=purc_sn)
+    # -------------------------------------------------------------------------/
+
+
+def sync_catalog_bulk(column_plan: ColumnPlan,
+                      purc_df: pd.DataFrame, purchasing_colalias: dict,
+                      cata_df: pd.DataFrame, catalog_colalias: dict,
+                      console: Console, log: EventLog = None):
+    """
+    一次處理所有 '採購序號' (取代逐筆呼叫 `sync_catalog_value` 的迴圈),
+    輸出的列順序與 `handled_type_cnt` 和原本的迴圈相同。
+    
+    已處理的資料會從 `purc_df`, `cata_df` 移除 (inplace), 剩下的就是未處理的部分
+    """
+    plan = classify_purc_sn(purc_df, cata_df)
+    processed = plan["processed"].to_numpy()
+    
+    # Error: 和原本的迴圈一樣, 停在第一筆有問題的 '採購序號'
+    err_pos = np.flatnonzero(processed & plan["error"].notna().to_numpy())
+    if len(err_pos) > 0:
+        err_sn = plan.index[err_pos[0]]
+        err_key = plan["error"].iloc[err_pos[0]]
+        purc_filtered = purc_df[(purc_df.index == err_sn)]
+        cata_filtered = cata_df[(cata_df.index == err_sn)] if err_key != "E1" else None
+        msg_booknum_mismatch(purc_filtered, purchasing_colalias,
+                             cata_filtered, catalog_colalias, console)
+        if log is not None:
+            log.error(handled_errors[err_key], purc_sn=err_sn)
+        raise ValueError(handled_errors[err_key])
+    
+    handled_type = plan["handled_type"].to_numpy()
+    handled_type_cnt = Counter(handled_type[processed])
+    
+    # 需要回填的 '採購序號' (Normal Case, 套書, 副本)
+    matched_mask = processed & np.isin(handled_type, ["Normal Case", "套書", "副本"])
+    matched_pos = np.flatnonzero(matched_mask)
+    matched_sn = purc_df.index[matched_pos]
+    
+    purc_part = purc_df.iloc[matched_pos].copy()
+    purc_part["_purc_pos"] = matched_pos
+    purc_part["_handled_type"] = handled_type[matched_pos]
+    
+    # '編目箱單' 只取要回填的欄位, 一次 merge 到 '交貨清單'
+    rp2_pairs: dict[str, tuple[str, str]] = column_plan.pairs
+    cata_srcs = list(dict.fromkeys([cata_col for _, cata_col in rp2_pairs.values()]))
+    cata_part = cata_df.loc[cata_df.index.isin(matched_sn), cata_srcs]
+    cata_part.columns = [f"_cata_{c}" for c in cata_srcs]
+    cata_part["_cata_pos"] = np.arange(len(cata_part))
+    
+    rows = cata_part.merge(purc_part, how="inner", sort=False,
+                           left_index=True, right_index=True,
+                           validate="many_to_one")
+    rows.sort_values(["_purc_pos", "_cata_pos"], kind="stable", inplace=True)
+    rows.reset_index(drop=True, inplace=True)
+    
+    # action1: '書名' = '書名' + '部冊號'
+    # action2: replace target values in "編目箱單" to "交貨清單"
+    for k, (purc_col, cata_col) in rp2_pairs.items():
+        cata_value = rows[f"_cata_{cata_col}"]
+        if k == "部冊號":
+            bookname = rows[purc_col].astype("string").fillna("<NA>")
+            rows[purc_col] = rows[purc_col].where(cata_value.isna(),
+                                                  bookname + " - " + cata_value.astype("string"))
+        else:
+            rows[purc_col] = cata_value
+    
+    # annotation row ("登錄號" column = "套書")
+    anno_rows = purc_part[purc_part["_handled_type"] == "套書"].copy()
+    anno_rows["登錄號"] = "套書"
+    anno_rows["_cata_pos"] = -1
+    
+    # 套書的每一冊, 副本的第二本之後 => 只保留 `column_plan.subrow_colnames`
+    book_rank = rows.groupby("_purc_pos", sort=False).cumcount().to_numpy()
+    is_subrow = ((rows["_handled_type"] == "套書").to_numpy() |
+                 ((rows["_handled_type"] == "副本").to_numpy() & (book_rank > 0)))
+    sort_cols = ["_purc_pos", "_cata_pos"]
+    
+    parts = [anno_rows.loc[:, list(purc_df.columns) + sort_cols],
+             rows.loc[~is_subrow, list(purc_df.columns) + sort_cols],
+             rows.loc[is_subrow, column_plan.subrow_colnames + sort_cols]]
+    order = np.lexsort((np.concatenate([part["_cata_pos"].to_numpy() for part in parts]),
+                        np.concatenate([part["_purc_pos"].to_numpy() for part in parts])))
+    # dtype 與逐筆回填相同 (`RowBuffer.to_frame`)
+    new_df = concat_frames([part.loc[:, part.columns.difference(sort_cols, sort=False)]
+                            for part in parts], purc_df.dtypes)
+    new_df = new_df.iloc[order].loc[:, list(purc_df.columns)].reset_index(drop=True)
+    
+    # 每本書的處理結果 (依原本迴圈的順序)
+    if log is not None:
+        reg_ids = rows.groupby("_purc_pos", sort=False)["登錄號"].agg(list).to_dict()
+        processed_pos = np.flatnonzero(processed)
+        purc_info = purc_df.iloc[processed_pos][[purchasing_colalias["採購序號"],
+                                                 purchasing_colalias["ISBN"],
+                                                 purchasing_colalias["書名"]]]
+        for pos, (purc_sn, isbn, bookname) in zip(processed_pos,
+                                                  purc_info.itertuples(index=False)):
+            log.book(purc_sn, isbn, bookname, handled_type[pos], reg_ids.get(pos, []))
+    
+    # 移除已處理的資料
+    purc_df.drop(matched_sn, inplace=True)
+    cata_df.drop(matched_sn, inplace=True)
+    
+    return new_df, handled_type_cnt
+    # -------------------------------------------------------------------------/
+
+
+def get_total_sum(df: pd.DataFrame):
+    """
+    回傳 ('總冊數' 合計, '小計' 合計 (Decimal, 四捨五入到整數))
     """
     total_book = df["總冊數"].sum()
     
@@ -377,6 +784,15 @@ def add_total_sum(df: pd.DataFrame):
     total_ntd = Decimal(df["小計"].sum())
     total_ntd = total_ntd.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
     
+    return total_book, total_ntd
+    # -------------------------------------------------------------------------/
+
+
+def add_total_sum(df: pd.DataFrame):
+    """
+    """
+    total_book, total_ntd = get_total_sum(df)
+    
     total_row = pd.DataFrame({
             "書名": ["合計"],
             "總冊數": [total_book],
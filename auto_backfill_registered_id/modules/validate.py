@@ -0,0 +1,85 @@
+import io
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+
+from .utils import (PurcSnIndex, classify_purc_sn, handled_errors,
+                    msg_booknum_mismatch)
+# -----------------------------------------------------------------------------/
+
+
+def find_backfill_errors(purc_df: pd.DataFrame, cata_df: pd.DataFrame):
+    """
+    `purc_df`, `cata_df` 需要先 `copy_as_index` ('採購序號' 為 index)
+    
+    一次檢查所有 '採購序號', 回傳回填時會 raise 錯誤的部分 (`classify_purc_sn` 的結果),
+    '編目箱單' 清空後原本的迴圈就不會再處理的列不算錯誤
+    """
+    plan = classify_purc_sn(purc_df, cata_df)
+    errors = plan[plan["processed"] & plan["error"].notna()]
+    
+    # 重複的 '採購序號' (E1) 只列一次
+    return errors[~errors.index.duplicated()]
+    # -------------------------------------------------------------------------/
+
+
+def show_validation_report(errors: pd.DataFrame, n_unmatched: int,
+                           purc_df: pd.DataFrame, purchasing_colalias: dict,
+                           cata_df: pd.DataFrame, catalog_colalias: dict,
+                           console: Console):
+    """
+    以 `msg_booknum_mismatch` 的格式列出每一筆錯誤, 最後顯示各錯誤的數量
+    """
+    purc_index = PurcSnIndex(purc_df)
+    cata_index = PurcSnIndex(cata_df)
+    
+    for purc_sn, error in zip(errors.index, errors["error"]):
+        console.rule()
+        console.print(f":x: {handled_errors[error]}")
+        msg_booknum_mismatch(purc_index.lookup(purc_sn), purchasing_colalias,
+                             cata_index.lookup(purc_sn) if error != "E1" else None,
+                             catalog_colalias, console)
+        console.line()
+    
+    console.rule()
+    error_cnt = Counter(errors["error"])
+    for error, msg in handled_errors.items():
+        if error_cnt[error] > 0:
+            console.print(f"[red]{msg} : {error_cnt[error]}")
+    if n_unmatched > 0:
+        console.print(f"[yellow]'編目箱單' 找不到對應的 '採購序號' : {n_unmatched}")
+    if len(errors) == 0:
+        console.print("[green]驗證完成, 沒有發現錯誤")
+    console.line()
+    # -------------------------------------------------------------------------/
+
+
+def validate_catalog(purc_df: pd.DataFrame, purchasing_colalias: dict,
+                     cata_df: pd.DataFrame, catalog_colalias: dict,
+                     console: Console, report_path: Path = None):
+    """
+    回填前先檢查全部的 '採購序號', 一次列出所有錯誤 (而不是停在第一筆)
+    
+    `report_path` 不是 None 時, 同時將報告存成文字檔
+    
+    回傳有錯誤的 '採購序號' (DataFrame, 沒有錯誤時為空)
+    """
+    errors = find_backfill_errors(purc_df, cata_df)
+    n_unmatched = int(np.count_nonzero(~cata_df.index.isin(purc_df.index.dropna())))
+    
+    show_validation_report(errors, n_unmatched,
+                           purc_df, purchasing_colalias,
+                           cata_df, catalog_colalias, console)
+    
+    if report_path is not None:
+        report_console = Console(record=True, file=io.StringIO(), width=console.width)
+        show_validation_report(errors, n_unmatched,
+                               purc_df, purchasing_colalias,
+                               cata_df, catalog_colalias, report_console)
+        report_console.save_text(report_path)
+    
+    return errors
+    # -------------------------------------------------------------------------/
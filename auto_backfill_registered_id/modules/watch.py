@@ -0,0 +1,237 @@
+import io
+import queue
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+
+from .backfiller import Backfiller
+from .batch import find_catalog_wbs
+from .cache import SheetCache
+from .pipeline import get_output_paths, load_purchasing
+from .registry import RegistrationRegistry
+from .schema import purchasing_colalias
+from .utils import copy_as_index
+# -----------------------------------------------------------------------------/
+
+
+def get_file_sig(path: Path):
+    """
+    (mtime_ns, size), 檔案不存在時回傳 None
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    
+    return (stat.st_mtime_ns, stat.st_size)
+    # -------------------------------------------------------------------------/
+
+
+class CatalogWatcher:
+    """
+    常駐模式: '交貨清單' 只讀取一次並保留在記憶體, 定期檢查 `catalog_dir`,
+    新增或修改的 '編目箱單' 放進工作佇列, 由 worker thread 逐一回填
+    
+    - 檔案在連續兩次檢查都沒有變化時才處理 (避免處理還在複製中的檔案)
+    - '(SR)回填' 比 '編目箱單' 與 '交貨清單' 都新的檔案不會重新處理 (重新啟動時)
+    - '交貨清單' 修改時重新讀取, 之後所有的 '編目箱單' 都會重新處理
+    - 工作佇列有上限 (`queue_size`), 佇列滿的時候, 其他檔案留到下一次檢查再加入
+    """
+    def __init__(self, purchasing_wb: Path, catalog_dir: Path,
+                 new_wb_dir: Path, console: Console,
+                 options: dict, cache: SheetCache = None,
+                 poll_interval: float = 5.0, queue_size: int = 8,
+                 registry: RegistrationRegistry = None):
+        """
+        `options` : engine, validate, log_mode, writer, suggest, backend, compact, columnar
+        (與 `modules.batch.run_batch` 相同)
+        """
+        self.purchasing_wb: Path = Path(purchasing_wb)
+        self.catalog_dir: Path = Path(catalog_dir)
+        self.new_wb_dir: Path = Path(new_wb_dir)
+        self.console: Console = console
+        self.options: dict = options
+        self.cache: SheetCache = cache
+        self.registry: RegistrationRegistry = registry
+        self.poll_interval: float = poll_interval
+        
+        self.jobs: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        
+        self.purchasing_df: pd.DataFrame = None
+        self.purchasing_sig: tuple = None
+        # 上一次檢查時的 (mtime_ns, size), 用來判斷檔案是否已經寫完
+        self.last_sigs: dict[Path, tuple] = {}
+        # 已經處理過 (或正在佇列中) 的檔案與當時的 (mtime_ns, size)
+        self.handled_sigs: dict[Path, tuple] = {}
+        # ---------------------------------------------------------------------/
+    
+    
+    def load_purchasing(self):
+        """
+        讀取 '交貨清單' 並先 `copy_as_index` (每個 '編目箱單' 使用複本)
+        """
+        sig = get_file_sig(self.purchasing_wb)
+        purchasing_df = load_purchasing(self.purchasing_wb, self.console,
+                                        backend=self.options["backend"], cache=self.cache,
+                                        compact=self.options["compact"])
+        copy_as_index(purchasing_df, purchasing_colalias["採購序號"], "purc_sn")
+        
+        with self.lock:
+            self.purchasing_df = purchasing_df
+            self.purchasing_sig = sig
+            # 之前的結果是用舊的 '交貨清單' 回填的
+            self.handled_sigs = {}
+        self.console.print(f"[green]'交貨清單' 已讀取 : {len(purchasing_df.index)} 筆 "
+                           f"('{self.purchasing_wb.name}')")
+        # ---------------------------------------------------------------------/
+    
+    
+    def is_up_to_date(self, catalog_wb: Path):
+        """
+        '(SR)回填' 比 '編目箱單' 與 '交貨清單' 都新
+        """
+        new_wb, _ = get_output_paths(catalog_wb, self.new_wb_dir)
+        new_sig = get_file_sig(new_wb)
+        if new_sig is None:
+            return False
+        
+        return new_sig[0] >= max(get_file_sig(catalog_wb)[0], self.purchasing_sig[0])
+        # ---------------------------------------------------------------------/
+    
+    
+    def poll(self):
+        """
+        檢查一次 '交貨清單' 與 `catalog_dir`, 回傳這次加入佇列的檔案數
+        """
+        # '交貨清單' : 修改完成 (連續兩次相同) 後重新讀取
+        purchasing_sig = get_file_sig(self.purchasing_wb)
+        if (purchasing_sig is not None) and (purchasing_sig != self.purchasing_sig):
+            if purchasing_sig == self.last_sigs.get(self.purchasing_wb):
+                self.console.print("[yellow]'交貨清單' 已修改, 重新讀取")
+                try:
+                    self.load_purchasing()
+                except Exception as e:
+                    self.console.print(f"[red]:x: '交貨清單' 讀取失敗, 繼續使用舊的資料 ({type(e).__name__}: {e})")
+                    self.purchasing_sig = purchasing_sig
+        current_sigs = {self.purchasing_wb: purchasing_sig}
+        
+        n_queued = 0
+        for catalog_wb in find_catalog_wbs(str(self.catalog_dir)):
+            sig = get_file_sig(catalog_wb)
+            if sig is None:
+                continue
+            current_sigs[catalog_wb] = sig
+            
+            # 還在寫入, 或已經處理過
+            if sig != self.last_sigs.get(catalog_wb):
+                continue
+            with self.lock:
+                if self.handled_sigs.get(catalog_wb) == sig:
+                    continue
+            if self.is_up_to_date(catalog_wb):
+                with self.lock:
+                    self.handled_sigs[catalog_wb] = sig
+                continue
+            
+            try:
+                self.jobs.put_nowait((catalog_wb, sig))
+            except queue.Full:
+                break
+            with self.lock:
+                self.handled_sigs[catalog_wb] = sig
+            n_queued += 1
+        
+        self.last_sigs = current_sigs
+        
+        return n_queued
+        # ---------------------------------------------------------------------/
+    
+    
+    def backfill(self, catalog_wb: Path):
+        """
+        回填一個 '編目箱單', 輸出 '(SR)回填' 與 '(SR)處理紀錄' (與批次處理相同)
+        """
+        with self.lock:
+            purchasing_df = self.purchasing_df
+        
+        # JSON Lines 模式不保留文字紀錄
+        is_jsonl = (self.options["log_mode"] == "jsonl")
+        console = Console(record=(not is_jsonl), file=io.StringIO())
+        backfiller = Backfiller(None, catalog_wb, self.new_wb_dir, console,
+                                engine=self.options["engine"],
+                                backend=self.options["backend"], cache=self.cache,
+                                log_mode=self.options["log_mode"],
+                                writer=self.options["writer"],
+                                compact=self.options["compact"], registry=self.registry,
+                                columnar=self.options["columnar"])
+        
+        start = time.perf_counter()
+        try:
+            backfiller.run(purchasing_df, validate=self.options["validate"],
+                           suggest=self.options["suggest"])
+        except Exception as e:
+            self.console.print(f"[red]:x: '{catalog_wb.name}' : {type(e).__name__}: {e} "
+                               f"(見 '{backfiller.new_log.name}')")
+            return
+        
+        detail = ", ".join(f"{k}: {v}" for k, v in backfiller.handled_type_cnt.items())
+        self.console.print(f"[green]:heavy_check_mark: '{catalog_wb.name}' "
+                           f"({time.perf_counter() - start:.1f} s) {detail}")
+        # ---------------------------------------------------------------------/
+    
+    
+    def work(self):
+        """
+        worker thread
+        """
+        while not self.stop_event.is_set():
+            try:
+                catalog_wb, sig = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                # 在佇列中又被修改, 等下一次檢查重新加入
+                if get_file_sig(catalog_wb) == sig:
+                    self.backfill(catalog_wb)
+            finally:
+                self.jobs.task_done()
+        # ---------------------------------------------------------------------/
+    
+    
+    def run(self, max_polls: int = None):
+        """
+        持續執行直到 Ctrl+C 或 `stop()` (`max_polls` : 檢查次數上限, 測試用)
+        """
+        self.load_purchasing()
+        self.console.print(f"監看 '{self.catalog_dir}' (每 {self.poll_interval} 秒), Ctrl+C 結束")
+        
+        worker = threading.Thread(target=self.work, name="backfill-worker", daemon=True)
+        worker.start()
+        
+        n_polls = 0
+        try:
+            while not self.stop_event.is_set():
+                self.poll()
+                n_polls += 1
+                if (max_polls is not None) and (n_polls >= max_polls):
+                    self.jobs.join()
+                    break
+                self.stop_event.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            self.console.print("[yellow]結束監看 (等待處理中的檔案完成)")
+        finally:
+            self.stop_event.set()
+            worker.join()
+        # ---------------------------------------------------------------------/
+    
+    
+    def stop(self):
+        """
+        """
+        self.stop_event.set()
+        # ---------------------------------------------------------------------/
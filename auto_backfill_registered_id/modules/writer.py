@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+# -----------------------------------------------------------------------------/
+
+# 輸出 Excel 的方式
+# - "pandas" : `DataFrame.to_excel` (整個 workbook 放在記憶體)
+# - "stream" : openpyxl write-only, 一列一列寫入 (記憶體固定)
+# - "patch" : 複製原本的 '交貨清單', 只寫入有改變的儲存格 (見 `modules.patch`)
+# - "diff" : 只輸出 "patch" 的修改清單, 不寫入任何 workbook (dry run)
+excel_writers = ("pandas", "stream", "patch", "diff")
+patch_writers = ("patch", "diff")
+
+# 與 `DataFrame.to_excel` 的標題列相同的格式
+header_font = Font(bold=True)
+header_border = Border(left=Side(style="thin"), right=Side(style="thin"),
+                       top=Side(style="thin"), bottom=Side(style="thin"))
+header_alignment = Alignment(horizontal="center", vertical="top")
+
+
+def to_number_format(fmt: str):
+    """
+    Python format spec (`keep_number_format` 的值) 轉成 Excel 的 number format
+    
+    例如 "04" -> "0000" (補零到 4 位), "0" -> "0" (整數)
+    """
+    if (len(fmt) > 1) and fmt.startswith("0") and fmt[1:].isdigit():
+        return "0" * int(fmt[1:])
+    if fmt.isdigit():
+        return "0"
+    
+    raise ValueError(f"不支援的數字格式 : '{fmt}'")
+    # -------------------------------------------------------------------------/
+
+
+def iter_df_rows(df: pd.DataFrame, columns: list[str]):
+    """
+    依 `columns` 的順序逐列取出數值 (NA -> None), `df` 沒有的 column 為 None
+    """
+    n_row = len(df)
+    values = []
+    for col_name in columns:
+        if col_name in df.columns:
+            values.append(df[col_name].to_numpy(dtype=object, na_value=None))
+        else:
+            values.append([None] * n_row)
+    
+    return zip(*values)
+    # -------------------------------------------------------------------------/
+
+
+def write_sheet_stream(wb_path: Path, ws_name: str, columns: list[str],
+                       parts: list, number_formats: dict[str, str] = None):
+    """
+    以 write-only 模式寫入單一工作表, 不需要先把所有資料 concat 成一個 DataFrame
+    
+    - `parts` : DataFrame 或 int (空白列數), 依序寫入
+    - `number_formats` : {col_name: Python format spec}, 以儲存格格式保留原始資料格式
+    """
+    number_formats = {} if number_formats is None else number_formats
+    col_formats = [to_number_format(number_formats[col_name])
+                   if col_name in number_formats else None
+                   for col_name in columns]
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(ws_name)
+    
+    # header
+    header = []
+    for col_name in columns:
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.font = header_font
+        cell.border = header_border
+        cell.alignment = header_alignment
+        header.append(cell)
+    ws.append(header)
+    
+    for part in parts:
+        if isinstance(part, int):
+            for _ in range(part):
+                ws.append([])
+            continue
+        
+        for row in iter_df_rows(part, columns):
+            row = list(row)
+            for i, fmt in enumerate(col_formats):
+                if (fmt is not None) and (row[i] is not None):
+                    cell = WriteOnlyCell(ws, value=row[i])
+                    cell.number_format = fmt
+                    row[i] = cell
+            ws.append(row)
+    
+    wb.save(wb_path)
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,46 @@
+# 測試共用的 fixture
+#
+# 在 `auto_backfill_registered_id` 資料夾執行 `python -m pytest -q`
+
+import io
+
+import pytest
+from bench.generate import generate_workbooks
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+
+@pytest.fixture
+def console():
+    """
+    不顯示的 console (`console.file.getvalue()` 取得輸出的文字)
+    """
+    return Console(file=io.StringIO(), width=200)
+    # -------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="session")
+def make_workbooks(tmp_path_factory):
+    """
+    以 `bench.generate` 產生 '交貨清單' / '編目箱單' (同樣的參數只產生一次),
+    回傳 ('交貨清單' path, '編目箱單' path)
+    """
+    made: dict[tuple, tuple] = {}
+    
+    def make(n_rows: int = 60, **kwargs):
+        key = (n_rows, tuple(sorted(kwargs.items())))
+        if key not in made:
+            made[key] = generate_workbooks(n_rows, tmp_path_factory.mktemp("data"), **kwargs)
+        return made[key]
+    
+    return make
+    # -------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="session")
+def workbooks(make_workbooks):
+    """
+    預設比例 (套書, 副本, 沒有交貨, 書名/ISBN 不相等) 的測試資料
+    """
+    return make_workbooks()
+    # -------------------------------------------------------------------------/
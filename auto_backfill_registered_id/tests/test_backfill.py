@@ -0,0 +1,95 @@
+import warnings
+
+import openpyxl
+import pandas as pd
+import pytest
+from modules.pipeline import (backfill_engines, export_backfill,
+                              load_catalog, load_purchasing, report_backfill,
+                              run_backfill)
+# -----------------------------------------------------------------------------/
+
+# 只有 Normal Case, 只有套書, 只有副本, 全部混合 (含沒有交貨)
+case_ratios: dict[str, dict] = {
+    "normal": {"bookset_ratio": 0.0, "bookcopy_ratio": 0.0, "nodelivery_ratio": 0.0},
+    "bookset": {"bookset_ratio": 1.0, "bookcopy_ratio": 0.0, "nodelivery_ratio": 0.0},
+    "bookcopy": {"bookset_ratio": 0.0, "bookcopy_ratio": 1.0, "nodelivery_ratio": 0.0},
+    "mixed": {},
+}
+
+
+def run_engine(paths: tuple, engine: str, console):
+    """
+    讀取並回填 (pandas 的 FutureWarning 視為錯誤), 回傳 (`run_backfill` 的結果, '編目箱單' 筆數)
+    """
+    purchasing_df = load_purchasing(paths[0], console)
+    catalog_df = load_catalog(paths[1], console)
+    n_catalog = len(catalog_df)
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        return run_backfill(purchasing_df, catalog_df, console, engine=engine), n_catalog
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("case", list(case_ratios))
+def test_engines_produce_identical_frames(make_workbooks, console, case):
+    """
+    "bulk" 與 "loop" 的 new_df (值, dtype, 列順序), 處理模式統計與剩下的資料都相同
+    """
+    paths = make_workbooks(40, **case_ratios[case])
+    results = {engine: run_engine(paths, engine, console) for engine in backfill_engines}
+    (bulk, n_catalog), (loop, _) = results["bulk"], results["loop"]
+    
+    pd.testing.assert_frame_equal(bulk[0], loop[0])
+    assert bulk[1] == loop[1]
+    pd.testing.assert_frame_equal(bulk[2], loop[2])
+    pd.testing.assert_frame_equal(bulk[3], loop[3])
+    
+    # 每一筆回填的 '編目箱單' 一列, 套書另外多一列 annotation row
+    new_df, handled_type_cnt, _, catalog_left = bulk
+    assert len(new_df) == n_catalog - len(catalog_left) + handled_type_cnt["套書"]
+    expected_type = {"normal": "Normal Case", "bookset": "套書", "bookcopy": "副本"}.get(case)
+    if expected_type is not None:
+        assert set(handled_type_cnt) == {expected_type}
+    # '採購序號' 依 '交貨清單' 的順序
+    assert new_df["採購序號"].is_monotonic_increasing
+    # '套書' 的 annotation row 在每一冊之前
+    if case == "bookset":
+        first_rows = new_df.groupby("採購序號", sort=False).head(1)
+        assert (first_rows["登錄號"] == "套書").all()
+    # -------------------------------------------------------------------------/
+
+
+def test_subrows_keep_only_subrow_columns(make_workbooks, console):
+    """
+    套書的每一冊, 副本的第二本之後沒有 '小計' (合計不會重複計算)
+    """
+    (new_df, handled_type_cnt, _, _), _ = run_engine(make_workbooks(40, **case_ratios["bookcopy"]),
+                                                     "bulk", console)
+    first = ~new_df["採購序號"].duplicated()
+    
+    assert new_df.loc[first, "小計"].notna().all()
+    assert new_df.loc[~first, "小計"].isna().all()
+    assert new_df.loc[~first, "登錄號"].notna().all()
+    # -------------------------------------------------------------------------/
+
+
+def test_pandas_writer(workbooks, console, tmp_path):
+    """
+    writer="pandas" : new_df + 5 列空白 + 沒有處理到的 '交貨清單', '採購序號' 補零
+    """
+    (new_df, handled_type_cnt, purchasing_left, _), _ = run_engine(workbooks, "bulk", console)
+    new_df = report_backfill(new_df, handled_type_cnt, console)
+    new_wb = tmp_path.joinpath("(SR)回填.xlsx")
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        export_backfill(new_df, purchasing_left, new_wb, writer="pandas")
+    
+    ws = openpyxl.load_workbook(new_wb, read_only=True)["交貨清單"]
+    rows = list(ws.iter_rows(values_only=True))
+    assert len(rows) == 1 + len(new_df) + 5 + len(purchasing_left)
+    assert rows[len(new_df)][5] == "合計"
+    assert all(v is None for row in rows[len(new_df) + 1:len(new_df) + 6] for v in row)
+    assert rows[1][1] == f"{int(new_df['採購序號'].iloc[0]):04}"
+    # -------------------------------------------------------------------------/
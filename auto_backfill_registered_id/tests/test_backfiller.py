@@ -0,0 +1,61 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+from modules.backfiller import Backfiller
+from modules.pipeline import (load_catalog, load_purchasing, report_backfill,
+                              run_backfill)
+from modules.registry import RegistrationRegistry
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+
+def test_run_matches_pipeline(workbooks, console, tmp_path):
+    """
+    `run()` 的結果與直接呼叫 `modules.pipeline` 相同, 並輸出 '(SR)回填', 報告與 '(SR)處理紀錄'
+    """
+    record_console = Console(record=True, file=io.StringIO(), width=200)
+    backfiller = Backfiller(*workbooks, tmp_path, record_console)
+    
+    backfiller.run()
+    
+    backfill_df, handled_type_cnt, purchasing_left, catalog_left = \
+        run_backfill(load_purchasing(workbooks[0], console), load_catalog(workbooks[1], console),
+                     console)
+    pd.testing.assert_frame_equal(backfiller.new_df,
+                                  report_backfill(backfill_df, handled_type_cnt, console))
+    assert backfiller.handled_type_cnt == handled_type_cnt
+    pd.testing.assert_frame_equal(backfiller.purchasing_left, purchasing_left)
+    pd.testing.assert_frame_equal(backfiller.catalog_left, catalog_left)
+    
+    assert backfiller.new_wb.exists()
+    assert "驗證完成" in backfiller.report_path().read_text(encoding="utf-8")
+    assert backfiller.report_path("書名ISBN不相等", ".csv").exists()
+    assert "合計 (總冊數)" in backfiller.new_log.read_text(encoding="utf-8")
+    # -------------------------------------------------------------------------/
+
+
+def test_run_logs_error_before_raising(workbooks, console, tmp_path):
+    """
+    '登錄號' 檢查在回填前檢查之前; 驗證失敗時記錄 "error" 事件, 不會輸出 '(SR)回填'
+    """
+    purchasing_df = load_purchasing(workbooks[0], console)
+    purchasing_df.loc[1, "採購序號"] = purchasing_df.loc[0, "採購序號"]
+    registry = RegistrationRegistry(tmp_path.joinpath("登錄號.sqlite"), console)
+    backfiller = Backfiller(None, workbooks[1], tmp_path, console,
+                            log_mode="jsonl", registry=registry)
+    
+    with pytest.raises(ValueError, match="驗證失敗"):
+        backfiller.run(purchasing_df)
+    
+    with open(backfiller.new_log, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    assert [e["event"] for e in events] == ["registry", "error"]
+    assert events[-1]["msg"].startswith("ValueError: 驗證失敗")
+    assert backfiller.log.file.closed
+    assert not backfiller.new_wb.exists()
+    assert len(registry) == 0
+    # 傳入的 '交貨清單' 不會被修改
+    assert purchasing_df.index.equals(pd.RangeIndex(len(purchasing_df)))
+    # -------------------------------------------------------------------------/
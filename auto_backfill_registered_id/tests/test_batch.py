@@ -0,0 +1,46 @@
+import shutil
+
+from modules.batch import find_catalog_wbs, run_batch
+from modules.pipeline import load_purchasing
+# -----------------------------------------------------------------------------/
+
+
+def test_find_catalog_wbs(tmp_path):
+    """
+    資料夾內的 .xlsx (略過 Excel 暫存檔 '~$' 與輸出的 '(SR)' 檔案), 依檔名排序
+    """
+    for name in ["b.xlsx", "a.xlsx", "~$a.xlsx", "(SR)回填a.xlsx", "note.txt"]:
+        tmp_path.joinpath(name).touch()
+    
+    assert [p.name for p in find_catalog_wbs(str(tmp_path))] == ["a.xlsx", "b.xlsx"]
+    assert [p.name for p in find_catalog_wbs(str(tmp_path.joinpath("b*.xlsx")))] == ["b.xlsx"]
+    # -------------------------------------------------------------------------/
+
+
+def test_run_batch_isolates_failures(workbooks, console, tmp_path):
+    """
+    每個 '編目箱單' 各自輸出, 一個檔案失敗不影響其他檔案, 結果依輸入順序
+    """
+    catalog_dir = tmp_path.joinpath("catalog")
+    new_wb_dir = tmp_path.joinpath("out")
+    catalog_dir.mkdir()
+    new_wb_dir.mkdir()
+    shutil.copy(workbooks[1], catalog_dir.joinpath("a.xlsx"))
+    catalog_dir.joinpath("b.xlsx").write_bytes(b"not a workbook")
+    shutil.copy(workbooks[1], catalog_dir.joinpath("c.xlsx"))
+    purchasing_df = load_purchasing(workbooks[0], console)
+    
+    results = run_batch(find_catalog_wbs(str(catalog_dir)), purchasing_df, new_wb_dir, console,
+                        max_workers=2, suggest=False, use_cache=False)
+    
+    assert [r["catalog"].name for r in results] == ["a.xlsx", "b.xlsx", "c.xlsx"]
+    assert [r["status"] for r in results] == ["OK", "Error", "OK"]
+    assert results[0]["handled_type_cnt"] == results[2]["handled_type_cnt"]
+    assert results[0]["handled_type_cnt"]["Normal Case"] > 0
+    for name in ["a", "b", "c"]:
+        assert new_wb_dir.joinpath(f"(SR)處理紀錄{name}.log").exists()
+    assert new_wb_dir.joinpath("(SR)回填a.xlsx").exists()
+    assert not new_wb_dir.joinpath("(SR)回填b.xlsx").exists()
+    # '交貨清單' 由主程式讀取一次, 不會被 worker 修改
+    assert len(purchasing_df) == 60
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,69 @@
+import io
+import json
+
+from bench.generate import generate_workbooks
+from bench.run import compare_results, run_pipeline
+from modules.pipeline import load_catalog, load_purchasing
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+
+def test_generate_workbooks_is_reproducible(console, tmp_path):
+    """
+    相同 `seed` 產生相同的資料, '編目箱單' 的冊數與 '交貨清單' 的總冊數一致
+    """
+    paths_a = generate_workbooks(40, tmp_path.joinpath("a"), n_boxes=2, nodelivery_ratio=0.0)
+    paths_b = generate_workbooks(40, tmp_path.joinpath("b"), n_boxes=2, nodelivery_ratio=0.0)
+    
+    purchasing_df = load_purchasing(paths_a[0], console)
+    catalog_df = load_catalog(paths_a[1], console)
+    assert purchasing_df.equals(load_purchasing(paths_b[0], console))
+    assert catalog_df.equals(load_catalog(paths_b[1], console))
+    
+    assert len(purchasing_df) == 40
+    assert sorted(catalog_df["箱號"].unique().tolist()) == [1, 2]
+    assert len(catalog_df) == purchasing_df["總冊數"].sum()
+    assert catalog_df["登錄號"].is_unique
+    # -------------------------------------------------------------------------/
+
+
+def test_run_pipeline_records_every_stage(make_workbooks, tmp_path):
+    """
+    """
+    data_dir = make_workbooks(60)[0].parent
+    
+    records = run_pipeline(data_dir, tmp_path, "bulk", "openpyxl", "stream", trace_memory=False)
+    
+    assert [r["stage"] for r in records] == ["load_purchasing", "load_catalog", "validate",
+                                             "reconcile", "backfill", "add_total_sum",
+                                             "export", "suggest"]
+    assert all(r["wall_s"] >= 0 for r in records)
+    assert tmp_path.joinpath("(SR)回填測試.xlsx").exists()
+    # -------------------------------------------------------------------------/
+
+
+def test_compare_results(tmp_path):
+    """
+    時間增加超過 10% 以紅色顯示, 只有一邊有的紀錄不比較
+    """
+    old = {"git_rev": "old", "results": [
+        {"rows": 1000, "engine": "bulk", "stage": "backfill", "wall_s": 1.0},
+        {"rows": 1000, "engine": "bulk", "stage": "export", "wall_s": 1.0},
+    ]}
+    new = {"git_rev": "new", "results": [
+        {"rows": 1000, "engine": "bulk", "stage": "backfill", "wall_s": 2.0, "peak_bytes": 1024**2},
+        {"rows": 1000, "engine": "bulk", "stage": "export", "wall_s": 0.5},
+        {"rows": 1000, "engine": "loop", "stage": "backfill", "wall_s": 9.0},
+    ]}
+    for name, data in [("old", old), ("new", new)]:
+        tmp_path.joinpath(f"{name}.json").write_text(json.dumps(data), encoding="utf-8")
+    console = Console(file=io.StringIO(), width=200, force_terminal=True)
+    
+    compare_results(tmp_path.joinpath("old.json"), tmp_path.joinpath("new.json"), console)
+    
+    output = console.file.getvalue()
+    assert "2.00x" in output
+    assert "0.50x" in output
+    assert "loop" not in output
+    assert "\x1b[31m2.00x" in output
+    # -------------------------------------------------------------------------/
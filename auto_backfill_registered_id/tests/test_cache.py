@@ -0,0 +1,141 @@
+import os
+import zipfile
+import zlib
+
+import openpyxl
+import pandas as pd
+import pytest
+from modules.cache import SheetCache, get_sheet_digests
+from modules.schema import catalog_colnames, catalog_dtype, catalog_st_rowidx
+from modules.utils import read_wb
+# -----------------------------------------------------------------------------/
+
+pytest.importorskip("pyarrow")
+
+workbook_xml: str = (
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+workbook_rels: str = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'
+)
+
+
+def forge_crc32(data: bytes, target: int):
+    """
+    回傳 4 bytes, 加在 `data` 後面時 CRC32 為 `target`
+    """
+    reg = target ^ 0xFFFFFFFF
+    for _ in range(32):
+        if reg & 0x80000000:
+            reg = (((reg ^ 0xEDB88320) << 1) | 1) & 0xFFFFFFFF
+        else:
+            reg = (reg << 1) & 0xFFFFFFFF
+    
+    return (reg ^ zlib.crc32(data) ^ 0xFFFFFFFF).to_bytes(4, "little")
+    # -------------------------------------------------------------------------/
+
+
+def write_xlsx(path, sheet_xml: bytes):
+    """
+    只有一個工作表的最小 xlsx (zip)
+    """
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("xl/workbook.xml", workbook_xml)
+        zf.writestr("xl/_rels/workbook.xml.rels", workbook_rels)
+        zf.writestr("xl/worksheets/sheet1.xml", sheet_xml)
+    # -------------------------------------------------------------------------/
+
+
+def test_digest_uses_content_not_crc(tmp_path):
+    """
+    工作表內容不同但 CRC32 與大小相同 (zip 目錄完全相同) 時, hash 也不同
+    """
+    sheet_a = b"<worksheet>AAAA</worksheet>"
+    sheet_b = b"<worksheet>BBBB</worksheet>"
+    sheet_a += forge_crc32(sheet_a, 0x12345678)
+    sheet_b += forge_crc32(sheet_b, 0x12345678)
+    write_xlsx(tmp_path.joinpath("a.xlsx"), sheet_a)
+    write_xlsx(tmp_path.joinpath("b.xlsx"), sheet_b)
+    
+    infos = []
+    for name in ["a.xlsx", "b.xlsx"]:
+        with zipfile.ZipFile(tmp_path.joinpath(name)) as zf:
+            infos.append(zf.getinfo("xl/worksheets/sheet1.xml"))
+    assert (infos[0].CRC, infos[0].file_size) == (infos[1].CRC, infos[1].file_size)
+    
+    assert get_sheet_digests(tmp_path.joinpath("a.xlsx")) != get_sheet_digests(tmp_path.joinpath("b.xlsx"))
+    # -------------------------------------------------------------------------/
+
+
+def test_digest_changes_only_for_modified_sheet(workbooks, tmp_path):
+    """
+    只修改一個工作表的數值時, 其他工作表的 hash 不變
+    """
+    wb = openpyxl.load_workbook(workbooks[1])
+    before_path = tmp_path.joinpath("before.xlsx")
+    wb.save(before_path)
+    wb["2"].cell(row=catalog_st_rowidx + 2, column=2).value = 999
+    after_path = tmp_path.joinpath("after.xlsx")
+    wb.save(after_path)
+    
+    before, after = get_sheet_digests(before_path), get_sheet_digests(after_path)
+    assert list(before) == ["1", "2", "3"]
+    assert before["1"] == after["1"]
+    assert before["2"] != after["2"]
+    assert before["3"] == after["3"]
+    # -------------------------------------------------------------------------/
+
+
+def test_read_wb_uses_cache(workbooks, console, tmp_path):
+    """
+    第二次讀取時由快取讀取, 結果與解析 xlsx 相同
+    """
+    cache = SheetCache(tmp_path.joinpath(".cache"), console)
+    args = (workbooks[1], catalog_dtype, catalog_st_rowidx, catalog_colnames, console)
+    
+    parsed = read_wb(*args, cache=cache)
+    assert len(list(tmp_path.joinpath(".cache").glob("*.arrow"))) == 3
+    assert "使用快取" not in console.file.getvalue()
+    cached = read_wb(*args, cache=cache)
+    assert console.file.getvalue().count("使用快取") == 3
+    
+    for ws_name, ws_df in parsed.items():
+        pd.testing.assert_frame_equal(cached[ws_name], ws_df)
+    # -------------------------------------------------------------------------/
+
+
+def test_cache_evicts_least_recently_used(console, tmp_path):
+    """
+    超過 `max_bytes` 時刪除最久沒有使用的快取
+    """
+    cache = SheetCache(tmp_path, console)
+    ws_df = pd.DataFrame({"a": [1, 2]})
+    cache.save("old", ws_df, ["a"], {"n_rows": 2})
+    cache.save("new", ws_df, ["a"], {"n_rows": 2})
+    os.utime(cache.get_path("old"), (1, 1))
+    
+    cache.max_bytes = cache.get_path("new").stat().st_size
+    cache.evict()
+    
+    assert cache.load("old") is None
+    loaded_df, all_names, extent = cache.load("new")
+    pd.testing.assert_frame_equal(loaded_df, ws_df)
+    assert (all_names, extent) == (["a"], {"n_rows": 2})
+    # -------------------------------------------------------------------------/
+
+
+def test_cache_evict_skips_missing_files(console, tmp_path):
+    """
+    其他 worker 已經刪除的檔案 (glob 之後 stat 之前) 略過
+    """
+    cache = SheetCache(tmp_path, console, max_bytes=0)
+    cache.save("new", pd.DataFrame({"a": [1, 2]}), ["a"], {"n_rows": 2})
+    cache.get_path("gone").symlink_to(tmp_path.joinpath("missing.arrow"))
+    
+    cache.evict()
+    
+    assert not cache.get_path("new").exists()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,93 @@
+import json
+
+import pandas as pd
+import pytest
+from modules.backfiller import Backfiller
+from modules.columnar import to_columnar_frame, write_columnar
+from modules.schema import keep_number_format
+# -----------------------------------------------------------------------------/
+
+
+def test_to_columnar_frame():
+    """
+    去掉 'index' column 與 index, 數字和文字混在一起的 column 轉成 "string"
+    """
+    df = pd.DataFrame({"index": [0, 1], "登錄號": ["套書", 123], "書名": ["一", None]},
+                      index=pd.Index([5, 5], name="purc_sn"))
+    
+    columnar_df = to_columnar_frame(df)
+    
+    assert list(columnar_df.columns) == ["登錄號", "書名"]
+    assert list(columnar_df.index) == [0, 1]
+    assert columnar_df["登錄號"].dtype == "string"
+    assert columnar_df["登錄號"].tolist() == ["套書", "123"]
+    assert columnar_df["書名"].dtype == object
+    assert "index" in df.columns
+    # -------------------------------------------------------------------------/
+
+
+def test_write_columnar_rejects_unknown_format(tmp_path):
+    """
+    """
+    with pytest.raises(ValueError, match="不支援的輸出格式 : \\['xlsx'\\]"):
+        write_columnar({"new": pd.DataFrame()}, {"new": tmp_path.joinpath("回填")},
+                       tmp_path.joinpath("摘要.json"), ["csv", "xlsx"], {})
+    assert not tmp_path.joinpath("回填.csv").exists()
+    # -------------------------------------------------------------------------/
+
+
+def test_backfiller_columnar_export(workbooks, console, tmp_path):
+    """
+    回填結果與沒有處理到的資料存成每一種格式 (內容相同, 沒有合計列),
+    合計與處理模式存在 '(SR)回填摘要' JSON 與 Parquet 的 schema metadata
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    backfiller = Backfiller(*workbooks, tmp_path, console, columnar=["csv", "parquet", "jsonl"])
+    
+    backfiller.run(suggest=False)
+    
+    summary = json.loads(backfiller.report_path("回填摘要", ".json").read_text(encoding="utf-8"))
+    total_row = backfiller.new_df.iloc[-1]
+    assert summary["總冊數"] == total_row["總冊數"]
+    assert summary["小計"] == int(total_row["小計"])
+    assert summary["處理模式"] == dict(backfiller.handled_type_cnt)
+    assert summary["number_formats"] == keep_number_format
+    assert summary["rows"] == {"new": len(backfiller.backfill_df),
+                               "purchasing_left": len(backfiller.purchasing_left),
+                               "catalog_left": len(backfiller.catalog_left)}
+    
+    for name, kind in [("new", "回填"), ("purchasing_left", "未回填交貨清單")]:
+        paths = {fmt: backfiller.report_path(kind, suffix)
+                 for fmt, suffix in [("csv", ".csv"), ("parquet", ".parquet"), ("jsonl", ".jsonl")]}
+        assert summary["files"][name] == {fmt: path.name for fmt, path in paths.items()}
+        csv_df = pd.read_csv(paths["csv"], encoding="utf-8-sig", dtype=str, keep_default_na=False)
+        parquet_df = pd.read_parquet(paths["parquet"])
+        jsonl_df = pd.read_json(paths["jsonl"], lines=True, dtype=False)
+        assert len(csv_df) == len(parquet_df) == len(jsonl_df) == summary["rows"][name]
+        assert list(csv_df.columns) == list(parquet_df.columns) == list(jsonl_df.columns)
+        assert "index" not in csv_df.columns
+        assert parquet_df["登錄號"].astype("string").fillna("").tolist() == csv_df["登錄號"].tolist()
+    
+    new_csv = pd.read_csv(backfiller.report_path("回填", ".csv"), encoding="utf-8-sig")
+    assert "合計" not in new_csv["書名"].tolist()
+    assert new_csv["總冊數"].sum() == summary["總冊數"]
+    metadata = pq.read_schema(backfiller.report_path("回填", ".parquet")).metadata
+    assert json.loads(metadata[b"backfill"]) == {k: summary[k] for k in
+                                                 ["總冊數", "小計", "處理模式", "number_formats"]}
+    # -------------------------------------------------------------------------/
+
+
+def test_diff_writer_skips_columnar(make_workbooks, console, tmp_path):
+    """
+    writer="diff" 沒有輸出, 不存 columnar 與摘要
+    """
+    purchasing_wb, catalog_wb = make_workbooks(12, bookset_ratio=0.0, bookcopy_ratio=0.0)
+    backfiller = Backfiller(purchasing_wb, catalog_wb, tmp_path, console,
+                            writer="diff", columnar=["csv"])
+    
+    backfiller.run(suggest=False)
+    
+    assert not backfiller.report_path("回填摘要", ".json").exists()
+    assert not backfiller.report_path("回填", ".csv").exists()
+    assert backfiller.report_path("修改清單", ".csv").exists()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,67 @@
+import openpyxl
+import pandas as pd
+import pytest
+from modules.compact import compact_frame, downcast_int
+from modules.pipeline import (backfill_engines, export_backfill, load_catalog,
+                              load_purchasing, report_backfill, run_backfill)
+# -----------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("values, expected", [
+    ([1, 100, None], "Int8"),
+    ([-1, 30_000], "Int16"),
+    ([0, 70_000], "Int32"),
+    ([0, 2**40], "Int64"),
+    ([None, None], "Int8"),
+])
+def test_downcast_int(values, expected):
+    """
+    """
+    series = pd.Series(values, dtype="Int64")
+    
+    result = downcast_int(series)
+    
+    assert result.dtype == expected
+    pd.testing.assert_series_equal(result.astype("Int64"), series)
+    # -------------------------------------------------------------------------/
+
+
+def test_compact_frame_keeps_values():
+    """
+    只改變記憶體的表示方式, 數值不變, 沒有的 column 略過, 原本的 DataFrame 不變
+    """
+    df = pd.DataFrame({"館藏地代碼": ["LIB"] * 100, "箱號": pd.array([1, 2] * 50, dtype="Int64"),
+                       "書名": [f"書{i}" for i in range(100)]})
+    
+    compact_df = compact_frame(df, {"館藏地代碼": "category", "箱號": "int",
+                                    "書名": "string[pyarrow]", "不存在": "category"})
+    
+    assert compact_df["館藏地代碼"].dtype == "category"
+    assert compact_df["箱號"].dtype == "Int8"
+    assert df["箱號"].dtype == "Int64"
+    assert compact_df.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+    for col_name in df.columns:
+        assert compact_df[col_name].astype(object).equals(df[col_name].astype(object))
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("engine", backfill_engines)
+def test_compact_output_unchanged(workbooks, console, tmp_path, engine):
+    """
+    `compact=True` 時輸出的 '(SR)回填' 與一般模式相同
+    """
+    sheets = {}
+    for compact in [False, True]:
+        purchasing_df = load_purchasing(workbooks[0], console, compact=compact)
+        catalog_df = load_catalog(workbooks[1], console, compact=compact)
+        new_df, handled_type_cnt, purchasing_left, _ = \
+            run_backfill(purchasing_df, catalog_df, console, engine=engine)
+        new_df = report_backfill(new_df, handled_type_cnt, console)
+        new_wb = tmp_path.joinpath(f"{compact}.xlsx")
+        export_backfill(new_df, purchasing_left, new_wb)
+        ws = openpyxl.load_workbook(new_wb, read_only=True)["交貨清單"]
+        sheets[compact] = list(ws.iter_rows(values_only=True))
+    
+    assert sheets[True] == sheets[False]
+    assert "記憶體用量" in console.file.getvalue()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from modules.eventlog import EventLog
+from modules.pipeline import (backfill_engines, load_catalog, load_purchasing,
+                              report_backfill, run_backfill)
+# -----------------------------------------------------------------------------/
+
+
+def read_events(path):
+    """
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+    # -------------------------------------------------------------------------/
+
+
+def test_book_events_match_between_engines(workbooks, console, tmp_path):
+    """
+    每本書一個 "book" 事件 (依 '交貨清單' 的順序), 兩種回填引擎的紀錄相同, 最後是 "summary"
+    """
+    events = {}
+    for engine in backfill_engines:
+        log_path = tmp_path.joinpath(f"{engine}.jsonl")
+        with EventLog(log_path, console) as log:
+            new_df, handled_type_cnt, _, _ = run_backfill(load_purchasing(workbooks[0], console),
+                                                          load_catalog(workbooks[1], console),
+                                                          console, engine=engine, log=log)
+            report_backfill(new_df, handled_type_cnt, console, log=log)
+        events[engine] = read_events(log_path)
+    
+    assert events["bulk"] == events["loop"]
+    books = [e for e in events["bulk"] if e["event"] == "book"]
+    assert sum(handled_type_cnt.values()) == len(books)
+    assert [e["採購序號"] for e in books] == sorted(e["採購序號"] for e in books)
+    assert events["bulk"][-1]["event"] == "summary"
+    assert events["bulk"][-1]["處理模式"] == dict(handled_type_cnt)
+    # 套書 / 副本 列出每一冊的 '登錄號'
+    bookset = next(e for e in books if e["處理模式"] == "套書")
+    assert len(bookset["登錄號"]) > 1
+    # terminal 不顯示每本書的處理過程
+    assert "處理模式 :" not in console.file.getvalue()
+    # -------------------------------------------------------------------------/
+
+
+def test_error_event_on_exception(console, tmp_path):
+    """
+    `with EventLog(...)` 中發生錯誤時, 先寫入 "error" 事件再關閉檔案; NA / numpy 的值轉成 JSON
+    """
+    log_path = tmp_path.joinpath("log.jsonl")
+    
+    with pytest.raises(ValueError):
+        with EventLog(log_path, console) as log:
+            log.book(np.int64(7), pd.NA, "書名", "Normal Case", ["C001"])
+            raise ValueError("測試")
+    
+    assert log.file.closed
+    assert read_events(log_path) == [
+        {"event": "book", "採購序號": 7, "ISBN": None, "書名": "書名",
+         "處理模式": "Normal Case", "登錄號": ["C001"]},
+        {"event": "error", "採購序號": None, "msg": "ValueError: 測試"},
+    ]
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from modules.cache import SheetCache
+from modules.ingest import list_sheet_names, split_sheets
+from modules.pipeline import load_catalog, load_inputs, load_purchasing
+# -----------------------------------------------------------------------------/
+
+
+def test_split_sheets():
+    """
+    依順序分成連續的幾段, 工作表比 worker 少時每段一個
+    """
+    assert split_sheets(["1", "2", "3", "4", "5"], 2) == [["1", "2", "3"], ["4", "5"]]
+    assert split_sheets(["1", "2"], 8) == [["1"], ["2"]]
+    assert split_sheets(["1", "2"], 0) == [["1", "2"]]
+    # -------------------------------------------------------------------------/
+
+
+def test_list_sheet_names(workbooks, tmp_path):
+    """
+    """
+    broken_wb = tmp_path.joinpath("broken.xlsx")
+    broken_wb.write_bytes(b"not a workbook")
+    
+    assert list_sheet_names(workbooks[1]) == ["1", "2", "3"]
+    assert list_sheet_names(broken_wb) is None
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("backend", ["openpyxl", "calamine"])
+def test_load_inputs_matches_sequential(workbooks, console, backend):
+    """
+    同時在多個 process 解析的結果與依序讀取相同 (工作表的合併順序固定)
+    """
+    if backend == "calamine":
+        pytest.importorskip("python_calamine")
+    
+    purchasing_df, catalog_df = load_inputs(*workbooks, console, backend=backend, max_workers=2)
+    
+    pd.testing.assert_frame_equal(purchasing_df, load_purchasing(workbooks[0], console, backend=backend))
+    pd.testing.assert_frame_equal(catalog_df, load_catalog(workbooks[1], console, backend=backend))
+    # -------------------------------------------------------------------------/
+
+
+def test_load_inputs_uses_cache(workbooks, console, tmp_path):
+    """
+    worker 解析的結果存進快取, 第二次全部由快取讀取 (不啟動 worker)
+    """
+    pytest.importorskip("pyarrow")
+    cache = SheetCache(tmp_path, console)
+    
+    parsed = load_inputs(*workbooks, console, cache=cache, max_workers=2)
+    assert len(list(tmp_path.glob("*.arrow"))) == 4
+    cached = load_inputs(*workbooks, console, cache=cache, max_workers=2)
+    
+    assert console.file.getvalue().count("使用快取") == 4
+    for parsed_df, cached_df in zip(parsed, cached):
+        pd.testing.assert_frame_equal(cached_df, parsed_df)
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,100 @@
+import openpyxl
+import pytest
+from modules.matching import TitleIndex, canonical_isbn
+from modules.pipeline import (load_catalog, load_purchasing, run_backfill,
+                              suggest_matches)
+from modules.schema import catalog_colalias
+# -----------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("978-957-12-3456-4", "9789571234564"),
+    ("ISBN 957-12-3456-7", "9789571234564"),  # ISBN-10 -> ISBN-13
+    ("９７８９５７１２３４５６４", "9789571234564"),  # 全形
+    (9789571234564.0, "9789571234564"),  # Excel 數字
+    ("9.789571234564E+12", "9789571234564"),
+    (None, None),
+    ("12345", None),
+])
+def test_canonical_isbn(value, expected):
+    """
+    """
+    assert canonical_isbn(value) == expected
+    # -------------------------------------------------------------------------/
+
+
+def test_canonical_isbn_check_digit():
+    """
+    檢查碼錯誤: 預設保留 (可以和相同的錯誤值比對), `strict=True` 回傳 None
+    """
+    assert canonical_isbn("9789571234567") == "9789571234567"
+    assert canonical_isbn("9789571234567", strict=True) is None
+    assert canonical_isbn("9789571234564", strict=True) == "9789571234564"
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("value", [
+    "9.78957E+12",  # Excel 顯示的科學記號, 有效位數不足
+    "9.789570000000E+12",  # 檢查碼錯誤
+    9789571234567.0,
+    "9789571234567.0",
+])
+def test_canonical_isbn_from_number(value):
+    """
+    由數字轉換的值不保留檢查碼錯誤, 科學記號有效位數不足時不補零
+    """
+    assert canonical_isbn(value) is None
+    # -------------------------------------------------------------------------/
+
+
+def test_title_index_query():
+    """
+    書名只比對 "/" 之前, 忽略空白與標點, 依 Dice 係數排序
+    """
+    index = TitleIndex(["資料結構與演算法", "演算法導論", "經濟學原理"], max_df=1.0)
+    
+    result = index.query("資料結構 與 演算法 / 作者")
+    
+    assert [pos for pos, _ in result] == [0, 1]
+    assert result[0][1] == 1.0
+    assert index.query("完全無關") == []
+    # -------------------------------------------------------------------------/
+
+
+def test_suggest_finds_mistyped_purc_sn(make_workbooks, console, tmp_path):
+    """
+    '原序號' 打錯的 '編目箱單', 第 1 候選是原本的 '採購序號' (ISBN 與書名都相同)
+    """
+    paths = make_workbooks(30, bookset_ratio=0.0, bookcopy_ratio=0.0,
+                           nodelivery_ratio=0.0, mismatch_ratio=0.0)
+    purchasing_df = load_purchasing(paths[0], console)
+    catalog_df = load_catalog(paths[1], console)
+    sn_col = catalog_colalias["採購序號"]
+    purc_sn = catalog_df.loc[5, sn_col]
+    catalog_df.loc[5, sn_col] = 9999
+    review_path = tmp_path.joinpath("(SR)比對候選.xlsx")
+    
+    _, _, purchasing_left, catalog_left = run_backfill(purchasing_df, catalog_df, console)
+    candidate_df = suggest_matches(purchasing_left, catalog_left, console, review_path=review_path)
+    
+    assert len(catalog_left) == 1
+    first = candidate_df.iloc[0]
+    assert (first["原序號"], first["候選排名"]) == (9999, 1)
+    assert (first["候選 採購序號"], first["分數"], first["依據"]) == (purc_sn, 1.0, "ISBN+書名")
+    assert "找到候選 : 1 筆" in console.file.getvalue()
+    
+    ws = openpyxl.load_workbook(review_path)["比對候選"]
+    assert ws.cell(row=2, column=candidate_df.columns.get_loc("候選 採購序號") + 1).number_format == "0000"
+    assert ws.max_row == 1 + len(candidate_df)
+    # -------------------------------------------------------------------------/
+
+
+def test_suggest_skips_when_all_matched(workbooks, console):
+    """
+    """
+    _, _, purchasing_left, catalog_left = run_backfill(load_purchasing(workbooks[0], console),
+                                                       load_catalog(workbooks[1], console), console)
+    
+    assert len(catalog_left) == 0
+    assert suggest_matches(purchasing_left, catalog_left, console) is None
+    # -------------------------------------------------------------------------/
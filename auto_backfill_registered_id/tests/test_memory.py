@@ -0,0 +1,135 @@
+import io
+import tracemalloc
+
+import pandas as pd
+import pytest
+from modules.backfiller import Backfiller
+from modules.pipeline import (backfill_engines, export_backfill, load_catalog,
+                              load_purchasing, report_backfill, run_backfill)
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+# tracemalloc peak 的上限 (輸入 DataFrame 大小的倍數, 300 筆時約為 load 4x, bulk 2.2x, export 1.2x)
+load_ratio, backfill_ratio, export_ratio = 8, 4, 3
+
+
+def traced_peak(func, *args, **kwargs):
+    """
+    執行 `func`, 回傳 (結果, tracemalloc peak)
+    
+    先執行一次不記錄, 避免把 import 與第一次呼叫的快取算進去
+    """
+    func(*args, **kwargs)
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return result, peak
+    # -------------------------------------------------------------------------/
+
+
+def frame_size(df: pd.DataFrame):
+    """
+    """
+    return int(df.memory_usage(deep=True).sum())
+    # -------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="module")
+def inputs(make_workbooks, console):
+    """
+    300 筆的 ('交貨清單' path, '編目箱單' path, purchasing_df, catalog_df)
+    """
+    purchasing_wb, catalog_wb = make_workbooks(300)
+    
+    return (purchasing_wb, catalog_wb,
+            load_purchasing(purchasing_wb, console), load_catalog(catalog_wb, console))
+    # -------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="module")
+def console():
+    """
+    (module scope 的 `inputs` 需要相同 scope 的 console)
+    """
+    return Console(file=io.StringIO(), width=200)
+    # -------------------------------------------------------------------------/
+
+
+def test_load_peak(inputs, console):
+    """
+    """
+    purchasing_wb, catalog_wb, purchasing_df, catalog_df = inputs
+    
+    _, purchasing_peak = traced_peak(load_purchasing, purchasing_wb, console)
+    _, catalog_peak = traced_peak(load_catalog, catalog_wb, console)
+    
+    assert purchasing_peak <= load_ratio * frame_size(purchasing_df)
+    assert catalog_peak <= load_ratio * frame_size(catalog_df)
+    # -------------------------------------------------------------------------/
+
+
+def run_shallow(purchasing_df: pd.DataFrame, catalog_df: pd.DataFrame,
+                console: Console, engine: str = "bulk"):
+    """
+    以 shallow copy 執行 `run_backfill` (與 `Backfiller.load` 相同, `run_backfill` 會改變 index 與移除列)
+    """
+    return run_backfill(purchasing_df.copy(deep=False), catalog_df.copy(deep=False),
+                        console, engine=engine)
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("engine", backfill_engines)
+def test_backfill_peak(inputs, console, engine):
+    """
+    回填不複製整個 DataFrame, shallow copy 的原本 DataFrame 不變, 結果與另一種引擎相同
+    """
+    _, _, purchasing_df, catalog_df = inputs
+    purchasing_copy, catalog_copy = purchasing_df.copy(), catalog_df.copy()
+    
+    result, peak = traced_peak(run_shallow, purchasing_df, catalog_df, console, engine=engine)
+    
+    assert peak <= backfill_ratio * (frame_size(purchasing_df) + frame_size(catalog_df))
+    pd.testing.assert_frame_equal(purchasing_df, purchasing_copy)
+    pd.testing.assert_frame_equal(catalog_df, catalog_copy)
+    other = [e for e in backfill_engines if e != engine][0]
+    expected = run_shallow(purchasing_df, catalog_df, console, engine=other)
+    pd.testing.assert_frame_equal(result[0], expected[0])
+    # -------------------------------------------------------------------------/
+
+
+def test_export_peak(inputs, console, tmp_path):
+    """
+    輸出不修改 `new_df`
+    """
+    _, _, purchasing_df, catalog_df = inputs
+    new_df, handled_type_cnt, purchasing_left, _ = run_shallow(purchasing_df, catalog_df, console)
+    new_df = report_backfill(new_df, handled_type_cnt, console)
+    new_copy = new_df.copy()
+    
+    _, peak = traced_peak(export_backfill, new_df, purchasing_left, tmp_path.joinpath("回填.xlsx"))
+    
+    assert peak <= export_ratio * (frame_size(purchasing_df) + frame_size(catalog_df))
+    pd.testing.assert_frame_equal(new_df, new_copy)
+    # -------------------------------------------------------------------------/
+
+
+def test_shared_purchasing_unchanged(inputs, console, tmp_path):
+    """
+    批次處理時同一個 `purchasing_df` 傳給多個 `Backfiller`, 執行兩次後不變, 結果也相同
+    """
+    _, catalog_wb, purchasing_df, _ = inputs
+    purchasing_copy = purchasing_df.copy()
+    
+    new_dfs = []
+    for i in range(2):
+        backfiller = Backfiller(None, catalog_wb, tmp_path, console, tag=str(i))
+        backfiller.run(purchasing_df, suggest=False)
+        new_dfs.append(backfiller.new_df)
+    
+    pd.testing.assert_frame_equal(purchasing_df, purchasing_copy)
+    pd.testing.assert_frame_equal(new_dfs[0], new_dfs[1])
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,192 @@
+import openpyxl
+import pandas as pd
+import pytest
+from bench.generate import purchasing_columns
+from modules.patch import get_target_colnames
+from modules.pipeline import (load_catalog, load_purchasing, patch_backfill,
+                              report_backfill, run_backfill)
+from modules.schema import purchasing_wsname
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+# -----------------------------------------------------------------------------/
+
+# '交貨清單' 的欄 (依 `bench.generate.purchasing_columns` 的順序)
+sn_col, regid_col, title_col, book_col, ntd_col = [
+    get_column_letter(purchasing_columns.index(col_name) + 1)
+    for col_name in ["採購序號", "登錄號", "書名", "總冊數", "小計"]
+]
+
+
+def build_purchasing_wb(make_workbooks, tmp_path, total: str, **ratios):
+    """
+    在產生的 '交貨清單' 加上 (資料之後空一列) 合計列, 合併儲存格, 名稱與參照 '交貨清單' 的工作表
+    
+    - total="formula" : 合計為 =SUM(O{first}:O{last + 1}) (範圍包含資料之後的空白列)
+    - total="value" : 合計為過時的數字
+    - total="none" : 沒有合計列
+    
+    回傳 ('交貨清單' path, '編目箱單' path, {"header", "first", "last", "total"})
+    """
+    purc_path, cata_path = make_workbooks(12, nodelivery_ratio=0.0, mismatch_ratio=0.0, **ratios)
+    wb = openpyxl.load_workbook(purc_path)
+    ws = wb[purchasing_wsname]
+    header = next(row for row in range(1, ws.max_row + 1) if ws[f"{sn_col}{row}"].value == "採購序號")
+    rows = {"header": header, "first": header + 1, "last": ws.max_row, "total": ws.max_row + 2}
+    
+    if total != "none":
+        ws[f"{title_col}{rows['total']}"] = "合計"
+        if total == "formula":
+            ws[f"{book_col}{rows['total']}"] = f"=SUM({book_col}{rows['first']}:{book_col}{rows['last'] + 1})"
+            ws[f"{ntd_col}{rows['total']}"] = f"=SUM({ntd_col}{rows['first']}:{ntd_col}{rows['last'] + 1})"
+        else:
+            ws[f"{book_col}{rows['total']}"] = 0
+            ws[f"{ntd_col}{rows['total']}"] = 0
+    ws.merge_cells(f"G{rows['total']}:H{rows['total']}")
+    wb.defined_names["資料"] = DefinedName(
+        "資料", attr_text=f"'{purchasing_wsname}'!$A${rows['header']}:$Y${rows['last'] + 1}")
+    stats_ws = wb.create_sheet("統計")
+    stats_ws["A1"] = f"='{purchasing_wsname}'!{ntd_col}{rows['total']}"
+    stats_ws["A2"] = f"=COUNTA('{purchasing_wsname}'!{sn_col}{rows['first']}:{sn_col}{rows['last']})"
+    
+    new_path = tmp_path.joinpath(f"交貨清單_{total}.xlsx")
+    wb.save(new_path)
+    
+    return new_path, cata_path, rows
+    # -------------------------------------------------------------------------/
+
+
+def run_patch(purchasing_wb, catalog_wb, new_wb, console, dry_run: bool = False):
+    """
+    回傳 (new_df, 修改清單)
+    """
+    new_df, handled_type_cnt, _, _ = run_backfill(load_purchasing(purchasing_wb, console),
+                                                  load_catalog(catalog_wb, console), console)
+    new_df = report_backfill(new_df, handled_type_cnt, console)
+    diff_path = new_wb.with_suffix(".csv")
+    diff_df = patch_backfill(new_df, purchasing_wb, new_wb, console,
+                             diff_path=diff_path, dry_run=dry_run)
+    
+    return new_df, diff_df
+    # -------------------------------------------------------------------------/
+
+
+def test_edit_only(make_workbooks, console, tmp_path):
+    """
+    只有 Normal Case 時只修改儲存格 (不插入列), 公式, 名稱, 合併儲存格, 其他工作表都不變
+    """
+    purchasing_wb, catalog_wb, rows = build_purchasing_wb(
+        make_workbooks, tmp_path, "formula", bookset_ratio=0.0, bookcopy_ratio=0.0)
+    new_wb = tmp_path.joinpath("(SR)回填.xlsx")
+    
+    new_df, diff_df = run_patch(purchasing_wb, catalog_wb, new_wb, console)
+    
+    assert set(diff_df["動作"]) == {"修改"}
+    assert (diff_df["列"] == diff_df["原始列"]).all()
+    # 只修改回填會改變的欄位
+    assert {"箱號", "登錄號"} <= set(diff_df["欄位"]) <= set(get_target_colnames(new_df.columns))
+    
+    before = openpyxl.load_workbook(purchasing_wb)
+    after = openpyxl.load_workbook(new_wb)
+    ws = after[purchasing_wsname]
+    assert ws.max_row == before[purchasing_wsname].max_row
+    assert [ws[f"{regid_col}{row}"].value for row in range(rows["first"], rows["last"] + 1)] \
+        == new_df["登錄號"].iloc[:-1].tolist()
+    assert ws[f"{book_col}{rows['total']}"].value == before[purchasing_wsname][f"{book_col}{rows['total']}"].value
+    assert after["統計"]["A1"].value == before["統計"]["A1"].value
+    assert after.defined_names["資料"].attr_text == before.defined_names["資料"].attr_text
+    # -------------------------------------------------------------------------/
+
+
+def test_insert_shifts_references(make_workbooks, console, tmp_path):
+    """
+    套書 / 副本插入在 anchor 之後; 之後的列, 公式範圍, 名稱, 合併儲存格, 其他工作表的參照跟著移動
+    """
+    purchasing_wb, catalog_wb, rows = build_purchasing_wb(
+        make_workbooks, tmp_path, "formula", bookset_ratio=0.3, bookcopy_ratio=0.3)
+    new_wb = tmp_path.joinpath("(SR)回填.xlsx")
+    
+    new_df, diff_df = run_patch(purchasing_wb, catalog_wb, new_wb, console)
+    
+    n_insert = len(new_df) - 1 - (rows["last"] - rows["first"] + 1)
+    assert n_insert > 0
+    assert diff_df.loc[diff_df["動作"] == "插入", "列"].nunique() == n_insert
+    last, total = rows["last"] + n_insert, rows["total"] + n_insert
+    
+    wb = openpyxl.load_workbook(new_wb)
+    ws = wb[purchasing_wsname]
+    # 每一列依 `new_df` 的順序 (插入的列接在同一個 '採購序號' 之後)
+    assert [ws[f"{sn_col}{row}"].value for row in range(rows["first"], last + 1)] \
+        == new_df["採購序號"].iloc[:-1].tolist()
+    assert [ws[f"{regid_col}{row}"].value for row in range(rows["first"], last + 1)] \
+        == new_df["登錄號"].iloc[:-1].tolist()
+    # =SUM(O4:O1003) 的範圍包含插入的列
+    assert ws[f"{title_col}{total}"].value == "合計"
+    assert ws[f"{book_col}{total}"].value == f"=SUM({book_col}{rows['first']}:{book_col}{last + 1})"
+    assert wb.defined_names["資料"].attr_text == f"'{purchasing_wsname}'!$A${rows['header']}:$Y${last + 1}"
+    assert [str(r) for r in ws.merged_cells.ranges] == [f"G{total}:H{total}"]
+    assert wb["統計"]["A1"].value == f"='{purchasing_wsname}'!{ntd_col}{total}"
+    assert wb["統計"]["A2"].value == f"=COUNTA('{purchasing_wsname}'!{sn_col}{rows['first']}:{sn_col}{last})"
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("total", ["formula", "value", "none"])
+def test_total_row(make_workbooks, console, tmp_path, total):
+    """
+    已經有合計列時: 公式保留, 數字修改; 沒有合計列時插入在最後一筆資料之後
+    """
+    purchasing_wb, catalog_wb, rows = build_purchasing_wb(
+        make_workbooks, tmp_path, total, bookset_ratio=0.0, bookcopy_ratio=0.0)
+    new_wb = tmp_path.joinpath("(SR)回填.xlsx")
+    
+    new_df, diff_df = run_patch(purchasing_wb, catalog_wb, new_wb, console)
+    
+    total_df = diff_df[diff_df["動作"] == "合計"]
+    ws = openpyxl.load_workbook(new_wb)[purchasing_wsname]
+    expected = {"總冊數": new_df["總冊數"].iloc[-1], "小計": int(new_df["小計"].iloc[-1])}
+    if total == "formula":
+        assert len(total_df) == 0
+        assert ws[f"{book_col}{rows['total']}"].value.startswith("=SUM(")
+    elif total == "value":
+        assert total_df["原始列"].tolist() == [rows["total"]] * 2
+        assert dict(zip(total_df["欄位"], total_df["修改後"])) == expected
+        assert ws[f"{book_col}{rows['total']}"].value == expected["總冊數"]
+    else:
+        appended = rows["last"] + 1
+        assert total_df["列"].unique().tolist() == [appended]
+        assert total_df["原始列"].isna().all()
+        assert ws[f"{title_col}{appended}"].value == "合計"
+        assert (ws[f"{book_col}{appended}"].value, ws[f"{ntd_col}{appended}"].value) \
+            == (expected["總冊數"], expected["小計"])
+        # 原本在最後一筆資料之後的列往下移
+        assert [str(r) for r in ws.merged_cells.ranges] == [f"G{rows['total'] + 1}:H{rows['total'] + 1}"]
+    # -------------------------------------------------------------------------/
+
+
+def test_dry_run_writes_no_workbook(make_workbooks, console, tmp_path):
+    """
+    writer="diff" : 只輸出修改清單 CSV
+    """
+    purchasing_wb, catalog_wb, _ = build_purchasing_wb(make_workbooks, tmp_path, "formula")
+    new_wb = tmp_path.joinpath("(SR)回填.xlsx")
+    
+    _, diff_df = run_patch(purchasing_wb, catalog_wb, new_wb, console, dry_run=True)
+    
+    assert not new_wb.exists()
+    csv_df = pd.read_csv(new_wb.with_suffix(".csv"), encoding="utf-8-sig")
+    assert csv_df["動作"].tolist() == diff_df["動作"].tolist()
+    assert csv_df["列"].tolist() == diff_df["列"].tolist()
+    # -------------------------------------------------------------------------/
+
+
+def test_output_is_reproducible(make_workbooks, console, tmp_path):
+    """
+    同樣的輸入得到完全相同的 xlsx (zip 的順序與時間沿用原本的檔案)
+    """
+    purchasing_wb, catalog_wb, _ = build_purchasing_wb(make_workbooks, tmp_path, "formula")
+    outputs = [tmp_path.joinpath("a.xlsx"), tmp_path.joinpath("b.xlsx")]
+    
+    for new_wb in outputs:
+        run_patch(purchasing_wb, catalog_wb, new_wb, console)
+    
+    assert outputs[0].read_bytes() == outputs[1].read_bytes()
+    # -------------------------------------------------------------------------/
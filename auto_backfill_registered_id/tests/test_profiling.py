@@ -0,0 +1,96 @@
+import json
+import pstats
+
+import pandas as pd
+from modules.pipeline import load_catalog
+from modules.profiling import StageProfiler, count_rows, profiler
+# -----------------------------------------------------------------------------/
+
+
+def test_count_rows():
+    """
+    """
+    df = pd.DataFrame({"a": range(3)})
+    
+    assert count_rows(df) == 3
+    assert count_rows({"1": df, "2": df.iloc[:1]}) == 4
+    assert count_rows((df, None)) == 3
+    assert count_rows(None) is None
+    # -------------------------------------------------------------------------/
+
+
+def test_nested_stages(tmp_path):
+    """
+    巢狀的步驟以 "/" 連接, 外層的 peak 包含內層的 peak
+    """
+    stage_profiler = StageProfiler()
+    stage_profiler.enable(trace_memory=True, cprofile_path=tmp_path.joinpath("run.prof"))
+    
+    @stage_profiler.profile(cprofile=True)
+    def build(n):
+        return pd.DataFrame({"a": range(n)})
+    
+    try:
+        with stage_profiler.stage("outer"):
+            with stage_profiler.stage("inner") as record:
+                blob = bytearray(4 * 1024**2)
+                record["rows"] = len(blob)
+                del blob
+            build(10)
+    finally:
+        stage_profiler.disable()
+    
+    records = {r["stage"]: r for r in stage_profiler.records}
+    assert list(records) == ["outer", "outer/inner", "outer/build"]
+    assert [r["depth"] for r in records.values()] == [0, 1, 1]
+    assert records["outer/build"]["rows"] == 10
+    assert records["outer/inner"]["peak_bytes"] >= 4 * 1024**2
+    assert records["outer"]["peak_bytes"] >= records["outer/inner"]["peak_bytes"]
+    assert records["outer"]["wall_s"] >= records["outer/inner"]["wall_s"]
+    stats = pstats.Stats(str(tmp_path.joinpath("run.prof"))).stats
+    assert any(fn_name == "build" for _, _, fn_name in stats)
+    # -------------------------------------------------------------------------/
+
+
+def test_disabled_profiler_records_nothing():
+    """
+    """
+    stage_profiler = StageProfiler()
+    
+    @stage_profiler.profile()
+    def build():
+        return pd.DataFrame({"a": [1]})
+    
+    with stage_profiler.stage("outer") as record:
+        build()
+    
+    assert record == {}
+    assert stage_profiler.records == []
+    # -------------------------------------------------------------------------/
+
+
+def test_append_to_log(workbooks, console, tmp_path):
+    """
+    `profiler` 記錄各模組的步驟, 加到 '(SR)處理紀錄' 的最後 (.jsonl 為 "profile" 事件)
+    """
+    profiler.enable(trace_memory=False)
+    try:
+        catalog_df = load_catalog(workbooks[1], console)
+        text_log = tmp_path.joinpath("log.log")
+        text_log.write_text("處理紀錄\n", encoding="utf-8")
+        profiler.append_to_log(text_log)
+        jsonl_log = tmp_path.joinpath("log.jsonl")
+        profiler.append_to_log(jsonl_log)
+    finally:
+        profiler.disable()
+    
+    text = text_log.read_text(encoding="utf-8")
+    assert text.startswith("處理紀錄\n")
+    assert "效能分析" in text
+    with open(jsonl_log, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    assert {e["event"] for e in events} == {"profile"}
+    load_event = next(e for e in events if e["stage"] == "load_catalog")
+    assert load_event["rows"] == len(catalog_df)
+    assert "peak_bytes" not in load_event
+    # -------------------------------------------------------------------------/
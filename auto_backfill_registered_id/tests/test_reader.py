@@ -0,0 +1,180 @@
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+from modules.cache import read_shared_strings
+from modules.reader import (ExtentTracker, read_sheets, reader_backends,
+                            resolve_backend)
+from modules.schema import (catalog_colnames, catalog_dtype, catalog_st_rowidx,
+                            catalog_usecols, purchasing_dtype,
+                            purchasing_st_rowidx)
+from modules.utils import read_wb
+# -----------------------------------------------------------------------------/
+
+
+def test_read_wb_all_sheets_in_order(workbooks, console):
+    """
+    一次讀取 '編目箱單' 所有的工作表 (依工作表順序), 與逐一 `pd.read_excel` 的結果相同
+    """
+    cata_wb = workbooks[1]
+    wb_dfs = read_wb(cata_wb, catalog_dtype, catalog_st_rowidx, catalog_colnames, console,
+                     backend="openpyxl")
+    
+    assert list(wb_dfs) == ["1", "2", "3"]
+    for ws_name, ws_df in wb_dfs.items():
+        expected = pd.read_excel(cata_wb, engine="openpyxl", sheet_name=ws_name,
+                                 header=catalog_st_rowidx, dtype=catalog_dtype)
+        pd.testing.assert_frame_equal(ws_df, expected)
+    # -------------------------------------------------------------------------/
+
+
+def test_read_wb_selected_sheets(workbooks, console):
+    """
+    只讀取 `ws_names` 指定的工作表, 不存在的工作表不會出現在結果中
+    """
+    wb_dfs = read_wb(workbooks[1], catalog_dtype, catalog_st_rowidx, catalog_colnames, console,
+                     ws_names=["2", "不存在"], usecols=catalog_usecols)
+    
+    assert list(wb_dfs) == ["2"]
+    assert set(wb_dfs["2"].columns) == catalog_usecols
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("backend", ["openpyxl-stream", "calamine"])
+@pytest.mark.parametrize("usecols", [None, catalog_usecols], ids=["all", "usecols"])
+def test_backends_match_openpyxl(workbooks, backend, usecols):
+    """
+    每個 backend 的結果 (DataFrame 與完整的 column names) 都和 `pd.read_excel(engine="openpyxl")` 相同
+    """
+    if backend == "calamine":
+        pytest.importorskip("python_calamine")
+    with open(workbooks[1], "rb") as f:
+        expected = read_sheets(f, "openpyxl", catalog_st_rowidx, catalog_dtype, usecols=usecols)
+    with open(workbooks[1], "rb") as f:
+        result = read_sheets(f, backend, catalog_st_rowidx, catalog_dtype, usecols=usecols)
+    
+    assert list(result) == list(expected)
+    for ws_name, (ws_df, all_names, _) in result.items():
+        pd.testing.assert_frame_equal(ws_df, expected[ws_name][0])
+        assert all_names == expected[ws_name][1]
+    # -------------------------------------------------------------------------/
+
+
+def test_backends_read_purchasing(workbooks):
+    """
+    '交貨清單' (header 之前有其他列) 每個 backend 的結果相同
+    """
+    pytest.importorskip("python_calamine")
+    results = {}
+    for backend in ["openpyxl", "openpyxl-stream", "calamine"]:
+        with open(workbooks[0], "rb") as f:
+            results[backend] = read_sheets(f, backend, purchasing_st_rowidx, purchasing_dtype)
+    
+    for backend, result in results.items():
+        pd.testing.assert_frame_equal(result["交貨清單"][0], results["openpyxl"]["交貨清單"][0])
+    # -------------------------------------------------------------------------/
+
+
+def test_resolve_backend():
+    """
+    """
+    assert resolve_backend("openpyxl") == "openpyxl"
+    assert resolve_backend("auto") in reader_backends
+    with pytest.raises(ValueError, match="不支援的 reader backend"):
+        resolve_backend("xlrd")
+    # -------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="module")
+def extent_wb(tmp_path_factory):
+    """
+    資料在第 2~9 列 (第 8 列只有 '備註', 之後又有 key 列), 第 11 列為合計,
+    第 200 列有一個遠離資料的儲存格
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "1"
+    ws.append(["原序號", "書目", "備註"])
+    for i in range(1, 7):
+        ws.append([i, f"書{i}", None])
+    ws.append([None, None, "待確認"])
+    ws.append([7, "書7", None])
+    ws["B11"] = "合計"
+    ws["C200"] = "遠方"
+    wb_path = tmp_path_factory.mktemp("extent").joinpath("extent.xlsx")
+    wb.save(wb_path)
+    
+    return wb_path
+    # -------------------------------------------------------------------------/
+
+
+def test_extent_tracker():
+    """
+    key 列之前有值的儲存格, 之後又出現 key 列時不算略過; header 沒有 key 時不限制範圍
+    """
+    tracker = ExtentTracker(["原序號", "書目"], {"原序號"}, max_blank_rows=2, first_row=1)
+    
+    assert tracker.feed((1, "一"))
+    assert tracker.feed((None, "註"))
+    assert tracker.feed((2, "二"))
+    assert tracker.feed((None, "合計"))
+    assert not tracker.feed(())
+    
+    assert tracker.to_dict() == {
+        "key_cols": ["原序號"], "n_rows": 3, "last_row": 4, "n_skipped": 1,
+        "skipped": [["B5", "合計"]], "max_blank_rows": 2, "stop_row": 6, "max_row": None,
+    }
+    inactive = ExtentTracker(["書目"], {"原序號"})
+    assert inactive.feed((None,)) and (inactive.n_rows == 1)
+    assert inactive.to_dict() is None
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("backend", ["openpyxl", "openpyxl-stream", "calamine"])
+@pytest.mark.parametrize("max_blank_rows", [None, 50])
+def test_backends_track_extent(extent_wb, backend, max_blank_rows):
+    """
+    每個 backend 只讀到最後一個 key 列, 略過的儲存格與停止的位置都相同
+    (openpyxl : `scan_xml_extent`, openpyxl-stream : `stream_ws`, calamine : `scan_extent`)
+    """
+    if backend == "calamine":
+        pytest.importorskip("python_calamine")
+    with open(extent_wb, "rb") as f:
+        ws_df, all_names, extent = read_sheets(f, backend, 0, {"書目": "str"},
+                                               key_cols={"原序號"},
+                                               max_blank_rows=max_blank_rows)["1"]
+    
+    assert all_names == ["原序號", "書目", "備註"]
+    assert ws_df["書目"].dropna().tolist() == ["書1", "書2", "書3", "書4", "書5", "書6", "書7"]
+    assert ws_df["備註"].dropna().tolist() == ["待確認"]
+    expected_skipped = [["B11", "合計"]] if max_blank_rows else [["B11", "合計"], ["C200", "遠方"]]
+    assert extent == {
+        "key_cols": ["原序號"], "n_rows": 8, "last_row": 9,
+        "n_skipped": len(expected_skipped), "skipped": expected_skipped,
+        "max_blank_rows": max_blank_rows, "stop_row": 59 if max_blank_rows else None,
+        "max_row": 200,
+    }
+    # -------------------------------------------------------------------------/
+
+
+def test_read_shared_strings(extent_wb, tmp_path):
+    """
+    rich text 合併成一般文字, 不包含注音 (`rPh`); 沒有 xl/sharedStrings.xml 時為空
+    """
+    sst_xml = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<si><t>書目</t></si>'
+        '<si><r><t>上</t></r><r><rPr><b/></rPr><t>冊</t></r><rPh><t>じょう</t></rPh></si>'
+        '<si><t/></si>'
+        '</sst>'
+    )
+    sst_wb = tmp_path.joinpath("sst.xlsx")
+    with zipfile.ZipFile(sst_wb, "w") as zf:
+        zf.writestr("xl/sharedStrings.xml", sst_xml)
+    
+    with zipfile.ZipFile(sst_wb) as zf:
+        assert read_shared_strings(zf) == ["書目", "上冊", ""]
+    with zipfile.ZipFile(extent_wb) as zf:
+        assert read_shared_strings(zf) == []
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,56 @@
+import json
+
+import pandas as pd
+from modules.eventlog import EventLog
+from modules.pipeline import load_catalog, load_purchasing, reconcile_backfill
+from modules.schema import catalog_colalias
+# -----------------------------------------------------------------------------/
+
+
+def test_reconcile_reports_every_mismatch(make_workbooks, console, tmp_path):
+    """
+    一次列出所有不相等的 '書名' / 'ISBN' ('書名' 只比對 "/" 之前), 依 '採購序號' 排序並存成 CSV
+    """
+    paths = make_workbooks(30, mismatch_ratio=0.0)
+    purchasing_df = load_purchasing(paths[0], console)
+    catalog_df = load_catalog(paths[1], console)
+    title_col, isbn_col = catalog_colalias["書名"], catalog_colalias["ISBN"]
+    # 第 1 列: '書名' 不相等, 第 2 列: 只有 "/" 之後不同 (相等), 第 3 列: 'ISBN' 不相等
+    catalog_df.loc[0, title_col] = "另一本書"
+    catalog_df.loc[1, title_col] = f"{catalog_df.loc[1, title_col]} / 作者"
+    catalog_df.loc[2, isbn_col] = "0000000000"
+    expected = catalog_df.loc[[0, 2], ["原序號", "箱號", "登錄號"]].to_numpy().tolist()
+    report_path = tmp_path.joinpath("(SR)書名ISBN不相等.csv")
+    
+    mismatch_df = reconcile_backfill(purchasing_df, catalog_df, console, report_path=report_path)
+    
+    assert mismatch_df[["採購序號", "箱號", "登錄號"]].to_numpy().tolist() == expected
+    assert mismatch_df["欄位"].tolist() == ["書名", "ISBN"]
+    assert mismatch_df.loc[0, "編目箱單"] == "另一本書"
+    assert mismatch_df["採購序號"].is_monotonic_increasing
+    assert "書名 / ISBN 不相等 : 2 筆" in console.file.getvalue()
+    # Excel 可以直接開啟 (BOM)
+    assert report_path.read_bytes().startswith(b"\xef\xbb\xbf")
+    csv_df = pd.read_csv(report_path, encoding="utf-8-sig", dtype=str)
+    assert csv_df["編目箱單"].tolist() == mismatch_df["編目箱單"].tolist()
+    # -------------------------------------------------------------------------/
+
+
+def test_reconcile_writes_warnings_to_log(make_workbooks, console, tmp_path):
+    """
+    JSON Lines 模式每個不相等寫成一個 "warning" 事件
+    """
+    paths = make_workbooks(30, mismatch_ratio=0.2)
+    log_path = tmp_path.joinpath("log.jsonl")
+    
+    with EventLog(log_path, console) as log:
+        mismatch_df = reconcile_backfill(load_purchasing(paths[0], console),
+                                         load_catalog(paths[1], console), console, log=log)
+    
+    with open(log_path, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    assert len(mismatch_df) > 0
+    assert [e["event"] for e in events] == ["warning"] * len(mismatch_df)
+    assert [e["採購序號"] for e in events] == mismatch_df["採購序號"].tolist()
+    assert [e["msg"] for e in events] == [f"{k}不相等" for k in mismatch_df["欄位"]]
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,149 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+from modules.pipeline import (check_registry, load_catalog, load_purchasing,
+                              register_backfill, report_backfill, run_backfill)
+from modules.registry import (RegistrationRegistry, find_duplicates, find_gaps,
+                              to_registry_frame)
+# -----------------------------------------------------------------------------/
+
+
+def make_reg_df(reg_nos: list, boxes: list):
+    """
+    """
+    df = pd.DataFrame({"登錄號": reg_nos, "箱號": boxes, "原序號": range(1, len(reg_nos) + 1)})
+    
+    return to_registry_frame(df, "原序號")
+    # -------------------------------------------------------------------------/
+
+
+def test_to_registry_frame():
+    """
+    去掉空白, 合計列與套書的 annotation row, '登錄號' 拆成 prefix 與最後的數字
+    """
+    df = pd.DataFrame({"登錄號": [" C0101 ", None, "", "套書", "ABC"],
+                       "箱號": ["1", 1, 1, 1, None], "採購序號": [5, 6, 7, 8, 9]})
+    
+    reg_df = to_registry_frame(df, "採購序號")
+    
+    assert reg_df["登錄號"].tolist() == ["C0101", "ABC"]
+    assert reg_df["箱號"].tolist() == [1, pd.NA]
+    assert reg_df["採購序號"].tolist() == [5, 9]
+    assert reg_df["prefix"].tolist() == ["C", "ABC"]
+    assert reg_df["num"].tolist() == [101, pd.NA]
+    assert reg_df["digits"].tolist() == [4, pd.NA]
+    # -------------------------------------------------------------------------/
+
+
+def test_find_duplicates():
+    """
+    重複的 '登錄號' 每一列都列出
+    """
+    reg_df = make_reg_df(["C0101", "C0102", "C0101", "C0103"], [1, 1, 2, 1])
+    
+    dup_df = find_duplicates(reg_df)
+    
+    assert dup_df["登錄號"].tolist() == ["C0101", "C0101"]
+    assert dup_df["箱號"].tolist() == [1, 2]
+    assert dup_df["採購序號"].tolist() == [1, 3]
+    assert find_duplicates(make_reg_df(["C0101", "C0102"], [1, 1])).empty
+    # -------------------------------------------------------------------------/
+
+
+def test_find_gaps():
+    """
+    每一箱 (箱號 + prefix) 分開排序, 連續的缺號合併成一段, 補零的位數不變
+    """
+    reg_df = make_reg_df(["C0105", "C0101", "C0102", "C0107", "C0105", "D01", "D03", "C0110"],
+                         [1, 1, 1, 1, 1, 1, 1, 2])
+    
+    gap_df = find_gaps(reg_df)
+    
+    assert gap_df["登錄號"].tolist() == ["C0103 ~ C0104", "C0106", "D02"]
+    assert gap_df["箱號"].tolist() == [1, 1, 1]
+    assert gap_df["缺號數"].tolist() == [2, 1, 1]
+    assert gap_df["採購序號"].isna().all()
+    # -------------------------------------------------------------------------/
+
+
+def test_registered_in_other_source(console, tmp_path):
+    """
+    其他來源 ('編目箱單' 或 `tag` 不同) 登錄過的 '登錄號' 為 '已登錄', 同一個來源不算
+    """
+    registry = RegistrationRegistry(tmp_path.joinpath("registry.db"), console)
+    registry.register(make_reg_df(["C0101", "C0102"], [1, 1]), "甲.xlsx", purchasing="交貨清單.xlsx")
+    reg_df = make_reg_df(["C0102", "C0103"], [3, 3])
+    
+    issue_df = registry.check(reg_df, "乙.xlsx")
+    
+    assert issue_df["類型"].tolist() == ["已登錄"]
+    row = issue_df.iloc[0]
+    assert (row["登錄號"], row["箱號"], row["已登錄 箱號"]) == ("C0102", 3, 1)
+    assert (row["已登錄 編目箱單"], row["已登錄 交貨清單"]) == ("甲.xlsx", "交貨清單.xlsx")
+    assert registry.check(reg_df, "甲.xlsx").empty
+    assert registry.check(reg_df, "甲.xlsx", tag="乙")["類型"].tolist() == ["已登錄"]
+    # -------------------------------------------------------------------------/
+
+
+def test_register_replaces_same_source(console, tmp_path):
+    """
+    同一個來源重新回填時取代之前的記錄, 不同的 `tag` 分開記錄
+    """
+    db_path = tmp_path.joinpath("registry.db")
+    registry = RegistrationRegistry(db_path, console)
+    
+    assert registry.register(make_reg_df(["C0101", "C0102", "C0103"], [1, 1, 1]), "甲.xlsx") == 3
+    assert registry.register(make_reg_df(["C0101", "C0102"], [1, 1]), "甲.xlsx") == 2
+    assert len(registry) == 2
+    registry.register(make_reg_df(["C0201"], [2]), "甲.xlsx", tag="乙")
+    # 重新開啟仍保留
+    assert len(RegistrationRegistry(db_path, console)) == 3
+    # -------------------------------------------------------------------------/
+
+
+def test_unsupported_version(console, tmp_path):
+    """
+    """
+    db_path = tmp_path.joinpath("registry.db")
+    RegistrationRegistry(db_path, console)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA user_version = 99")
+    
+    with pytest.raises(ValueError, match="版本 \\(99\\) 不支援"):
+        RegistrationRegistry(db_path, console)
+    # -------------------------------------------------------------------------/
+
+
+def test_check_and_register_backfill(workbooks, console, tmp_path):
+    """
+    回填後記錄 '登錄號'; 同一個 '編目箱單' 再回填一次沒有 '已登錄',
+    另一個 '編目箱單' 有相同的 '登錄號' 時全部為 '已登錄' 並存成報告
+    """
+    registry = RegistrationRegistry(tmp_path.joinpath("registry.db"), console)
+    catalog_wb = workbooks[1]
+    other_wb = tmp_path.joinpath("編目箱單_複本.xlsx")
+    shutil.copy(catalog_wb, other_wb)
+    catalog_df = load_catalog(catalog_wb, console)
+    
+    issue_df = check_registry(catalog_df, registry, catalog_wb, console)
+    assert "已登錄" not in set(issue_df["類型"])
+    new_df, handled_type_cnt, _, _ = run_backfill(load_purchasing(workbooks[0], console),
+                                                  load_catalog(catalog_wb, console), console)
+    new_df = report_backfill(new_df, handled_type_cnt, console)
+    register_backfill(new_df, registry, catalog_wb, console, purchasing_name=workbooks[0].name)
+    n_registered = len(registry)
+    assert n_registered == len(to_registry_frame(new_df, "採購序號"))
+    
+    assert "已登錄" not in set(check_registry(catalog_df, registry, catalog_wb, console)["類型"])
+    register_backfill(new_df, registry, catalog_wb, console)
+    assert len(registry) == n_registered
+    
+    report_path = tmp_path.joinpath("(SR)登錄號檢查.csv")
+    issue_df = check_registry(catalog_df, registry, other_wb, console, report_path=report_path)
+    registered_df = issue_df[issue_df["類型"] == "已登錄"]
+    assert set(registered_df["登錄號"]) == set(to_registry_frame(new_df, "採購序號")["登錄號"])
+    assert len(pd.read_csv(report_path, encoding="utf-8-sig")) == len(issue_df)
+    assert "之前的回填已經使用過的 '登錄號'" in console.file.getvalue()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,97 @@
+import shutil
+
+import openpyxl
+import pandas as pd
+import pytest
+from bench.generate import generate_workbooks
+from modules.routing import RouteIndex, route_catalog, run_routed
+from modules.schema import catalog_colalias, purchasing_wsname
+# -----------------------------------------------------------------------------/
+
+pytest.importorskip("pyarrow")
+
+route_options: dict = {
+    "engine": "bulk", "validate": True, "log_mode": "rich", "writer": "stream",
+    "suggest": False, "backend": "openpyxl", "compact": False, "columnar": [],
+}
+
+
+def test_route_catalog_methods():
+    """
+    每一種分配方式 (見 `route_methods`), ISBN 忽略 "-" 與空白, '書目' 只比對 "/" 之前
+    """
+    route_keys = pd.DataFrame({
+        "wb": ["A", "B", "A", "B", "A", "B", "B", "A", "B"],
+        "purc_sn": pd.array([1, 1, 2, 2, 3, 3, 4, 5, 5], dtype="Int64"),
+        "isbn": pd.array(["111", "112", "211", "212", "311", "312", "411", "511", "512"],
+                         dtype="string"),
+        "title": pd.array(["一", "一", "二A", "二B", "三", "參", "四", "五", "五"], dtype="string"),
+    })
+    catalog_df = pd.DataFrame({
+        catalog_colalias["採購序號"]: [1, 2, 3, 3, 4, 5, 6],
+        catalog_colalias["ISBN"]: ["1-1 1", "999", "311", "399", "999", "999", "611"],
+        catalog_colalias["書名"]: ["一", "二B / 作者", "三", "三 第2冊", "無", "無", "六"],
+    })
+    
+    route_df = route_catalog(catalog_df, route_keys)
+    
+    assert route_df["分配方式"].tolist() == ["ISBN", "書名", "ISBN", "同序號", "採購序號",
+                                             "多個交貨清單", "找不到"]
+    assert route_df["交貨清單"][:5].tolist() == ["A", "B", "A", "A", "B"]
+    assert route_df["交貨清單"][5:].isna().all()
+    # -------------------------------------------------------------------------/
+
+
+def test_route_index_updates_only_changed_workbooks(console, tmp_path):
+    """
+    只重新讀取新增或修改過的 '交貨清單', 已刪除的移出索引
+    """
+    purchasing_dir = tmp_path.joinpath("purchasing")
+    purchasing_dir.mkdir()
+    wbs = []
+    for seed in [1, 2]:
+        purc_path, _ = generate_workbooks(10, tmp_path.joinpath(f"gen{seed}"), seed=seed)
+        wbs.append(purchasing_dir.joinpath(f"交貨清單{seed}.xlsx"))
+        shutil.copy(purc_path, wbs[-1])
+    index_dir = tmp_path.joinpath(".route")
+    
+    assert RouteIndex(index_dir, console).update(wbs) == wbs
+    route_index = RouteIndex(index_dir, console)
+    assert route_index.update(wbs) == []
+    assert sum(len(keys) for keys in route_index.keys.values()) == 20
+    
+    wb = openpyxl.load_workbook(wbs[1])
+    wb[purchasing_wsname]["A10"] = "修改"
+    wb.save(wbs[1])
+    assert RouteIndex(index_dir, console).update(wbs) == [wbs[1]]
+    
+    route_index = RouteIndex(index_dir, console)
+    assert route_index.update(wbs[:1]) == []
+    assert list(route_index.manifest) == [str(wbs[0].resolve())]
+    assert len(list(index_dir.glob("*.arrow"))) == 1
+    # -------------------------------------------------------------------------/
+
+
+def test_run_routed(workbooks, console, tmp_path):
+    """
+    '編目箱單' 依 ISBN 分配到正確的 '交貨清單', 每個 '交貨清單' 各自輸出
+    """
+    purchasing_dir = tmp_path.joinpath("purchasing")
+    new_wb_dir = tmp_path.joinpath("out")
+    purchasing_dir.mkdir()
+    new_wb_dir.mkdir()
+    # 相同的 '採購序號', 不同的書
+    other_wb, _ = generate_workbooks(60, tmp_path.joinpath("other"), seed=1)
+    wbs = [purchasing_dir.joinpath("甲.xlsx"), purchasing_dir.joinpath("乙.xlsx")]
+    shutil.copy(other_wb, wbs[0])
+    shutil.copy(workbooks[0], wbs[1])
+    route_index = RouteIndex(tmp_path.joinpath(".route"), console)
+    route_index.update(wbs)
+    
+    results = run_routed(workbooks[1], route_index, new_wb_dir, console, route_options)
+    
+    assert [(r["purchasing"].name, r["status"]) for r in results] == [("乙.xlsx", "OK")]
+    assert results[0]["catalog_left"] == 0
+    assert new_wb_dir.joinpath("(SR)回填測試_乙.xlsx").exists()
+    assert not new_wb_dir.joinpath("(SR)回填測試_甲.xlsx").exists()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,73 @@
+import copy
+import io
+import re
+
+import pytest
+from modules.pipeline import load_catalog, load_purchasing
+from modules.schema import (ColumnPlan, catalog_colalias, cata_rp2_purc,
+                            check_schema, schema, schema_path)
+from rich.console import Console
+# -----------------------------------------------------------------------------/
+
+
+@pytest.fixture(scope="module")
+def columns(workbooks):
+    """
+    實際讀取的 ('交貨清單' columns, '編目箱單' columns)
+    """
+    console = Console(file=io.StringIO())
+    
+    return (load_purchasing(workbooks[0], console).columns,
+            load_catalog(workbooks[1], console).columns)
+    # -------------------------------------------------------------------------/
+
+
+def test_column_plan_pairs(columns):
+    """
+    依 `cata_rp2_purc` 的順序, 兩邊都有同名欄位時直接對應, 否則使用 colalias
+    """
+    column_plan = ColumnPlan(*columns)
+    
+    assert list(column_plan.pairs) == list(cata_rp2_purc)
+    assert column_plan.pairs["箱號"] == ("箱號", "箱號")
+    assert column_plan.pairs["ISBN"] == ("ISBN", catalog_colalias["ISBN"])
+    assert column_plan.pairs["部冊號"] == ("書名", "部冊號")
+    # -------------------------------------------------------------------------/
+
+
+def test_column_plan_lists_missing_columns(columns):
+    """
+    缺少或拼錯的欄位 (兩個檔案) 一次列出, colalias 的欄位附上共同名稱
+    """
+    purc_columns = columns[0].drop(["小計", "冊數"])
+    cata_columns = columns[1].str.replace("書目", "書 目")
+    
+    with pytest.raises(ValueError) as exc_info:
+        ColumnPlan(purc_columns, cata_columns)
+    
+    msg = str(exc_info.value)
+    assert "請檢查標題列或 schema.toml" in msg
+    assert re.search(r"'交貨清單' 缺少欄位 : .*'小計'", msg)
+    assert re.search(r"'交貨清單' 缺少欄位 : .*'冊數'", msg)
+    assert "'編目箱單' 缺少欄位 : '書目' (書名)" in msg
+    # -------------------------------------------------------------------------/
+
+
+@pytest.mark.parametrize("section, value, expected", [
+    ("purchasing", ["箱號", "小記"], "[purchasing.required_colnames] 不在 colnames 中 : ['小記']"),
+    ("catalog", None, "[catalog] 缺少 : ['required_colnames']"),
+])
+def test_check_schema_required_colnames(section, value, expected):
+    """
+    `required_colnames` 必須設定, 且都在 `colnames` 之中
+    """
+    bad_schema = copy.deepcopy(schema)
+    if value is None:
+        del bad_schema[section]["required_colnames"]
+    else:
+        bad_schema[section]["required_colnames"] = value
+    
+    with pytest.raises(ValueError, match=re.escape(expected)):
+        check_schema(bad_schema, schema_path)
+    check_schema(schema, schema_path)
+    # -------------------------------------------------------------------------/
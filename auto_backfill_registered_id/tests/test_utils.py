@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from modules.utils import PurcSnIndex, RowBuffer, copy_as_index
+# -----------------------------------------------------------------------------/
+
+
+def make_indexed_df():
+    """
+    '採購序號' 有重複與 NA 的 DataFrame (已經 `copy_as_index`)
+    """
+    df = pd.DataFrame({
+        "採購序號": pd.array([1, 2, 2, pd.NA, 3], dtype="Int64"),
+        "書名": ["A", "B", "B2", "X", "C"],
+    })
+    copy_as_index(df, "採購序號", "purc_sn")
+    
+    return df
+    # -------------------------------------------------------------------------/
+
+
+def test_purc_sn_index_lookup():
+    """
+    依 '採購序號' 取出所有符合的列 (與 boolean mask 的結果相同), NA 不會被找到
+    """
+    df = make_indexed_df()
+    index = PurcSnIndex(df)
+    
+    pd.testing.assert_frame_equal(index.lookup(2), df[df.index == 2])
+    assert index.lookup_values(2)[:, 1].tolist() == ["B", "B2"]
+    assert index.lookup_column(2, "書名").tolist() == ["B", "B2"]
+    assert len(index.lookup(99)) == 0
+    assert len(index.lookup(pd.NA)) == 0
+    assert len(index) == len(df)
+    # -------------------------------------------------------------------------/
+
+
+def test_purc_sn_index_consume():
+    """
+    `consume` 之後找不到該 '採購序號', `leftover` 為還沒處理的列 (原本的 DataFrame 不變)
+    """
+    df = make_indexed_df()
+    index = PurcSnIndex(df)
+    
+    index.consume(2)
+    index.consume(3)
+    
+    assert len(index.lookup(2)) == 0
+    assert len(index) == 2
+    assert index.leftover()["書名"].tolist() == ["A", "X"]
+    assert len(df) == 5
+    # 重複 consume 不會改變數量
+    index.consume(2)
+    assert len(index) == 2
+    assert np.array_equal(index.get_positions(1), [0])
+    # -------------------------------------------------------------------------/
+
+
+def test_row_buffer_to_frame():
+    """
+    `to_frame` 依 template 的 column 順序與 dtype 建立 DataFrame,
+    `keep_pos` 以外的位置為 NA, 無法轉回原本 dtype 的 column 改用推斷的 dtype
+    """
+    template = pd.DataFrame({
+        "採購序號": pd.array([], dtype="Int64"),
+        "登錄號": pd.Series([], dtype="float64"),
+        "小計": pd.array([], dtype="Float64"),
+    })
+    buffer = RowBuffer(template)
+    
+    buffer.append_values([1, "套書", 10.5])
+    buffer.append_values([1, "C001", 10.5], keep_pos=buffer.get_colpos(["採購序號", "登錄號"]))
+    df = buffer.to_frame()
+    
+    assert len(buffer) == 2
+    assert list(df.columns) == list(template.columns)
+    assert df["採購序號"].dtype == "Int64"
+    assert df["小計"].dtype == "Float64"
+    assert df["登錄號"].tolist() == ["套書", "C001"]
+    assert df["小計"].isna().tolist() == [False, True]
+    # 沒有任何列時仍然是 template 的 dtype
+    pd.testing.assert_frame_equal(RowBuffer(template).to_frame(), template)
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,44 @@
+import pytest
+from modules.pipeline import load_catalog, load_purchasing, validate_backfill
+from modules.utils import handled_errors
+# -----------------------------------------------------------------------------/
+
+
+def test_validate_passes_clean_input(workbooks, console, tmp_path):
+    """
+    沒有錯誤時不會 raise, 報告顯示驗證完成
+    """
+    report_path = tmp_path.joinpath("(SR)驗證報告.log")
+    
+    validate_backfill(load_purchasing(workbooks[0], console), load_catalog(workbooks[1], console),
+                      console, report_path=report_path)
+    
+    assert "驗證完成, 沒有發現錯誤" in report_path.read_text(encoding="utf-8")
+    # -------------------------------------------------------------------------/
+
+
+def test_validate_reports_every_error(workbooks, console, tmp_path):
+    """
+    E1 (重複的 '採購序號'), E2 (總冊數 ≠ 冊數), E3 (冊數 / 數量異常) 一次全部列出後才 raise
+    """
+    purchasing_df = load_purchasing(workbooks[0], console)
+    catalog_df = load_catalog(workbooks[1], console)
+    n_cata = catalog_df["原序號"].value_counts()
+    normal = [sn for sn, kind in zip(purchasing_df["採購序號"], purchasing_df["套書/複本"])
+              if (n_cata.get(sn, 0) == 1) and (kind != "套書")][:3]
+    bookset = [sn for sn, kind in zip(purchasing_df["採購序號"], purchasing_df["套書/複本"])
+               if (n_cata.get(sn, 0) > 1) and (kind == "套書")][0]
+    
+    purchasing_df.loc[purchasing_df["採購序號"] == normal[0], "總冊數"] = 3  # E2
+    purchasing_df.loc[purchasing_df["採購序號"] == normal[2], "採購序號"] = normal[1]  # E1
+    purchasing_df.loc[purchasing_df["採購序號"] == bookset, ["冊數", "數量"]] = 1  # E3
+    report_path = tmp_path.joinpath("(SR)驗證報告.log")
+    
+    with pytest.raises(ValueError, match="3 個 '採購序號' 有錯誤"):
+        validate_backfill(purchasing_df, catalog_df, console, report_path=report_path)
+    
+    report = report_path.read_text(encoding="utf-8")
+    for msg in handled_errors.values():
+        assert f"{msg} : 1" in report
+    assert "'編目箱單' 找不到對應的 '採購序號' : 1" in report
+    # -------------------------------------------------------------------------/
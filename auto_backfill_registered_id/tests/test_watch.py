@@ -0,0 +1,111 @@
+import os
+import shutil
+
+from modules.watch import CatalogWatcher
+# -----------------------------------------------------------------------------/
+
+watch_options: dict = {
+    "engine": "bulk", "validate": True, "log_mode": "rich", "writer": "stream",
+    "suggest": False, "backend": "openpyxl", "compact": False, "columnar": [],
+}
+
+
+def make_watcher(workbooks, console, tmp_path, **kwargs):
+    """
+    回傳 (watcher, '編目箱單' 資料夾), '交貨清單' 複製到 `tmp_path` (測試中會修改)
+    """
+    catalog_dir = tmp_path.joinpath("catalog")
+    new_wb_dir = tmp_path.joinpath("out")
+    catalog_dir.mkdir(exist_ok=True)
+    new_wb_dir.mkdir(exist_ok=True)
+    purchasing_wb = tmp_path.joinpath("交貨清單.xlsx")
+    if not purchasing_wb.exists():
+        shutil.copy(workbooks[0], purchasing_wb)
+    
+    watcher = CatalogWatcher(purchasing_wb, catalog_dir, new_wb_dir, console,
+                             watch_options, poll_interval=0.01, **kwargs)
+    
+    return watcher, catalog_dir
+    # -------------------------------------------------------------------------/
+
+
+def drain(watcher: CatalogWatcher):
+    """
+    取出佇列中的檔案 (不回填)
+    """
+    names = []
+    while not watcher.jobs.empty():
+        names.append(watcher.jobs.get_nowait()[0].name)
+        watcher.jobs.task_done()
+    
+    return names
+    # -------------------------------------------------------------------------/
+
+
+def test_poll_waits_until_file_is_stable(workbooks, console, tmp_path):
+    """
+    連續兩次檢查都沒有變化才加入佇列, 處理過的檔案不會重複加入, 修改後重新加入
+    """
+    watcher, catalog_dir = make_watcher(workbooks, console, tmp_path)
+    watcher.load_purchasing()
+    catalog_wb = catalog_dir.joinpath("a.xlsx")
+    shutil.copy(workbooks[1], catalog_wb)
+    
+    assert watcher.poll() == 0
+    assert watcher.poll() == 1
+    assert watcher.poll() == 0
+    assert drain(watcher) == ["a.xlsx"]
+    
+    # 修改 (還在寫入) -> 下一次檢查才加入
+    with open(catalog_wb, "ab") as f:
+        f.write(b"\0")
+    assert watcher.poll() == 0
+    assert watcher.poll() == 1
+    # -------------------------------------------------------------------------/
+
+
+def test_poll_respects_queue_size(workbooks, console, tmp_path):
+    """
+    佇列滿的時候, 其他檔案留到下一次檢查再加入
+    """
+    watcher, catalog_dir = make_watcher(workbooks, console, tmp_path, queue_size=1)
+    watcher.load_purchasing()
+    for name in ["a.xlsx", "b.xlsx"]:
+        shutil.copy(workbooks[1], catalog_dir.joinpath(name))
+    
+    watcher.poll()
+    assert watcher.poll() == 1
+    assert watcher.poll() == 0
+    assert drain(watcher) == ["a.xlsx"]
+    assert watcher.poll() == 1
+    assert drain(watcher) == ["b.xlsx"]
+    # -------------------------------------------------------------------------/
+
+
+def test_run_backfills_and_skips_up_to_date(workbooks, console, tmp_path):
+    """
+    `run()` 回填新的 '編目箱單'; 重新啟動時, '(SR)回填' 比較新的檔案不會重新處理,
+    '交貨清單' 修改後全部重新處理
+    """
+    watcher, catalog_dir = make_watcher(workbooks, console, tmp_path)
+    shutil.copy(workbooks[1], catalog_dir.joinpath("a.xlsx"))
+    
+    watcher.run(max_polls=2)
+    
+    new_wb = tmp_path.joinpath("out", "(SR)回填a.xlsx")
+    assert new_wb.exists()
+    assert "'a.xlsx'" in console.file.getvalue()
+    
+    # 重新啟動
+    watcher, _ = make_watcher(workbooks, console, tmp_path)
+    watcher.load_purchasing()
+    watcher.poll()
+    assert watcher.poll() == 0
+    
+    # '交貨清單' 修改 (mtime 比 '(SR)回填' 新) -> 連續兩次相同後重新讀取
+    new_mtime = new_wb.stat().st_mtime_ns + 10**9
+    os.utime(watcher.purchasing_wb, ns=(new_mtime, new_mtime))
+    watcher.poll()
+    assert watcher.poll() == 1
+    assert "'交貨清單' 已修改, 重新讀取" in console.file.getvalue()
+    # -------------------------------------------------------------------------/
@@ -0,0 +1,55 @@
+import openpyxl
+import pytest
+from modules.pipeline import (export_backfill, load_catalog, load_purchasing,
+                              report_backfill, run_backfill)
+from modules.writer import to_number_format
+# -----------------------------------------------------------------------------/
+
+
+def test_to_number_format():
+    """
+    """
+    assert to_number_format("04") == "0000"
+    assert to_number_format("0") == "0"
+    with pytest.raises(ValueError):
+        to_number_format(".2f")
+    # -------------------------------------------------------------------------/
+
+
+def test_stream_writer_matches_pandas(workbooks, console, tmp_path):
+    """
+    writer="stream" 與 "pandas" 輸出的數值相同, 差別只有數字保留為數字:
+    - '採購序號' 以儲存格格式補零
+    - 合計列的 '小計' (Decimal) 不會像 `to_excel` 一樣轉成文字
+    """
+    new_df, handled_type_cnt, purchasing_left, _ = \
+            run_backfill(load_purchasing(workbooks[0], console),
+                         load_catalog(workbooks[1], console), console)
+    new_df = report_backfill(new_df, handled_type_cnt, console)
+    
+    sheets = {}
+    for writer in ["stream", "pandas"]:
+        new_wb = tmp_path.joinpath(f"{writer}.xlsx")
+        export_backfill(new_df, purchasing_left, new_wb, writer=writer)
+        sheets[writer] = openpyxl.load_workbook(new_wb)["交貨清單"]
+    
+    stream_ws, pandas_ws = sheets["stream"], sheets["pandas"]
+    assert stream_ws.max_row == pandas_ws.max_row == 1 + len(new_df) + 5 + len(purchasing_left)
+    assert stream_ws.max_column == pandas_ws.max_column
+    
+    header = [c.value for c in stream_ws[1]]
+    sn_col, ntd_col = header.index("採購序號"), header.index("小計")
+    total_row = 1 + len(new_df)
+    for stream_row, pandas_row in zip(stream_ws.iter_rows(), pandas_ws.iter_rows()):
+        for i, (stream_cell, pandas_cell) in enumerate(zip(stream_row, pandas_row)):
+            if (i == sn_col) and (stream_cell.row > 1) and (stream_cell.value is not None):
+                assert isinstance(stream_cell.value, int)
+                assert stream_cell.number_format == "0000"
+                assert f"{stream_cell.value:04}" == pandas_cell.value
+            elif (i == ntd_col) and (stream_cell.row == total_row):
+                assert stream_cell.value == int(pandas_cell.value) == new_df["小計"].iloc[-1]
+            else:
+                assert stream_cell.value == pandas_cell.value
+    # 標題列格式與 `to_excel` 相同
+    assert stream_ws.cell(row=1, column=1).font.b
+    # -------------------------------------------------------------------------/